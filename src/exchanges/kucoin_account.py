@@ -0,0 +1,260 @@
+# kucoin_account.py
+# In-memory account state for order sizing: balances fed by the private /account/balance websocket channel and last
+# prices fed by the public /market/ticker stream, so sizing an order is a memory read instead of REST round trips.
+#
+# While the private balance stream is connected (on_balance_stream) every change of a balance is pushed, so a cached
+# balance never expires; otherwise, and for prices, a value older than its TTL (or never streamed) is fetched over
+# REST and cached, so a quiet or disconnected stream only costs one REST call per TTL. The *_async reads fetch with
+# the REST client's aiohttp session; the blocking reads, called on an event loop with a stale value cached, return it
+# and refresh it in the background instead of blocking the loop. A REST response never overwrites a balance streamed
+# after its request was sent, and a streamed balance older than the one held is ignored. Funds committed to an order are reserved from the moment it
+# is sized until the balance the cache holds reflects it: the balance update the exchange pushes for the order
+# (matched by orderId), a REST refresh started after the order was acknowledged, or the order failing. Until then the
+# reservation is subtracted from the available balance, so back to back orders never size off the same funds. The
+# balance update can beat the REST response that acknowledges the order, so the last orderIds seen on the balance
+# channel are remembered and acknowledging one of them releases the reservation at once.
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class Reservation:
+    """Funds of one currency held for an order being placed; order_id is set once the exchange acknowledges it."""
+
+    __slots__ = ('key', 'currency', 'amount', 'created', 'acknowledged', 'order_id')
+
+    def __init__(self, key, currency, amount, created):
+        self.key = key
+        self.currency = currency
+        self.amount = amount
+        self.created = created
+        self.acknowledged = None
+        self.order_id = None
+
+
+class AccountState:
+    """
+    Balances ({currency: available}) and last prices ({symbol: price}) of one account type, with reservations for
+    in-flight orders. on_balance() and on_ticker() take the websocket message data; available() and price() read,
+    going to rest_client when the cached value is missing or older than balance_ttl / ticker_ttl seconds (balances
+    do not expire while on_balance_stream() has reported the stream connected). Reservations not released after
+    reservation_ttl seconds are dropped as lost.
+    """
+
+    def __init__(self, rest_client, account_type='trade', balance_ttl=30.0, ticker_ttl=5.0, reservation_ttl=30.0,
+                 clock=time.monotonic):
+        self.rest_client = rest_client
+        self.account_type = account_type
+        self.balance_ttl = balance_ttl
+        self.ticker_ttl = ticker_ttl
+        self.reservation_ttl = reservation_ttl
+        self.clock = clock
+        self.balances = {}                  # currency -> (available, updated)
+        self.balance_times = {}             # currency -> exchange time (ms) of the latest streamed balance
+        self.balance_stream = False         # whether the private balance stream is connected
+        self.prices = {}                    # symbol -> (price, updated)
+        self.reservations = {}              # key -> Reservation
+        self.balance_orders = OrderedDict()  # orderIds of the latest balance updates, oldest first
+        self.rest_refreshes = 0
+        self._keys = itertools.count()
+        self._lock = threading.Lock()
+        self._refreshing = {}               # ('balance' or 'price', currency or symbol) -> background refresh task
+
+    # ---- stream side ----------------------------------------------------------------------------------------------
+
+    def on_balance_stream(self, connected):
+        """
+        The private balance stream (dis)connected. Balances cached before it connected may have missed changes, so
+        they are dropped and fetched again on their next read.
+        """
+        with self._lock:
+            if connected and not self.balance_stream:
+                self.balances.clear()
+            self.balance_stream = connected
+
+    def on_balance(self, data):
+        """An /account/balance message's data: the currency's new available balance, maybe caused by an order."""
+        if data.get('accountType', self.account_type) != self.account_type:
+            return
+        order_id = (data.get('relationContext') or {}).get('orderId')
+        currency = data['currency']
+        with self._lock:
+            if 'time' in data:
+                when = int(data['time'])
+                if when < self.balance_times.get(currency, when):
+                    return                              # pushed out of order: a later balance is already held
+                self.balance_times[currency] = when
+            self.balances[currency] = (float(data['available']), self.clock())
+            if order_id is not None:
+                self.balance_orders[order_id] = None
+                if len(self.balance_orders) > 1000:
+                    self.balance_orders.popitem(last=False)
+                for key, reservation in list(self.reservations.items()):
+                    if reservation.order_id == order_id:
+                        del self.reservations[key]
+
+    def on_ticker(self, symbol, data):
+        """A /market/ticker message's data for symbol."""
+        self.prices[symbol] = (float(data['price']), self.clock())
+
+    # ---- reads --------------------------------------------------------------------------------------------------
+
+    def _refresh_balance(self, currency):
+        started = self.clock()
+        return self._store_balance(currency, self.rest_client.get_accounts(currency, self.account_type), started)
+
+    async def _refresh_balance_async(self, currency):
+        started = self.clock()
+        return self._store_balance(currency, await self.rest_client.get_accounts_async(currency, self.account_type),
+                                   started)
+
+    def _store_balance(self, currency, accounts, started):
+        # accounts is the REST response to a request sent at started
+        available = sum(float(account['available']) for account in accounts)
+        with self._lock:
+            self.rest_refreshes += 1
+            cached = self.balances.get(currency)
+            if cached is not None and cached[1] > started:
+                available = cached[0]                   # streamed while the request was out: newer than the response
+            else:
+                self.balances[currency] = (available, started)
+            # the REST balance already holds the funds of every order acknowledged before it was requested
+            for key, reservation in list(self.reservations.items()):
+                if reservation.currency == currency and reservation.acknowledged is not None \
+                        and reservation.acknowledged <= started:
+                    del self.reservations[key]
+        return available
+
+    def _balance_fresh(self, cached):
+        return cached is not None and (self.balance_stream or self.clock() - cached[1] <= self.balance_ttl)
+
+    def balance(self, currency):
+        """
+        The currency's available balance as the exchange last reported it, refreshed over REST when stale. On an
+        event loop a stale balance is returned as is and refreshed in the background; only a missing one blocks.
+        """
+        cached = self.balances.get(currency)
+        if self._balance_fresh(cached):
+            return cached[0]
+        if cached is not None and self._refresh_later(('balance', currency), self._refresh_balance_async(currency)):
+            return cached[0]
+        return self._refresh_balance(currency)
+
+    async def balance_async(self, currency):
+        """balance() without blocking: a stale or missing balance is fetched with the async REST client."""
+        cached = self.balances.get(currency)
+        if self._balance_fresh(cached):
+            return cached[0]
+        return await self._refresh_balance_async(currency)
+
+    def available(self, currency):
+        """The available balance less the funds reserved for in-flight orders."""
+        balance = self.balance(currency)
+        return balance - self.reserved(currency)
+
+    async def available_async(self, currency):
+        balance = await self.balance_async(currency)
+        return balance - self.reserved(currency)
+
+    def reserved(self, currency):
+        with self._lock:
+            return self._reserved(currency)
+
+    def _reserved(self, currency):
+        # with the lock held: drop the expired reservations and total the currency's others
+        now = self.clock()
+        for key, reservation in list(self.reservations.items()):
+            if now - reservation.created > self.reservation_ttl:
+                logger.warning("Dropping reservation of %s %s for order %s after %.0f seconds", reservation.amount,
+                               reservation.currency, reservation.order_id, self.reservation_ttl)
+                del self.reservations[key]
+        return sum(reservation.amount for reservation in self.reservations.values() if reservation.currency == currency)
+
+    def price(self, symbol):
+        """
+        The symbol's last traded price from the ticker stream, or from REST when not streamed recently. On an event
+        loop a stale price is returned as is and refreshed in the background; only a missing one blocks.
+        """
+        cached = self.prices.get(symbol)
+        if cached is not None and self.clock() - cached[1] <= self.ticker_ttl:
+            return cached[0]
+        if cached is not None and self._refresh_later(('price', symbol), self._refresh_price_async(symbol)):
+            return cached[0]
+        price = float(self.rest_client.get_ticker(symbol)['price'])
+        self.prices[symbol] = (price, self.clock())
+        return price
+
+    async def price_async(self, symbol):
+        cached = self.prices.get(symbol)
+        if cached is not None and self.clock() - cached[1] <= self.ticker_ttl:
+            return cached[0]
+        return await self._refresh_price_async(symbol)
+
+    async def _refresh_price_async(self, symbol):
+        started = self.clock()
+        price = float((await self.rest_client.get_ticker_async(symbol))['price'])
+        cached = self.prices.get(symbol)
+        if cached is None or cached[1] <= started:     # not overwriting a price streamed while the request was out
+            self.prices[symbol] = (price, started)
+        return price
+
+    def _refresh_later(self, key, refresh):
+        # run the refresh coroutine as a task of the running event loop, one per key; False when there is no loop
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            refresh.close()
+            return False
+        if key in self._refreshing:
+            refresh.close()
+            return True
+        task = self._refreshing[key] = loop.create_task(refresh)
+        task.add_done_callback(lambda task: self._refreshed(key, task))
+        return True
+
+    def _refreshed(self, key, task):
+        del self._refreshing[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Refreshing the %s of %s failed: %s", key[0], key[1], task.exception())
+
+    # ---- in-flight orders -----------------------------------------------------------------------------------------
+
+    def reserve(self, currency, amount):
+        """Hold amount of currency for an order about to be placed. Returns the Reservation."""
+        with self._lock:
+            reservation = Reservation(next(self._keys), currency, amount, self.clock())
+            self.reservations[reservation.key] = reservation
+        return reservation
+
+    def allocate(self, currency, fraction):
+        """Reserve fraction of the currency's available balance (net of other reservations) in one step."""
+        return self._allocate(currency, fraction, self.balance(currency))
+
+    async def allocate_async(self, currency, fraction):
+        return self._allocate(currency, fraction, await self.balance_async(currency))
+
+    def _allocate(self, currency, fraction, balance):
+        with self._lock:
+            amount = max(balance - self._reserved(currency), 0.0) * fraction
+            reservation = Reservation(next(self._keys), currency, amount, self.clock())
+            self.reservations[reservation.key] = reservation
+        return reservation
+
+    def acknowledge(self, reservation, order_id):
+        """The exchange accepted the order; the reservation lasts until a balance reflecting it arrives."""
+        with self._lock:
+            reservation.order_id = order_id
+            reservation.acknowledged = self.clock()
+            if order_id in self.balance_orders:
+                self.reservations.pop(reservation.key, None)
+
+    def release(self, reservation):
+        """Drop the reservation, e.g. because placing the order failed."""
+        with self._lock:
+            self.reservations.pop(reservation.key, None)
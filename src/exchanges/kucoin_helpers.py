@@ -1,13 +1,44 @@
+import asyncio
 import numpy as np
 import talib
 import logging
 import os
-import pandas as pd
 import data.ms_sql as db
 from config import trading_variables as tv
-from kucoin.client import Market
-from kucoin.client import Trade
-from kucoin.client import Account
+from exchanges.kucoin_account import AccountState
+from exchanges.kucoin_orders import OrderGateway
+from exchanges.kucoin_rest import KucoinCredentials, KucoinRestClient
+from features.bars import CLOSE, HIGH, LOW, VOLUME, BarBuffer, BarStore
+from features.cache import IndicatorCache
+from features.engine import FeatureEngines, classify_market
+
+_rest_client = None
+
+def get_rest_client():
+    # One signed REST client (and connection pool) per process, with credentials from the KUCOIN_API_* variables
+    global _rest_client
+    if _rest_client is None:
+        _rest_client = KucoinRestClient(KucoinCredentials.from_env())
+    return _rest_client
+
+_account_state = None
+
+def get_account_state():
+    # Balances and prices for order sizing, kept current by the websocket streams (see KucoinTrading)
+    global _account_state
+    if _account_state is None:
+        _account_state = AccountState(get_rest_client())
+    return _account_state
+
+_order_gateway = None
+_order_tasks = set()    # placements in flight: the event loop only keeps weak references to tasks
+
+def get_order_gateway():
+    # Async order placement and tracking, sharing the REST client's connections
+    global _order_gateway
+    if _order_gateway is None:
+        _order_gateway = OrderGateway(get_rest_client())
+    return _order_gateway
 
 class KucoinTradingBot:
     def __init__(self):
@@ -24,194 +55,196 @@ class KucoinTradingBot:
         self.risk_reward_multiple = tv['risk_reward_multiple']
         self.stop_loss_percentage = tv['stop_loss_percentage']
         
-        # Instantiate Kucoin clients
-        self.kucoin_orders_client = Trade(self.api_key, self.api_secret, self.api_passphrase)
-        self.kucoin_account_client = Account(self.api_key, self.api_secret, self.api_passphrase)
-        self.kucoin_data_client = Market(self.api_key, self.api_secret, self.api_passphrase)
-        
-    def get_features(feed):
-        # config
-        rsiPeriod = tv.rsi_Period
-        atrPeriod = tv.atr_Period
-        aroonPeriod = tv.aroon_Period
-        bbandsPeriod = tv.bbands_Period
-        bbandsStdDev = tv.bbands_StdDev
-        macdFast = tv.macd_Fast
-        macdSlow = tv.macd_Slow
-        macdSignal = tv.macd_Signal
-        
-        # Calculate the technical indicators
-        ema10 = talib.EMA(feed['close'], timeperiod=10)
-        ema30 = talib.EMA(feed['close'], timeperiod=30)
-        ema50 = talib.EMA(feed['close'], timeperiod=50)
-        ema100 = talib.EMA(feed['close'], timeperiod=100)
-        ema200 = talib.EMA(feed['close'], timeperiod=200)
+        # Shared Kucoin REST client and account state
+        self.rest_client = get_rest_client()
+        self.account = get_account_state()
+
+        # Streaming indicators, one engine per symbol, sharing their values through the indicator cache
+        self.indicator_cache = IndicatorCache()
+        self.feature_engines = FeatureEngines(cache=self.indicator_cache)
+        self._last_rows = {}    # symbol -> (high, low, close, volume) of the last DataFrame row fed to its engine
+
+        # Bounded bar history per symbol, appended to by KucoinTrading's bar aggregator and read by update_features()
+        self.bars = BarStore()
         
-        # Calculate short and long SMA
-        short_sma = talib.SMA(feed['close'], timeperiod=tv.short_sma)
-        long_sma = talib.SMA(feed['close'], timeperiod=tv.long_sma)
-
-        # Calculate VWAP
-        typical_price = (feed['high'] + feed['low'] + feed['close']) / 3
-        vwap = sum(typical_price * feed['volume']) / sum(feed['volume'])
-
-        # Calculate Momentum
-        momentum = feed['close'] - feed['close'].shift(10)  # Here, we use 10 periods momentum. You can adjust this number as needed.
-
-        # Calculate historical volatility
-        returns = feed['close'].pct_change()
-        historical_volatility = returns.rolling(window=10).std() * np.sqrt(252)  # Here we use 10-day historical volatility. Adjust the window as needed.
-
-        # Bollinger bands
-        bb_bands = talib.BollingerBands(feed['close'], period= bbandsPeriod, numStdDev=bbandsStdDev)
-
-        # Bollinger Bands again. Do I need both?
-        # Bollinger Bands
-        upper_band, middle_band, lower_band = talib.BBANDS(feed['close'], timeperiod=20, nbdevup=2, nbdevdn=2, matype=0)
-        # RSI        
-        rsi = talib.RSI(feed['close'], timeperiod=rsiPeriod)
-
-        # ATR
-        atr = talib.ATR(feed['high'], feed['low'], feed['close'], timeperiod=atrPeriod)
-
-        # MACD
-        macd = talib.MACD(feed['close'], fastperiod=macdFast, slowperiod=macdSlow, signalperiod=macdSignal)
-
-        # AARON
-        aroonosc = talib.AROON(feed['high'], feed['low'], timeperiod=aroonPeriod, indicator='aroonosc')
-
-        # Calculate the ATR value
-        # AARON
-        aroonosc = talib.AROON(feed['high'], feed['low'], timeperiod=aroonPeriod, indicator='aroonosc')
-
-        # Check if the EMAs are crossed
-        long_position = ema50[-1] > ema100[-1]
-        short_position = ema50[-1] < ema100[-1]
-
-        # Check for bullish and bearish divergences
-        bullish_divergence = rsi[-1] > 50 and macd[-1] > macd[-2] and rsi[-1] < rsi[-2]
-        bearish_divergence = rsi[-1] < 50 and macd[-1] < macd[-2] and rsi[-1] > rsi[-2]
-
-        # Check if the price is within the Bollinger Bands
-        out_of_band = feed['close'] > bb_bands.getUpperBand()[-1] or feed['close'] < bb_bands.getLowerBand()[-1]
-
-        # Calculate order flow
-        order_flow = feed['volume'].diff()  # The difference in volume from the previous period
-
-        # Check if the price is above or below support and resistance
-        support = feed['1h_low'].min()
-        resistance = feed['1h_high'].max()
-        above_resistance = feed['close'] > resistance
-        below_resistance = feed['close'] < resistance
-        below_support = feed['close'] < support
-
-        # Calculate a signal strength factor based on the MACD and RSI
-        signal_strength = (macd[-1] / macd.getMax()) * 0.5 + (rsi[-1] / rsi.getMax()) * 0.5
-
-        # Determine the stop loss level based on the ATR value
-        if long_position:
-            stop_loss = feed['close'] - (2 * atr)
-        elif short_position:
-            stop_loss = feed['close'] + (2 * atr)
-        else:
-            stop_loss = None
-            
-        # Determine market condition based on indicator values
-        market_condition = get_market_condition(feed)
-
-        # Create a DataFrame with the features
-        features = pd.DataFrame({
-            'symbol': feed['symbol'],
-            'price': feed['close'],
-            'last4prices': feed['close'].rolling(4).mean(),
-            'ema10': ema10,
-            'ema30': ema30,
-            'ema50': ema50,
-            'ema100': ema100,
-            'ema200': ema200,
-            'vwap': vwap,
-            'momentum': momentum,
-            'historical_volatility': historical_volatility,
-            'rsi': rsi,
-            'atr': atr,
-            'macd': macd,
-            'long_position': long_position,
-            'shortPos': short_position,
-            'bullish_divergence': bullish_divergence,
-            'bearish_divergence': bearish_divergence,
-            'upper_band': upper_band,
-            'middle_band': middle_band,
-            'lower_band': lower_band,
-            'out_of_band': out_of_band,
-            'support': support,
-            'resistance': resistance,
-            'above_resistance': above_resistance,
-            'below_resistance': below_resistance,
-            'below_support': below_support,
-            'signal_strength': signal_strength,
-            'stop_loss': stop_loss,
-            'market_condition': market_condition,
-            'order_flow': order_flow,
-            'short_sma': short_sma,
-            'long_sma': long_sma
-        })
-            
-        # Return the features as a numpy array
-        return features.values[-1].reshape(1, -1)
-
-def get_level2Data(level2_feed):
-    bids = level2_feed['bids']
-    asks = level2_feed['asks']
-    total_bid_volume = sum(bid[1] for bid in bids)
-    total_ask_volume = sum(ask[1] for ask in asks)
-    weighted_bid_price = sum(bid[0] * bid[1] for bid in bids) / total_bid_volume
-    weighted_ask_price = sum(ask[0] * ask[1] for ask in asks) / total_ask_volume
-    order_imbalance = level2_feed['total_bid_volume'] - level2_feed['total_ask_volume']
+    def get_features(self, feed):
+        """
+        Features of the latest bar of feed as a dict. feed is a symbol's BarBuffer, or its bar history as a DataFrame
+        with high, low, close, volume (and symbol) columns. The symbol's FeatureEngine has already seen the earlier
+        bars, so only the bars added since the last call are fed to it. A DataFrame must be the growing history, each
+        call's rows starting with the last call's: a fixed-length window that slides raises ValueError (a BarBuffer
+        counts its bars, so it can be one), and a DataFrame shorter than what the engine has seen starts over.
+        """
+        if isinstance(feed, BarBuffer):
+            return self._buffer_features(feed)
+        symbol = feed['symbol'].iloc[-1] if 'symbol' in feed else None
+        engine = self.feature_engines.engine(symbol)
+        if len(feed) < engine.bars:
+            self.feature_engines.reset(symbol)
+            engine = self.feature_engines.engine(symbol)
+        columns = feed[['high', 'low', 'close', 'volume']].values.astype(float)
+        last = self._last_rows.get(symbol)
+        if engine.bars and last is not None and not np.array_equal(columns[engine.bars - 1], last, equal_nan=True):
+            raise ValueError("the bars of %s fed to get_features() do not extend the last call's: pass the growing "
+                             "history or its BarBuffer, not a sliding window" % (symbol,))
+        for high, low, close, volume in columns[engine.bars:]:
+            engine.update(float(high), float(low), float(close), float(volume))
+        if len(columns):
+            self._last_rows[symbol] = columns[-1]
+        return engine.features
+
+    def _buffer_features(self, buffer):
+        # buffer.appended counts every bar, so the bars the engine has not seen are known however long the window
+        engine = self.feature_engines.engine(buffer.symbol)
+        new = buffer.appended - engine.bars
+        if new < 0 or new > len(buffer):        # a cleared buffer, or bars dropped before the engine saw them
+            self.feature_engines.reset(buffer.symbol)
+            engine = self.feature_engines.engine(buffer.symbol)
+            new = len(buffer)
+        window = buffer.window(new)
+        for high, low, close, volume in zip(window[HIGH], window[LOW], window[CLOSE], window[VOLUME]):
+            engine.update(float(high), float(low), float(close), float(volume))
+        return engine.features
+
+    def update_features(self, symbol):
+        """Features after the latest bar of symbol in the bar history, feeding its engine the bars it has not seen."""
+        return self._buffer_features(self.bars[symbol])
+
+    def get_indicator(self, feed, name, *params):
+        """Latest value of an indicator over feed (see features/cache.py for names), computed once per bar."""
+        return get_indicator(feed, name, *params, cache=self.indicator_cache)
+
+    def get_market_condition(self, feed):
+        return get_market_condition(feed, cache=self.indicator_cache)
+
+# Cumulative depth is reported within these distances from the mid price, in basis points
+DEPTH_OFFSETS_BPS = (5, 10, 25, 50, 100)
+
+def _side_array(levels):
+    # [price, size, ...] levels (strings or numbers) as a contiguous (n, 2) float array, best level first
+    if isinstance(levels, np.ndarray) and levels.dtype == np.float64 and levels.ndim == 2:
+        return levels
+    if not len(levels):
+        return np.empty((0, 2))
+    return np.ascontiguousarray(np.array(levels, dtype=float)[:, :2])
+
+def parse_level2(data):
+    # A level2 message or snapshot ({"bids": [[price, size], ...], "asks": ...}) as an array book, parsed once so
+    # get_level2Data() does no string conversion
+    return {'bids': _side_array(data['bids']), 'asks': _side_array(data['asks'])}
+
+_offset_fractions = {}
+
+def _cumulative(sizes):
+    # cumulative[i] is the size of the best i levels
+    cumulative = np.zeros(len(sizes) + 1)
+    np.cumsum(sizes, out=cumulative[1:])
+    return cumulative
+
+def _depth(prices, cumulative, limits, above):
+    # cumulative size of the levels priced at or above (bids) / at or below (asks) each limit; prices are best first
+    if above:
+        return cumulative[len(prices) - np.searchsorted(prices[::-1], limits, side='left')]
+    return cumulative[np.searchsorted(prices, limits, side='right')]
+
+def get_level2Data(level2_feed, offsets_bps=DEPTH_OFFSETS_BPS):
+    # level2_feed is an array book from parse_level2() (or anything with bids / asks levels, best first)
+    bids = _side_array(level2_feed['bids'])
+    asks = _side_array(level2_feed['asks'])
+    bid_prices, bid_sizes = bids[:, 0], bids[:, 1]
+    ask_prices, ask_sizes = asks[:, 0], asks[:, 1]
+    bid_cumulative = _cumulative(bid_sizes)
+    ask_cumulative = _cumulative(ask_sizes)
+
+    # Depth and size weighted prices
+    total_bid_volume = float(bid_cumulative[-1])
+    total_ask_volume = float(ask_cumulative[-1])
+    weighted_bid_price = float(bid_prices @ bid_sizes) / total_bid_volume if total_bid_volume else np.nan
+    weighted_ask_price = float(ask_prices @ ask_sizes) / total_ask_volume if total_ask_volume else np.nan
+    order_imbalance = total_bid_volume - total_ask_volume
+    total_volume = total_bid_volume + total_ask_volume
+
+    # Cumulative depth within each offset from the mid price (the best price of the only side if one is empty)
+    best_bid = float(bid_prices[0]) if len(bids) else np.nan
+    best_ask = float(ask_prices[0]) if len(asks) else np.nan
+    mid_price = (best_bid + best_ask) / 2 if len(bids) and len(asks) else (best_bid if len(bids) else best_ask)
+    fractions = _offset_fractions.get(offsets_bps)
+    if fractions is None:
+        fractions = _offset_fractions[offsets_bps] = np.asarray(offsets_bps, dtype=float) / 10000
+    if len(bids) or len(asks):
+        offsets = mid_price * fractions
+        bid_depth = _depth(bid_prices, bid_cumulative, mid_price - offsets, True)
+        ask_depth = _depth(ask_prices, ask_cumulative, mid_price + offsets, False)
+    else:
+        bid_depth = ask_depth = np.zeros(len(fractions))
+
     return {
         'bids': bids,
         'asks': asks,
         'total_bid_volume': total_bid_volume,
-        
         'total_ask_volume': total_ask_volume,
         'weighted_bid_price': weighted_bid_price,
         'weighted_ask_price': weighted_ask_price,
         'order_imbalance': order_imbalance,
+        'imbalance': order_imbalance / total_volume if total_volume else 0.0,
+        'mid_price': mid_price,
+        'spread': best_ask - best_bid,
+        'depth_offsets_bps': offsets_bps,
+        'bid_depth': bid_depth,
+        'ask_depth': ask_depth,
     }
     
-def get_market_condition(feed):
-    # Calculate the technical indicators
-    ema50 = talib.EMA(feed['close'], timeperiod=50)
-    ema100 = talib.EMA(feed['close'], timeperiod=100)
-    rsi = talib.RSI(feed['close'], timeperiod=14)
-    bb_bands = talib.BollingerBands(feed['close'], period=20, numStdDev=2)
-    atr = talib.ATR(feed['high'], feed['low'], feed['close'], timeperiod=14)
-    volume = feed['volume']
-    
-    # Determine market condition based on indicator values
-    if rsi > 70:
-        market_condition = 'bullish'
-    elif rsi < 30:
-        market_condition = 'bearish'
-    elif ema50[-1] > ema100[-1]:
-        market_condition = 'trending_up'
-    elif ema50[-1] < ema100[-1]:
-        market_condition = 'trending_down'
-    elif feed['close'] > bb_bands.getUpperBand()[-1] or feed['close'] < bb_bands.getLowerBand()[-1]:
-        market_condition = 'range_bound'
-    elif atr > feed['close'] * 0.01:
-        market_condition = 'high_volatility'
-    elif atr < feed['close'] * 0.005:
-        market_condition = 'low_volatility'
-    elif volume < 10000:
-        market_condition = 'low_volume'
-    else:
-        market_condition = 'sideways'
-        
-    return market_condition
+# Latest value of each indicator over a feed with TA-Lib, for bars the FeatureEngine has not published
+def _column(feed, name):
+    return feed[name].values.astype(float)
+
+def _last(*series):
+    return series[0][-1] if len(series) == 1 else tuple(values[-1] for values in series)
+
+def _aroon(high, low, period):
+    aroon_down, aroon_up = talib.AROON(high, low, timeperiod=period)
+    return aroon_up[-1], aroon_down[-1], talib.AROONOSC(high, low, timeperiod=period)[-1]
+
+TALIB_INDICATORS = {
+    'ema': lambda feed, period: _last(talib.EMA(_column(feed, 'close'), timeperiod=period)),
+    'sma': lambda feed, period: _last(talib.SMA(_column(feed, 'close'), timeperiod=period)),
+    'rsi': lambda feed, period: _last(talib.RSI(_column(feed, 'close'), timeperiod=period)),
+    'atr': lambda feed, period: _last(talib.ATR(_column(feed, 'high'), _column(feed, 'low'), _column(feed, 'close'),
+                                                timeperiod=period)),
+    'momentum': lambda feed, period: _last(talib.MOM(_column(feed, 'close'), timeperiod=period)),
+    'volatility': lambda feed, window: feed['close'].pct_change().rolling(window=window).std().iloc[-1] * np.sqrt(252),
+    'vwap': lambda feed: float(((feed['high'] + feed['low'] + feed['close']) / 3 * feed['volume']).sum()
+                               / feed['volume'].sum()),
+    'bbands': lambda feed, period, nbdevup, nbdevdn: _last(*talib.BBANDS(_column(feed, 'close'), timeperiod=period,
+                                                                         nbdevup=nbdevup, nbdevdn=nbdevdn, matype=0)),
+    'macd': lambda feed, fast, slow, signal: _last(*talib.MACD(_column(feed, 'close'), fastperiod=fast,
+                                                               slowperiod=slow, signalperiod=signal)),
+    'aroon': lambda feed, period: _aroon(_column(feed, 'high'), _column(feed, 'low'), period),
+}
+
+def get_indicator(feed, name, *params, cache=None):
+    # The cache (keyed by symbol and bar index) answers when the symbol's FeatureEngine or an earlier caller has
+    # already computed this indicator for the feed's latest bar
+    compute = lambda: TALIB_INDICATORS[name](feed, *params)
+    if cache is None:
+        return compute()
+    symbol = feed['symbol'].iloc[-1] if 'symbol' in feed else None
+    return cache.get(symbol, len(feed) - 1, name, params, compute)
+
+def get_market_condition(feed, cache=None):
+    # Calculate the technical indicators, once per bar when a cache is given
+    ema50 = get_indicator(feed, 'ema', 50, cache=cache)
+    ema100 = get_indicator(feed, 'ema', 100, cache=cache)
+    rsi = get_indicator(feed, 'rsi', 14, cache=cache)
+    upper_band, middle_band, lower_band = get_indicator(feed, 'bbands', 20, 2, 2, cache=cache)
+    atr = get_indicator(feed, 'atr', 14, cache=cache)
+
+    # Determine market condition based on the latest indicator values, as FeatureEngine does on the live path
+    return classify_market(float(feed['close'].iloc[-1]), rsi, ema50, ema100, upper_band, lower_band, atr,
+                           feed['volume'].iloc[-1])
 
 def get_ticker(symbol):
-    ticker = KucoinData.get_ticker(symbol)
-    return float(ticker['price'])
+    return get_account_state().price(symbol)
 
 def calculate_order_price(current_price, order_type):
     if order_type == 'buy':
@@ -223,12 +256,23 @@ def create_buy_order(symbol, price):
     # Fetch current price and determine the buying price
     buying_price = calculate_order_price(price, 'buy')
 
-    # Calculate the quantity to trade based on available balance
-    allocation_amount = calculate_allocation_amount()
-    quantity = allocation_amount / buying_price
-
-    # Create a market buy order
-    buy_order = KucoinOrders.create_market_order(symbol, 'buy', quantity=quantity, price=buying_price)
+    # Calculate the quantity to trade based on available balance, holding the allocation until the order shows in it
+    account = get_account_state()
+
+    # Create a market buy order, without blocking the event loop when called from one
+    if _running_loop() is not None:
+        async def reserve():
+            reservation = await account.allocate_async('USDT', tv['percentage_of_capital_to_trade'])
+            return reservation, reservation.amount / buying_price
+        return _place_order(reserve, symbol, 'buy', 'market', buying_price)
+    reservation = account.allocate('USDT', tv['percentage_of_capital_to_trade'])
+    quantity = reservation.amount / buying_price
+    try:
+        buy_order = get_rest_client().create_market_order(symbol, 'buy', size=quantity)
+    except Exception:
+        account.release(reservation)
+        raise
+    account.acknowledge(reservation, buy_order['orderId'])
 
     # Save the trade to the database
     db.save_trade(symbol, 'buy', quantity, buying_price, buy_order['orderId'])
@@ -239,39 +283,85 @@ def create_sell_order(symbol, price):
     # Fetch current price and determine the selling price
     selling_price = calculate_order_price(price, 'sell')
 
-    # Calculate the quantity to trade based on available balance
-    allocation_amount = calculate_allocation_amount()
-    quantity = allocation_amount / selling_price
-
-    # Create a limit sell order
-    sell_order = KucoinOrders.create_limit_order(symbol, 'sell', price=selling_price, size=quantity)
+    # Calculate the quantity to trade based on available balance, holding the base currency sold until the order
+    # shows in its balance
+    account = get_account_state()
+
+    # Create a limit sell order, without blocking the event loop when called from one
+    if _running_loop() is not None:
+        async def reserve():
+            quantity = await calculate_allocation_amount_async() / selling_price
+            return account.reserve(symbol.split('-')[0], quantity), quantity
+        return _place_order(reserve, symbol, 'sell', 'limit', selling_price, price=selling_price)
+    quantity = calculate_allocation_amount() / selling_price
+    reservation = account.reserve(symbol.split('-')[0], quantity)
+    try:
+        sell_order = get_rest_client().create_limit_order(symbol, 'sell', price=selling_price, size=quantity)
+    except Exception:
+        account.release(reservation)
+        raise
+    account.acknowledge(reservation, sell_order['orderId'])
 
     # Save the trade to the database
     db.save_trade(symbol, 'sell', quantity, selling_price, sell_order['orderId'])
 
     logging.info('Sell order placed: %s', sell_order)
 
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def _place_order(reserve, symbol, side, order_type, trade_price, price=None):
+    # Size the order with reserve(), a coroutine function returning (reservation, quantity) that reads the balance
+    # without blocking, and send it through the gateway as a task; the reservation is settled and the trade saved once
+    # it is acknowledged
+    async def place():
+        account = get_account_state()
+        try:
+            reservation, quantity = await reserve()
+        except Exception as e:
+            logging.error('%s order for %s could not be sized: %s', side.capitalize(), symbol, e)
+            return None
+        try:
+            order = await get_order_gateway().place(symbol, side, order_type, size=quantity, price=price)
+        except Exception as e:
+            account.release(reservation)
+            logging.error('%s order for %s failed: %s', side.capitalize(), symbol, e)
+            return None
+        account.acknowledge(reservation, order.order_id)
+        db.save_trade(symbol, side, quantity, trade_price, order.order_id)
+        logging.info('%s order placed: %s', side.capitalize(), order)
+        return order
+    task = asyncio.ensure_future(place())
+    _order_tasks.add(task)
+    task.add_done_callback(_order_tasks.discard)
+    return task
+
 def get_available_balance():
-    account_info = KucoinAccount.getAccountInfo()
-    return float(account_info['balances']['USDT']['available'])
+    # Available USDT less what in-flight orders hold, from memory unless the streamed balance is stale
+    return get_account_state().available('USDT')
 
 def get_order(order_id):
-    order = KucoinOrders.get_order_info(order_id)
+    order = get_rest_client().get_order(order_id)
     return order
 
-def get_orders(self, order_ids):
-    orders = []
-    for order_id in order_ids:
-        order = self.kucoin_orders_client.get_orders(order_id)
-        orders.append(order)
-    return orders
+async def get_orders(order_ids):
+    # {orderId: order} from the bulk order lists, with single lookups only for the ids they do not hold
+    return await get_order_gateway().get_orders(order_ids)
 
 #Set purchases to be 3% of your available equity
 def calculate_allocation_amount():
     available_balance = get_available_balance()
-    allocation_amount = available_balance * tv.percentage_of_capital_to_trade  
+    allocation_amount = available_balance * tv['percentage_of_capital_to_trade']
     return allocation_amount
 
+async def calculate_allocation_amount_async():
+    # calculate_allocation_amount() for the event loop: a balance missing from memory is fetched without blocking
+    available_balance = await get_account_state().available_async('USDT')
+    return available_balance * tv['percentage_of_capital_to_trade']
+
 def calculate_take_profit_price(current_price, stop_loss_price):
     return current_price + (current_price - stop_loss_price) * tv.risk_reward_multiple
 
@@ -0,0 +1,530 @@
+# kucoin_level2_book.py
+# Fixed-point order book used by the level2 websocket program to maintain Kucoin full depth books.
+#
+# Prices and sizes are converted once, when a snapshot or change is applied, into integers scaled by the instrument's
+# price and size increments (InstrumentSpec). Strings are only produced again when a book is exported.
+
+from array import array
+from bisect import bisect_left
+from math import nan
+
+BID = 1     # matches the bid == 1; ask == 2 convention used throughout kucoin_websockets_level2.py
+ASK = 2
+
+CHECKSUM_MASK = (1 << 64) - 1
+
+DEFAULT_INCREMENT = "0.00000001"    # used when an instrument's increments are unknown: Kucoin quotes up to 8 decimals
+POW10 = [10 ** n for n in range(19)]
+
+
+def increment_decimals(increment):
+    """Number of decimals in an increment string such as "0.0001" (4) or "1" (0)."""
+    whole, dot, frac = increment.partition('.')
+    return len(frac.rstrip('0')) if dot else 0
+
+
+def to_units(text, decimals):
+    """Exact decimal string to integer units of 10^-decimals, e.g. to_units("0.0375", 8) == 3750000."""
+    whole, dot, frac = text.partition('.')
+    if not dot:
+        return int(whole) * POW10[decimals]
+    n = len(frac)
+    if n <= decimals:
+        return int(whole + frac) * POW10[decimals - n]
+    if frac[decimals:].strip('0'):
+        raise ValueError("%r has more than %d decimals" % (text, decimals))
+    return int(whole + frac[:decimals])
+
+
+def format_units(units, decimals):
+    """Inverse of to_units(): integer units back to a decimal string with exactly decimals places."""
+    if not decimals:
+        return str(units)
+    digits = str(abs(units)).rjust(decimals + 1, '0')
+    return ('-' if units < 0 else '') + digits[:-decimals] + '.' + digits[-decimals:]
+
+
+def level_hash(price, size):
+    # ints hash to themselves, so the hash is the same in every process
+    return hash((price, size))
+
+
+class InstrumentSpec:
+    """An instrument's price and size increments and the fixed-point scales derived from them."""
+
+    __slots__ = ('symbol', 'price_increment', 'size_increment', 'price_decimals', 'size_decimals',
+                 'price_scale', 'size_scale')
+
+    def __init__(self, symbol, price_increment=DEFAULT_INCREMENT, size_increment=DEFAULT_INCREMENT):
+        self.symbol = symbol
+        self.price_increment = price_increment
+        self.size_increment = size_increment
+        self.price_decimals = increment_decimals(price_increment)
+        self.size_decimals = increment_decimals(size_increment)
+        self.price_scale = POW10[self.price_decimals]
+        self.size_scale = POW10[self.size_decimals]
+
+    @classmethod
+    def from_symbol(cls, info):
+        """Build from one entry of the GET /api/v2/symbols response."""
+        return cls(info["symbol"], info["priceIncrement"], info["baseIncrement"])
+
+    def price_units(self, text):
+        return to_units(text, self.price_decimals)
+
+    def size_units(self, text):
+        return to_units(text, self.size_decimals)
+
+    def format_price(self, units):
+        return format_units(units, self.price_decimals)
+
+    def format_size(self, units):
+        return format_units(units, self.size_decimals)
+
+
+class BookSide:
+    """
+    One side of an order book as two parallel array('q') columns: sort keys and sizes. The key is the price for bids
+    and the negated price for asks, so both columns are ascending with the best level last; most changes land near
+    the best price, which keeps the memmove behind an insert or delete short. Lookups are a bisect over the keys.
+
+    checksum is an order-independent 64-bit sum of level_hash() over every level, kept up to date on each change,
+    so two sides can be compared in O(1) and only diffed level by level when the checksums differ.
+    """
+
+    def __init__(self, side, levels=()):
+        self.side = side
+        self.sign = 1 if side == BID else -1
+        self.checksum = 0
+        self.analytics = None           # a SideAnalytics once the book is track()ed
+        self._keys = array('q')
+        self._sizes = array('q')
+        if levels:
+            # sort once and build the columns in one go rather than inserting level by level
+            sign = self.sign
+            book = sorted({price * sign: size for price, size in levels}.items())
+            self._keys = array('q', [key for key, size in book])
+            self._sizes = array('q', [size for key, size in book])
+            self.checksum = sum(level_hash(key * sign, size) for key, size in book) & CHECKSUM_MASK
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __eq__(self, other):
+        return (isinstance(other, BookSide) and self.side == other.side and self._keys == other._keys
+                and self._sizes == other._sizes)
+
+    def __iter__(self):
+        # Iterate (price, size) levels best first
+        sign = self.sign
+        return zip((key * sign for key in reversed(self._keys)), reversed(self._sizes))
+
+    def best(self):
+        """Return the best (price, size) level or None when the side is empty."""
+        if not self._keys:
+            return None
+        return self._keys[-1] * self.sign, self._sizes[-1]
+
+    def best_price(self):
+        if not self._keys:
+            return None
+        return self._keys[-1] * self.sign
+
+    def get(self, price):
+        key = price * self.sign
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return self._sizes[i]
+        return None
+
+    def set(self, price, size):
+        """Set the size at a price, returning True when a new level was created."""
+        key = price * self.sign
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            old = self._sizes[i]
+            self._sizes[i] = size
+            self.checksum = (self.checksum - level_hash(price, old) + level_hash(price, size)) & CHECKSUM_MASK
+            if self.analytics is not None:
+                self.analytics.resized(self, i, price, size - old)
+            return False
+        keys.insert(i, key)
+        self._sizes.insert(i, size)
+        self.checksum = (self.checksum + level_hash(price, size)) & CHECKSUM_MASK
+        if self.analytics is not None:
+            self.analytics.inserted(self, i, price, size)
+        return True
+
+    def remove(self, price):
+        key = price * self.sign
+        keys = self._keys
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return False
+        size = self._sizes[i]
+        self.checksum = (self.checksum - level_hash(price, size)) & CHECKSUM_MASK
+        del keys[i]
+        del self._sizes[i]
+        if self.analytics is not None:
+            self.analytics.deleted(self, i, price, size)
+        return True
+
+    def remove_through(self, price):
+        """Remove every level at or better than price, e.g. asks crossed by a new top bid."""
+        keys = self._keys
+        sizes = self._sizes
+        sign = self.sign
+        i = bisect_left(keys, price * sign)
+        if i == len(keys):
+            return
+        checksum = self.checksum
+        for j in range(i, len(keys)):
+            checksum -= level_hash(keys[j] * sign, sizes[j])
+        self.checksum = checksum & CHECKSUM_MASK
+        removed = (keys[i:], sizes[i:]) if self.analytics is not None else None
+        del keys[i:]
+        del sizes[i:]
+        if removed is not None:
+            self.analytics.truncated(self, *removed)
+
+    def diff(self, other, depth=None):
+        """
+        Return the levels that differ from other as (price, this size, other size) tuples, best price first, with
+        None where a side has no level at that price. O(n); only worth calling when the checksums differ. With depth,
+        only the best depth levels of each side are compared.
+        """
+        mine = dict(self.top(depth) if depth else self)
+        theirs = dict(other.top(depth) if depth else other)
+        prices = sorted({price for price, size in set(mine.items()) ^ set(theirs.items())}, reverse=(self.side == BID))
+        return [(price, mine.get(price), theirs.get(price)) for price in prices]
+
+    def top(self, depth):
+        """Return the best depth (price, size) levels, best first."""
+        sign = self.sign
+        keys = self._keys[-depth:]
+        sizes = self._sizes[-depth:]
+        return [(keys[i] * sign, sizes[i]) for i in range(len(keys) - 1, -1, -1)]
+
+    def copy_levels(self):
+        """Return copies of the (keys, sizes) columns: two memcpys, safe to read on another thread."""
+        return self._keys[:], self._sizes[:]
+
+    def levels(self, spec):
+        """Return the side as a list of [price, size] strings, best first (the REST api layout)."""
+        return [[spec.format_price(price), spec.format_size(size)] for price, size in self]
+
+
+class CappedBookSide(BookSide):
+    """
+    A BookSide that only keeps its best levels: depth of them exactly, and up to retain before the worst ones are
+    trimmed. Every price at or better than the worst retained level (the horizon) is exact; changes beyond it are
+    ignored. Levels pulled from the top are replaced from the retained levels behind them, until fewer than depth
+    are left: then the side is stale() and has to be rebuilt from a REST snapshot.
+    """
+
+    def __init__(self, side, depth, retain=None, levels=()):
+        self.depth = depth
+        self.retain = max(retain or 4 * depth, depth)
+        self.horizon = None                             # sort key of the worst retained level, once trimmed
+        super().__init__(side, levels)
+        self.trim()
+
+    def trim(self):
+        """Drop all but the best retain levels, moving the horizon up to the worst level kept."""
+        n = len(self._keys) - self.retain
+        if n <= 0:
+            return
+        keys = self._keys
+        sizes = self._sizes
+        sign = self.sign
+        checksum = self.checksum
+        for j in range(n):
+            checksum -= level_hash(keys[j] * sign, sizes[j])
+        self.checksum = checksum & CHECKSUM_MASK
+        removed = (keys[:n], sizes[:n]) if self.analytics is not None else None
+        del keys[:n]
+        del sizes[:n]
+        self.horizon = keys[0]
+        if removed is not None:
+            self.analytics.truncated(self, *removed)
+
+    def set(self, price, size):
+        if self.horizon is not None and price * self.sign < self.horizon:
+            return False
+        new = super().set(price, size)
+        if new and len(self._keys) > self.retain + self.depth:     # trim in steps of depth, not on every new level
+            self.trim()
+        return new
+
+    def seal(self):
+        """Make the worst level held the horizon: for levels restored from a capped side that may have been trimmed."""
+        if self._keys:
+            self.horizon = self._keys[0]
+
+    def stale(self):
+        return self.horizon is not None and len(self._keys) < self.depth
+
+
+class SideAnalytics:
+    """
+    Aggregates of one BookSide kept up to date by its set() / remove() calls: total size (volume) and size x price
+    (notional) over the whole side, over its best `levels` levels (top_*) and over the levels within `bps` basis
+    points of its best price (band_*). A change costs O(1) on top of the book's own bisect, plus a bisect and the
+    levels crossing the band edge when the best price moves. Values are in the book's fixed-point units. levels must
+    be at least 1, as OrderBook.analytics() divides by the top volume.
+    """
+
+    __slots__ = ('levels', 'bps', 'volume', 'notional', 'top_volume', 'top_notional', 'band_key', 'band_volume',
+                 'band_notional')
+
+    def __init__(self, side, levels=10, bps=25):
+        if levels < 1:
+            raise ValueError("SideAnalytics needs levels >= 1, not %r" % (levels,))
+        self.levels = levels
+        self.bps = bps
+        self.reset(side)
+
+    def reset(self, side):
+        keys = side._keys
+        sizes = side._sizes
+        self.volume = sum(sizes)
+        self.notional = sum(key * size for key, size in zip(keys, sizes)) * side.sign
+        self._top(side)
+        self._band(side)
+
+    def _top(self, side):
+        keys = side._keys[-self.levels:]
+        sizes = side._sizes[-self.levels:]
+        self.top_volume = sum(sizes)
+        self.top_notional = sum(key * size for key, size in zip(keys, sizes)) * side.sign
+
+    def _limit(self, best_key):
+        # sort key of the band edge: keys are ascending towards the best price on both sides
+        return best_key - int(abs(best_key) * self.bps / 10000)
+
+    def _band(self, side):
+        keys = side._keys
+        self.band_volume = self.band_notional = 0
+        self.band_key = None
+        if not keys or not self.bps:
+            return
+        self.band_key = self._limit(keys[-1])
+        i = bisect_left(keys, self.band_key)
+        self.band_volume = sum(side._sizes[i:])
+        self.band_notional = sum(key * size for key, size in zip(keys[i:], side._sizes[i:])) * side.sign
+
+    def _shift(self, side, band_key):
+        # move the band edge after the best price changed, adding or removing the levels that cross it
+        old = self.band_key
+        if band_key == old:
+            return
+        keys = side._keys
+        lo, hi = sorted((old, band_key))
+        lo = bisect_left(keys, lo)
+        hi = bisect_left(keys, hi)
+        volume = sum(side._sizes[lo:hi])
+        notional = sum(key * size for key, size in zip(keys[lo:hi], side._sizes[lo:hi])) * side.sign
+        if band_key > old:
+            volume = -volume
+            notional = -notional
+        self.band_volume += volume
+        self.band_notional += notional
+        self.band_key = band_key
+
+    def resized(self, side, i, price, delta):
+        self.volume += delta
+        self.notional += price * delta
+        if len(side._keys) - 1 - i < self.levels:
+            self.top_volume += delta
+            self.top_notional += price * delta
+        if self.band_key is not None and price * side.sign >= self.band_key:
+            self.band_volume += delta
+            self.band_notional += price * delta
+
+    def inserted(self, side, i, price, size):
+        keys = side._keys
+        n = len(keys)
+        levels = self.levels
+        self.volume += size
+        self.notional += price * size
+        if n - 1 - i < levels:
+            self.top_volume += size
+            self.top_notional += price * size
+            if n > levels:                              # the level pushed out of the top levels
+                j = n - 1 - levels
+                size_out = side._sizes[j]
+                self.top_volume -= size_out
+                self.top_notional -= keys[j] * side.sign * size_out
+        if self.band_key is None:
+            if self.bps:
+                self._band(side)
+            return
+        key = price * side.sign
+        if key >= self.band_key:
+            self.band_volume += size
+            self.band_notional += price * size
+        if i == n - 1:                                  # a new best price
+            self._shift(side, self._limit(key))
+
+    def deleted(self, side, i, price, size):
+        keys = side._keys
+        n = len(keys)
+        levels = self.levels
+        self.volume -= size
+        self.notional -= price * size
+        if n - i < levels:
+            self.top_volume -= size
+            self.top_notional -= price * size
+            if n >= levels:                             # the level moving up into the top levels
+                j = n - levels
+                size_in = side._sizes[j]
+                self.top_volume += size_in
+                self.top_notional += keys[j] * side.sign * size_in
+        if self.band_key is None:
+            return
+        if price * side.sign >= self.band_key:
+            self.band_volume -= size
+            self.band_notional -= price * size
+        if i == n:                                      # the best price was removed
+            if n:
+                self._shift(side, self._limit(keys[-1]))
+            else:
+                self._band(side)
+
+    def truncated(self, side, keys, sizes):
+        """A slice of levels (keys, sizes) was cut from either end of the side."""
+        self.volume -= sum(sizes)
+        self.notional -= sum(key * size for key, size in zip(keys, sizes)) * side.sign
+        self._top(side)
+        self._band(side)
+
+
+class OrderBook:
+    """
+    Order book for one instrument: the last applied sequence number plus a bid and an ask side, in the fixed-point
+    units of spec (the default InstrumentSpec when the instrument's increments are not known). Books are full depth,
+    or with depth > 0 depth-capped: each side keeps its best depth levels exactly and at most retain levels in all
+    (see CappedBookSide).
+    """
+
+    def __init__(self, symbol, sequence=0, bids=(), asks=(), spec=None, depth=0, retain=None):
+        self.symbol = symbol
+        self.spec = spec or InstrumentSpec(symbol)
+        self.sequence = int(sequence)
+        self.depth = depth
+        if depth:
+            self.bids = CappedBookSide(BID, depth, retain, bids)
+            self.asks = CappedBookSide(ASK, depth, retain, asks)
+        else:
+            self.bids = BookSide(BID, bids)
+            self.asks = BookSide(ASK, asks)
+
+    @classmethod
+    def from_snapshot(cls, symbol, data, spec=None, depth=0, retain=None):
+        """Build a book from the "data" member of a GET /api/v3/market/orderbook/level2 response."""
+        spec = spec or InstrumentSpec(symbol)
+        price_units = spec.price_units
+        size_units = spec.size_units
+        return cls(symbol, data["sequence"], [(price_units(price), size_units(size)) for price, size in data["bids"]],
+                   [(price_units(price), size_units(size)) for price, size in data["asks"]], spec, depth, retain)
+
+    def side(self, side):
+        return self.bids if side == BID else self.asks
+
+    def checksum(self):
+        return (self.bids.checksum, self.asks.checksum)
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def track(self, levels=10, bps=25):
+        """Maintain SideAnalytics for both sides from now on, over the best levels and within bps of the best price."""
+        self.bids.analytics = SideAnalytics(self.bids, levels, bps)
+        self.asks.analytics = SideAnalytics(self.asks, levels, bps)
+        return self
+
+    def analytics(self):
+        """
+        Return the book's derived values as floats, read from its SideAnalytics without scanning any levels:
+
+            spread, spread_bps, mid   best ask - best bid, the same in basis points of mid, and their mean
+            microprice                best prices weighted by the opposite best size: leans towards the thinner side
+            weighted_mid              mean of the size-weighted bid and ask prices over the best levels
+            imbalance                 (bid - ask) / (bid + ask) size over the best levels; band_imbalance within bps
+            bid_depth, ask_depth      cumulative size over the best levels; bid_band_depth, ask_band_depth within bps
+            bid_volume, ask_volume    total size of each side (retained levels when capped); bid_vwap, ask_vwap
+                                      their size-weighted prices
+
+        Values that need both sides are nan while a side is empty. Returns None when the book is not tracked.
+        """
+        bids = self.bids.analytics
+        asks = self.asks.analytics
+        if bids is None or asks is None:
+            return None
+        price_scale = self.spec.price_scale
+        size_scale = self.spec.size_scale
+        values = {
+            'bid_depth': bids.top_volume / size_scale,
+            'ask_depth': asks.top_volume / size_scale,
+            'bid_band_depth': bids.band_volume / size_scale,
+            'ask_band_depth': asks.band_volume / size_scale,
+            'bid_volume': bids.volume / size_scale,
+            'ask_volume': asks.volume / size_scale,
+            'bid_vwap': bids.notional / bids.volume / price_scale if bids.volume else nan,
+            'ask_vwap': asks.notional / asks.volume / price_scale if asks.volume else nan,
+        }
+        best_bid = self.bids.best()
+        best_ask = self.asks.best()
+        if best_bid is None or best_ask is None:
+            for name in ('spread', 'spread_bps', 'mid', 'microprice', 'weighted_mid', 'imbalance', 'band_imbalance'):
+                values[name] = nan
+            return values
+        (bid, bid_size), (ask, ask_size) = best_bid, best_ask
+        mid = (bid + ask) / 2
+        values['spread'] = (ask - bid) / price_scale
+        values['spread_bps'] = (ask - bid) / mid * 10000
+        values['mid'] = mid / price_scale
+        values['microprice'] = (bid * ask_size + ask * bid_size) / (bid_size + ask_size) / price_scale
+        values['weighted_mid'] = (bids.top_notional / bids.top_volume + asks.top_notional / asks.top_volume) / 2 / price_scale
+        depth = bids.top_volume + asks.top_volume
+        values['imbalance'] = (bids.top_volume - asks.top_volume) / depth
+        depth = bids.band_volume + asks.band_volume
+        values['band_imbalance'] = (bids.band_volume - asks.band_volume) / depth if depth else nan
+        return values
+
+    def stale(self):
+        """True when a depth-capped side no longer holds depth exact levels and the book needs a fresh snapshot."""
+        if not self.depth:
+            return False
+        return self.bids.stale() or self.asks.stale()
+
+    def update(self, side, price_str, size_str, sequence):
+        """
+        Apply one l2update change record as per the Kucoin api docs at https://docs.kucoin.com/?lang=en_US#market-snapshot.
+        Returns False when the change is older than the book and was skipped.
+        """
+        sequence = int(sequence)
+        if sequence <= self.sequence:
+            return False
+
+        price = self.spec.price_units(price_str)
+        if price:
+            size = self.spec.size_units(size_str)
+            book = self.side(side)
+            if not size:                                        # when there's a price but the size is 0, remove the corresponding price record
+                book.remove(price)
+            elif book.set(price, size) and book.best_price() == price:
+                # Ver.1.2 NOTE: a *new* order at the top of the book has already removed all standing orders at the same or more
+                #               favourable pricing in the alternate book, which Kucoin does not send as separate changes.
+                if side == BID:
+                    self.asks.remove_through(price)
+                else:
+                    self.bids.remove_through(price)
+
+        self.sequence = sequence                                # in all cases, including neither price nor size, update the sequence number
+        return True
@@ -0,0 +1,262 @@
+# kucoin_level2_capture.py
+# Record the level2 feed to a capture file and replay captures through the book engine without network access.
+#
+# A capture is a gzip file of length-prefixed records, appended to by the CaptureRecorder thread:
+#
+#   record header   13 bytes   kind, receive time (ns since the epoch), payload length
+#   payload                    kind b'H': JSON {"instruments": [...]}, written when the file is created
+#                              kind b'F': one raw websocket frame exactly as received
+#                              kind b'S' / b'V': symbol, NUL, REST snapshot response JSON (initial load / verify)
+#                              kind b'P': symbol, NUL, JSON [price increment, size increment]; increments reloaded
+#                                         for the symbol's next b'S' record, installed along with its snapshot
+#                              kind b'R': JSON {symbol: [price increment, size increment]}; a new connection
+#
+# Records are in the order they were put on the feed queue, so a replay applies exactly what the live worker did.
+# gzip members are flushed as each batch is written: a capture cut short by a crash replays up to its last batch.
+#
+# Run from the src directory:
+#   python -m exchanges.kucoin_level2_capture capture.l2cap.gz                 (as fast as possible)
+#   python -m exchanges.kucoin_level2_capture capture.l2cap.gz --speed 1       (at recorded speed; 10 == 10x)
+
+import argparse
+import gzip
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+from exchanges.kucoin_level2_book import InstrumentSpec
+from exchanges.kucoin_level2_client import Level2Client, SnapshotLoad, SNAPSHOT, VERIFY
+
+RECORD = struct.Struct('<cqI')
+
+HEADER = b'H'
+FRAME = b'F'
+SNAPSHOT_RECORD = b'S'
+VERIFY_RECORD = b'V'
+RESET = b'R'
+SPEC = b'P'
+
+SNAPSHOT_KINDS = {SNAPSHOT: SNAPSHOT_RECORD, VERIFY: VERIFY_RECORD}
+RECORD_KINDS = {SNAPSHOT_RECORD: SNAPSHOT, VERIFY_RECORD: VERIFY}
+
+
+class CaptureRecorder(threading.Thread):
+    """
+    Append-only capture writer. frame(), snapshot(), spec() and reset() only timestamp the record and append it to a deque;
+    the thread compresses and writes batches, so recording adds next to nothing to the receive path.
+    """
+
+    def __init__(self, path, instruments, compresslevel=6, flush_interval=1.0):
+        super().__init__(name="CaptureRecorder", daemon=True)
+        self.path = path
+        self.compresslevel = compresslevel
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self._records = deque()
+        self._stopping = threading.Event()
+        if not os.path.exists(path):
+            self._records.append((HEADER, time.time_ns(), json.dumps({"instruments": list(instruments)}).encode()))
+
+    def frame(self, frame):
+        self._records.append((FRAME, time.time_ns(), frame if type(frame) is bytes else frame.encode()))
+
+    def snapshot(self, kind, symbol, response, spec=None):
+        """Record a REST snapshot response; spec is the InstrumentSpec reloaded to install with it, if any."""
+        if spec is not None:
+            self.spec(symbol, spec)
+        payload = symbol.encode() + b'\0' + json.dumps(response, separators=(',', ':')).encode()
+        self._records.append((SNAPSHOT_KINDS[kind], time.time_ns(), payload))
+
+    def spec(self, symbol, spec):
+        payload = symbol.encode() + b'\0' + json.dumps([spec.price_increment, spec.size_increment]).encode()
+        self._records.append((SPEC, time.time_ns(), payload))
+
+    def reset(self, specs=None):
+        increments = {symbol: [spec.price_increment, spec.size_increment] for symbol, spec in (specs or {}).items()}
+        self._records.append((RESET, time.time_ns(), json.dumps(increments).encode()))
+
+    def run(self):
+        records = self._records
+        with gzip.open(self.path, 'ab', compresslevel=self.compresslevel) as f:
+            while True:
+                stopping = self._stopping.wait(self.flush_interval)
+                chunks = []
+                for _ in range(len(records)):
+                    kind, timestamp, payload = records.popleft()
+                    chunks.append(RECORD.pack(kind, timestamp, len(payload)))
+                    chunks.append(payload)
+                if chunks:
+                    f.write(b''.join(chunks))
+                    f.flush()
+                    self.recorded += len(chunks) // 2
+                if stopping:
+                    return
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+def read_capture(path):
+    """Yield (kind, timestamp_ns, payload) records; a truncated tail (e.g. after a crash) ends the capture quietly."""
+    with gzip.open(path, 'rb') as f:
+        try:
+            while True:
+                header = f.read(RECORD.size)
+                if len(header) < RECORD.size:
+                    return
+                kind, timestamp, length = RECORD.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    return
+                yield kind, timestamp, payload
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            return
+
+
+class CaptureReplayer:
+    """
+    Feed a capture through a Level2Client's worker exactly as the live feed would. speed is 0 for as fast as
+    possible, 1 for the recorded pace or any other multiple of it. depth > 0 replays into depth-capped books (a capped
+    replay of a full depth capture cannot fetch the snapshots a resync would need). run() returns the throughput report.
+    """
+
+    def __init__(self, path, speed=0, queue_capacity=250000, batch_size=500, depth=0, retain=None):
+        self.path = path
+        self.speed = speed
+        self.depth = depth
+        self.retain = retain
+        self.queue_capacity = queue_capacity
+        self.batch_size = batch_size
+        self.client = None
+
+    def _instruments(self):
+        for kind, _, payload in read_capture(self.path):
+            if kind == HEADER:
+                return json.loads(payload)["instruments"]
+        raise ValueError("%s has no capture header" % self.path)
+
+    def _drained(self):
+        queue = self.client.queue
+        worker = self.client.worker
+        while worker.applied < queue.received and not worker.stopped():
+            time.sleep(0.001)
+
+    def run(self):
+        client = self.client = Level2Client(self._instruments(), None, None, queue_capacity=self.queue_capacity,
+                                            batch_size=self.batch_size, depth=self.depth, retain=self.retain)
+        client.start_worker()
+        queue = client.queue
+        worker = client.worker
+        frames = snapshots = resets = spec_reloads = 0
+        specs = {}                                      # symbol -> InstrumentSpec reloaded for its next snapshot
+        first_timestamp = None
+        start = time.perf_counter()
+
+        for kind, timestamp, payload in read_capture(self.path):
+            if worker.stopped():
+                break
+            if self.speed:
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                delay = (timestamp - first_timestamp) / 1e9 / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            if kind == FRAME:
+                frames += 1
+                item = (time.perf_counter_ns(), payload)
+            elif kind in RECORD_KINDS:
+                snapshots += 1
+                symbol, body = payload.split(b'\0', 1)
+                symbol = symbol.decode()
+                item = SnapshotLoad(RECORD_KINDS[kind], symbol, json.loads(body)["data"], specs.pop(symbol, None))
+            elif kind == SPEC:
+                spec_reloads += 1
+                symbol, body = payload.split(b'\0', 1)
+                symbol = symbol.decode()
+                specs[symbol] = InstrumentSpec(symbol, *json.loads(body))
+                continue
+            elif kind == RESET:
+                resets += 1
+                self._drained()
+                increments = json.loads(payload) if payload else {}
+                for symbol, instrument in client.instruments.items():
+                    spec = increments.get(symbol)
+                    if spec is not None and spec != [instrument.spec.price_increment, instrument.spec.size_increment]:
+                        instrument.spec = InstrumentSpec(symbol, *spec)
+                        instrument.reset()              # the book's units changed
+                    else:
+                        instrument.reconnect()
+                continue
+            else:
+                continue
+            while not queue.put(item):          # never drop in a replay: wait for the worker to make room
+                time.sleep(0.0005)
+
+        self._drained()
+        elapsed = time.perf_counter() - start
+        worker.stop(5)
+
+        books = {}
+        changes = resyncs = 0
+        for symbol, instrument in client.instruments.items():
+            changes += instrument.changes
+            resyncs += instrument.resyncs
+            book = instrument.book
+            books[symbol] = None if book is None else {
+                'sequence': book.sequence,
+                'bids': len(book.bids),
+                'asks': len(book.asks),
+                'checksum': '%016x%016x' % book.checksum(),
+            }
+        return {
+            'frames': frames,
+            'snapshots': snapshots,
+            'resets': resets,
+            'spec_reloads': spec_reloads,
+            'applied': worker.applied,
+            'changes': changes,
+            'resyncs': resyncs,
+            'seconds': elapsed,
+            'messages_per_second': worker.applied / elapsed if elapsed > 0 else 0.0,
+            'failure': worker.result,
+            'metrics': client.metrics.snapshot(),
+            'books': books,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a level2 capture through the book engine")
+    parser.add_argument("path", help="capture file written by CaptureRecorder")
+    parser.add_argument("-s", "--speed", type=float, default=0, help="0: as fast as possible (default); 1: recorded speed; N: N times faster")
+    parser.add_argument("-b", "--batch_size", type=int, default=500, help="BookWorker batch size")
+    parser.add_argument("-d", "--depth", type=int, default=0, help="0: full depth books (default); N: depth-capped books keeping N exact levels")
+    parser.add_argument("-r", "--retain", type=int, default=None, help="levels retained per side by depth-capped books (default 4 x depth)")
+    args = parser.parse_args()
+
+    report = CaptureReplayer(args.path, args.speed, batch_size=args.batch_size, depth=args.depth, retain=args.retain).run()
+    print("frames: %d   snapshots: %d   resets: %d   spec reloads: %d   applied: %d   changes: %d   resyncs: %d" % (
+        report['frames'], report['snapshots'], report['resets'], report['spec_reloads'], report['applied'],
+        report['changes'], report['resyncs']))
+    print("replayed in %.3f s: %.0f messages/s" % (report['seconds'], report['messages_per_second']))
+    if report['failure']:
+        print("REPLAY STOPPED: book worker failed with result %d" % report['failure'])
+    for symbol, book in report['books'].items():
+        if book is None:
+            print("%-12s  no books loaded" % symbol)
+        else:
+            print("%-12s  sequence %d   %d bids   %d asks   checksum %s" % (
+                symbol, book['sequence'], book['bids'], book['asks'], book['checksum']))
+        apply = report['metrics'][symbol + '.apply']
+        if apply['count']:
+            print("%-12s  apply p50 %.1fus   p99 %.1fus   max %.1fus" % (
+                symbol, apply['p50'] / 1e3, apply['p99'] / 1e3, apply['max'] / 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,558 @@
+# kucoin_level2_client.py
+# asyncio Kucoin level2 client: one websocket connection carrying the full depth feed for any number of instruments.
+#
+# The receive coroutine only enqueues raw frames, each with its receive time. A BookWorker thread parses them, routes each l2update by its symbol
+# to that instrument's Level2Instrument and applies it. REST snapshots (initial load and rotating verification) are
+# fetched off the event loop and handed to the worker through the same queue, so only the worker touches the books.
+#
+# A missing sequence number or a failed verify only resyncs the instrument concerned: its books are dropped, its
+# updates are buffered again and replayed on a fresh REST snapshot while every other instrument keeps streaming.
+# Books also survive reconnects: an instrument only resyncs if its first update on the new connection shows a gap.
+# With a BookJournal the books survive restarts too: they are restored from its checkpoint and journal on start.
+# A frame or REST book that cannot be applied also only resyncs its instrument; when one of its values is finer than
+# the instrument's increments, the increments are fetched again along with the snapshot.
+
+import asyncio
+import functools
+import json
+import logging
+import time
+
+import websockets
+
+from exchanges.kucoin_level2_book import InstrumentSpec, OrderBook
+from exchanges.kucoin_level2_feed import FeedQueue, BookWorker
+from exchanges.kucoin_level2_journal import BOOK
+from exchanges.kucoin_level2_metrics import Level2Metrics
+from exchanges.kucoin_level2_parser import parse_l2update
+from exchanges.kucoin_level2_snapshot import BookSnapshot
+
+logger = logging.getLogger(__name__)
+
+SYMBOLS_PER_SUBSCRIBE = 100     # Kucoin accepts up to 100 symbols in one topic
+SUBSCRIBE_PAUSE = 0.1           # client -> server messages are limited to 100 per 10 seconds
+
+OK = 0
+VERIFY_FAILED = -1
+MISSING_SEQUENCE = -2
+OUT_OF_RANGE = -3
+APPLY_FAILED = -4
+
+REASONS = {VERIFY_FAILED: "verification failure", MISSING_SEQUENCE: "missing sequence number",
+           OUT_OF_RANGE: "depth exhausted", APPLY_FAILED: "update not applicable"}
+
+SNAPSHOT = 'snapshot'
+VERIFY = 'verify'
+SNAPSHOT_FAILED = 'snapshot failed'     # a SnapshotLoad without data: the load failed and will be retried
+
+SNAPSHOT_RETRY_DELAY = 1        # seconds before the first retry of a failed snapshot load, doubling up to
+SNAPSHOT_RETRY_MAX_DELAY = 60
+
+
+class SnapshotLoad:
+    """
+    A REST snapshot handed to the worker through the feed queue; frames are queued as (receive ns, frame) tuples.
+    spec, when given, is the instrument's reloaded InstrumentSpec, to be installed with the snapshot.
+    """
+
+    __slots__ = ('kind', 'symbol', 'data', 'spec')
+
+    def __init__(self, kind, symbol, data, spec=None):
+        self.kind = kind
+        self.symbol = symbol
+        self.data = data
+        self.spec = spec
+
+
+class Level2Instrument:
+    """Per-instrument state: the book once a REST snapshot has been applied, plus the updates buffered until then."""
+
+    def __init__(self, symbol, spec=None):
+        self.symbol = symbol
+        self.spec = spec or InstrumentSpec(symbol)
+        self.book = None
+        self.pending = []
+        self.snapshot_requested = False
+        self.verify_book = None
+        self.reload_spec = False            # a value did not fit the increments: fetch them with the next snapshot
+        self.messages = 0
+        self.changes = 0
+        self.resyncs = 0
+
+    def reset(self):
+        self.book = None
+        self.reconnect()
+
+    def reconnect(self):
+        """Forget what belonged to the previous connection (buffered updates, requested snapshots), keeping the book."""
+        self.pending = []
+        self.snapshot_requested = False
+        self.verify_book = None
+
+
+class Level2Client:
+    """
+    Maintain full depth books for instruments over one public websocket connection.
+
+    get_token() returns a POST /api/v1/bullet-public response and get_snapshot(symbol) a
+    GET /api/v3/market/orderbook/level2 response. Each may be a coroutine function (e.g. Level2SnapshotLoader.snapshot,
+    which fetches concurrently under a rate limiter) or a blocking function, which is run in a worker thread.
+    writer, when given, is a BookSnapshotWriter that receives every book each persist_every applied messages.
+    publisher, when given, is a TopOfBookPublisher that receives each book after every applied message.
+    recorder, when given, is a CaptureRecorder that records every received frame, REST snapshot and reloaded
+    instrument spec for offline replay.
+    metrics is the client's Level2Metrics; it is always on and summarised every stats_interval seconds.
+    specs maps symbols to their InstrumentSpec (price and size increments); books of instruments without one use
+    the default 8 decimal fixed-point units.
+    depth > 0 keeps depth-capped books: the best depth levels of each side exactly and at most retain levels in all,
+    resyncing an instrument whose retained levels run out (see CappedBookSide). 0 keeps full depth books.
+    analytics, when given, is a (levels, bps) pair: every book then maintains OrderBook.analytics() incrementally
+    over its best levels and within bps of its best price, and the publisher shares them with the strategies.
+    journal, when given, is a BookJournal: every applied frame and REST-loaded book is journaled, all books are
+    checkpointed every checkpoint_every applied frames, and run() first restores the books from the journal.
+    get_spec(symbol), when given, returns the symbol's current InstrumentSpec (coroutine or blocking function); it is
+    called before the resync snapshot of an instrument whose feed carried a value finer than its increments. Without
+    it such an instrument falls back to the default 8 decimal units.
+    """
+
+    def __init__(self, instruments, get_token, get_snapshot, writer=None, queue_capacity=250000, batch_size=500,
+                 verify_every=92000, persist_every=4000, stats_interval=30, publisher=None,
+                 recorder=None, specs=None, depth=0, retain=None, analytics=None, journal=None,
+                 checkpoint_every=50000, get_spec=None):
+        specs = specs or {}
+        self.instruments = {symbol: Level2Instrument(symbol, specs.get(symbol)) for symbol in instruments}
+        self.get_token = get_token
+        self.get_snapshot = get_snapshot
+        self.get_spec = get_spec
+        self.writer = writer
+        self.publisher = publisher
+        self.recorder = recorder
+        self.metrics = Level2Metrics(instruments)
+        self.depth = depth
+        self.retain = retain
+        self.analytics = analytics
+        self.journal = journal
+        self.checkpoint_every = checkpoint_every
+        self.journaled = 0
+        self.queue_capacity = queue_capacity
+        self.batch_size = batch_size
+        self.verify_every = verify_every
+        self.persist_every = persist_every
+        self.stats_interval = stats_interval
+        self.connect_id = 0
+        self.queue = None
+        self.worker = None
+        self._loop = None
+        self._failed = None
+        self._snapshot_tasks = set()
+        self._snapshot_failures = {}    # symbol -> consecutive failed snapshot loads
+
+    # ---- event loop side ----------------------------------------------------------------------------------------
+
+    async def run(self):
+        """Connect, subscribe and keep the books up to date; reconnects after any failure."""
+        self._loop = asyncio.get_running_loop()
+        if self.journal is not None and not self.journal.is_alive():
+            self.restore()
+            self.journal.start()
+        while True:
+            try:
+                await self._run_connection()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.error("Level2 connection failed: %s", error)
+            await asyncio.sleep(5)
+
+    async def _run_connection(self):
+        token = await self._call(self.get_token)
+        server = token["data"]["instanceServers"][0]
+        url = "%s?token=%s&connectId=%s" % (server["endpoint"], token["data"]["token"], self._next_id())
+        ping_interval = float(server["pingInterval"]) / 1000
+
+        self._failed = asyncio.Event()
+        self._snapshot_failures.clear()
+        async with websockets.connect(url, max_size=None, ping_interval=None) as ws:
+            if self.recorder is not None:
+                self.recorder.reset(self.specs())
+            self.start_worker()
+            await self._subscribe(ws)
+            tasks = [asyncio.create_task(coro) for coro in (self._receive(ws), self._ping(ws, ping_interval),
+                                                            self._verify(), self._report(), self._failed.wait())]
+            try:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks + list(self._snapshot_tasks):
+                    task.cancel()
+                await self._stop_worker()
+
+    async def _stop_worker(self):
+        # the next connection's worker must not start on the books while this one may still be applying to them
+        self.worker.stop(0)
+        while self.worker.is_alive():
+            await asyncio.to_thread(self.worker.join, 5)
+            if self.worker.is_alive():
+                logger.warning("Level2 BookWorker still running after being stopped: waiting for it to exit")
+
+    def start_worker(self):
+        """
+        Start a BookWorker on a fresh queue (also used by the capture replayer). The books are kept; whatever else
+        belonged to the previous connection is dropped. Refuses to start while the previous worker is still running.
+        """
+        if self.worker is not None and self.worker.is_alive():
+            raise RuntimeError("the previous BookWorker is still running")
+        for instrument in self.instruments.values():
+            instrument.reconnect()
+        self.queue = FeedQueue(self.queue_capacity)
+        self.worker = BookWorker(self.queue, self._apply, before_batch=self._before_batch, on_error=self._worker_failed,
+                                 batch_size=self.batch_size)
+        self.worker.start()
+
+    async def _subscribe(self, ws):
+        symbols = list(self.instruments)
+        for i in range(0, len(symbols), SYMBOLS_PER_SUBSCRIBE):
+            topic = "/market/level2:" + ",".join(symbols[i:i + SYMBOLS_PER_SUBSCRIBE])
+            await ws.send(json.dumps({"id": self._next_id(), "type": "subscribe", "topic": topic, "response": True}))
+            await asyncio.sleep(SUBSCRIBE_PAUSE)
+        logger.info("Subscribed level2 for %d instruments", len(symbols))
+
+    async def _receive(self, ws):
+        put = self.queue.put
+        now = time.perf_counter_ns
+        record = self.recorder.frame if self.recorder is not None else None
+        async for frame in ws:
+            if record is not None:
+                record(frame)
+            if not put((now(), frame)):
+                logger.error("Level2 queue overflow at %d messages: reconnecting (books are kept; instruments whose "
+                             "updates were lost resync)", self.queue_capacity)
+                return
+
+    async def _ping(self, ws, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await ws.send(json.dumps({"id": self._next_id(), "type": "ping"}))
+
+    async def _load_snapshot(self, symbol, kind):
+        spec = await self._load_spec(symbol) if kind == SNAPSHOT and self.instruments[symbol].reload_spec else None
+        start = time.perf_counter_ns()
+        response = await self._call(self.get_snapshot, symbol)
+        metrics = self.metrics.instruments[symbol]
+        (metrics.snapshot if kind == SNAPSHOT else metrics.verify).record(time.perf_counter_ns() - start)
+        if self.recorder is not None:
+            self.recorder.snapshot(kind, symbol, response, spec)
+        self._snapshot_failures.pop(symbol, None)
+        self.queue.put(SnapshotLoad(kind, symbol, response["data"], spec))
+
+    async def _load_spec(self, symbol):
+        if self.get_spec is None:
+            return InstrumentSpec(symbol)
+        try:
+            return await self._call(self.get_spec, symbol)
+        except Exception as error:
+            logger.error("Reloading the increments of %s failed: %s", symbol, error)
+            return None
+
+    async def _call(self, func, *args):
+        if asyncio.iscoroutinefunction(func):
+            return await func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def _verify(self):
+        """Every verify_every applied messages fetch one instrument's REST book, rotating through the instruments."""
+        symbols = list(self.instruments)
+        next_verify = self.verify_every
+        turn = 0
+        while True:
+            await asyncio.sleep(1)
+            if self.worker.applied < next_verify:
+                continue
+            next_verify = self.worker.applied + self.verify_every
+            instrument = self.instruments[symbols[turn % len(symbols)]]
+            if instrument.verify_book is not None:
+                logger.warning("PERFORMANCE! FALLING BEHIND FEED: verify of %s still pending", instrument.symbol)
+                continue
+            turn += 1
+            logger.info("Verify-loading level2 books for %s", instrument.symbol)
+            await self._load_snapshot(instrument.symbol, VERIFY)
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            stats = self.worker.stats()
+            logger.info("Level2 feed: depth %d (high water %d)  applied %d  drain rate %.0f/s  dropped %d  resyncs %d",
+                        stats['depth'], stats['high_water'], stats['applied'], stats['drain_rate'], stats['dropped'],
+                        sum(instrument.resyncs for instrument in self.instruments.values()))
+            self.metrics.log_summary()
+
+    def _request_snapshot(self, symbol):
+        # called on the worker thread; without an event loop (replaying a capture) the snapshots come from the capture
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._start_snapshot_task, symbol)
+
+    def _start_snapshot_task(self, symbol, connection=None):
+        if connection is not None and connection is not self._failed:
+            return                                      # a retry scheduled on a connection that has since ended
+        task = asyncio.create_task(self._load_snapshot(symbol, SNAPSHOT))
+        self._snapshot_tasks.add(task)
+        task.add_done_callback(self._snapshot_tasks.discard)
+        task.add_done_callback(functools.partial(self._snapshot_done, symbol))
+
+    def _snapshot_done(self, symbol, task):
+        # a failed load drops the updates buffered for it and is retried with exponential backoff
+        if task.cancelled() or task.exception() is None:
+            return
+        failures = self._snapshot_failures[symbol] = self._snapshot_failures.get(symbol, 0) + 1
+        delay = min(SNAPSHOT_RETRY_DELAY * 2 ** (failures - 1), SNAPSHOT_RETRY_MAX_DELAY)
+        logger.error("Level2 REST book for %s failed to load (%d in a row): %r; retrying in %d seconds", symbol,
+                     failures, task.exception(), delay)
+        self.queue.put(SnapshotLoad(SNAPSHOT_FAILED, symbol, None))
+        self._loop.call_later(delay, self._start_snapshot_task, symbol, self._failed)
+
+    def _worker_failed(self, result):
+        # called on the worker thread
+        logger.error("Level2 books %s: resetting connection", REASONS.get(result, "failure %r" % (result,)))
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._failed.set)
+
+    def _next_id(self):
+        self.connect_id += 1
+        return str(self.connect_id).zfill(10)
+
+    # ---- worker thread side -------------------------------------------------------------------------------------
+
+    def _before_batch(self):
+        self.metrics.queue_depth.record(len(self.queue))
+        return True
+
+    def _apply(self, item):
+        if type(item) is SnapshotLoad:
+            instrument = self.instruments[item.symbol]
+            pending = instrument.pending
+            try:
+                if item.kind == SNAPSHOT:
+                    return self._install_snapshot(instrument, item.data, item.spec)
+                if item.kind == SNAPSHOT_FAILED:
+                    if instrument.book is None:         # the retry's snapshot replays what is buffered from now on
+                        instrument.pending = []
+                    return OK
+                return self._install_verify(instrument, item.data)
+            except Exception as error:
+                logger.exception("Level2 %s REST book for %s could not be loaded", item.kind, item.symbol)
+                return self._apply_failed(instrument, pending, error)
+
+        received, frame = item
+        try:
+            update = parse_l2update(frame)
+        except Exception:
+            # dropped: the gap it leaves resyncs its instrument when the next update arrives
+            logger.exception("Level2 frame could not be parsed: %.500r", frame)
+            return OK
+        if update is None:                              # welcome, ack and pong messages
+            return OK
+        instrument = self.instruments.get(update.symbol)
+        if instrument is None:
+            return OK
+        try:
+            return self._apply_frame(instrument, update, received, frame)
+        except Exception as error:
+            logger.exception("Level2 update %r for %s could not be applied: %.500r", update, instrument.symbol, frame)
+            return self._apply_failed(instrument, [update], error)
+
+    def _apply_failed(self, instrument, pending, error):
+        if isinstance(error, ValueError):               # a price or size finer than the instrument's increments
+            instrument.reload_spec = True
+        return self._resync(instrument, pending, APPLY_FAILED)
+
+    def _apply_frame(self, instrument, update, received, frame):
+        instrument.messages += 1
+        if instrument.book is None:
+            instrument.pending.append(update)
+            if not instrument.snapshot_requested:       # the snapshot is only requested once updates are being buffered
+                instrument.snapshot_requested = True
+                self._request_snapshot(instrument.symbol)
+            return OK
+
+        start = time.perf_counter_ns()
+        result = self._apply_update(instrument, update)
+        if result != OK:
+            return self._resync(instrument, [update], result)
+        end = time.perf_counter_ns()
+        metrics = self.metrics.instruments[instrument.symbol]
+        metrics.latency.record(end - received)
+        metrics.apply.record(end - start)
+        metrics.changes.record(len(update))
+        if self.publisher is not None:
+            self.publisher.publish(instrument.book)
+        if self.journal is not None:
+            self.journal.append(frame)
+            self.journaled += 1
+            if self.journaled % self.checkpoint_every == 0:
+                self.journal.checkpoint(BookSnapshot.of(book) for book in self.books().values())
+        if self.writer is not None and self.worker.applied % self.persist_every == 0:
+            self.persist()
+        return OK
+
+    def _install_snapshot(self, instrument, data, spec=None):
+        if instrument.book is not None:
+            return OK
+        if spec is not None:
+            if (spec.price_increment, spec.size_increment) != (instrument.spec.price_increment,
+                                                                instrument.spec.size_increment):
+                logger.warning("Level2 increments of %s changed from %s / %s to %s / %s", instrument.symbol,
+                               instrument.spec.price_increment, instrument.spec.size_increment, spec.price_increment,
+                               spec.size_increment)
+            instrument.spec = spec
+            instrument.reload_spec = False
+        book = OrderBook.from_snapshot(instrument.symbol, data, instrument.spec, self.depth, self.retain)
+        pending = instrument.pending
+        if pending and pending[0].seq_start > book.sequence + 1:
+            # the REST book is older than the first buffered update: fetch it again
+            self._request_snapshot(instrument.symbol)
+            return OK
+        if self.analytics:
+            book.track(*self.analytics)
+        instrument.book = book
+        instrument.pending = []
+        logger.info("Loaded level2 books for %s at sequence %d, replaying %d buffered updates",
+                    instrument.symbol, book.sequence, len(pending))
+        for i, update in enumerate(pending):
+            result = self._apply_update(instrument, update)
+            if result != OK:
+                return self._resync(instrument, pending[i:], result)
+        if self.journal is not None:
+            self.journal.book(BookSnapshot.of(book))
+        if self.publisher is not None:
+            self.publisher.publish(book)
+        return OK
+
+    def _resync(self, instrument, pending, result):
+        """
+        Drop one instrument's books and rebuild them from a fresh REST snapshot plus pending, the updates from the one
+        that failed onwards (changes the new snapshot already includes are skipped when they are replayed).
+        """
+        instrument.resyncs += 1
+        logger.warning("Level2 books for %s %s: resyncing from REST (%d resyncs)", instrument.symbol, REASONS[result],
+                       instrument.resyncs)
+        instrument.book = None
+        instrument.verify_book = None
+        instrument.pending = list(pending)
+        instrument.snapshot_requested = True
+        self._request_snapshot(instrument.symbol)
+        return OK
+
+    def _install_verify(self, instrument, data):
+        book = instrument.book
+        verify_book = OrderBook.from_snapshot(instrument.symbol, data, instrument.spec, self.depth, self.retain)
+        if book is not None and verify_book.sequence > book.sequence:
+            instrument.verify_book = verify_book
+        return OK
+
+    def _apply_update(self, instrument, update):
+        book = instrument.book
+        if update.seq_end <= book.sequence:
+            return OK
+        if update.seq_start > book.sequence + 1:
+            logger.error("Missing sequence numbers for %s: book at %d, update starts at %d",
+                         instrument.symbol, book.sequence, update.seq_start)
+            return MISSING_SEQUENCE
+
+        verify_book = instrument.verify_book
+        verified = OK
+        for side, price, size, seq in update:
+            if not book.update(side, price, size, seq):
+                continue
+            instrument.changes += 1
+            if verify_book is not None and verify_book.sequence <= book.sequence:
+                instrument.verify_book = None
+                if verify_book.sequence == book.sequence:
+                    # the rest of the message still applies, whatever the check finds
+                    verified = self._verify_books(book, verify_book)
+                else:
+                    logger.warning("VerifyBooks: %s skipped past REST sequence %d", book.symbol, verify_book.sequence)
+                verify_book = None
+        if verified != OK:
+            return verified
+        if book.depth and book.stale():                 # a capped side has run out of retained levels
+            return OUT_OF_RANGE
+        return OK
+
+    def _verify_books(self, book, verify_book):
+        for side_name, local_side, verify_side in (("bid", book.bids, verify_book.bids), ("ask", book.asks, verify_book.asks)):
+            if book.depth:                                      # capped sides only agree on their best depth levels
+                diffs = local_side.diff(verify_side, book.depth)
+            elif local_side.checksum == verify_side.checksum:   # O(1); the level diff only runs on a mismatch
+                continue
+            else:
+                diffs = local_side.diff(verify_side)
+            if not diffs:
+                continue
+            logger.error("VerifyBooks: %s %s books don't match: %d level(s) differ from price %s to %s",
+                         book.symbol, side_name, len(diffs), book.spec.format_price(diffs[0][0]),
+                         book.spec.format_price(diffs[-1][0]))
+            if self.writer is not None:
+                self.writer.submit(BookSnapshot.of(book))
+                self.writer.submit(BookSnapshot.of(verify_book), ".VERIFY")
+            return VERIFY_FAILED
+        logger.info("100%% match confirmed between websocket and REST books for %s", book.symbol)
+        return OK
+
+    def restore(self):
+        """
+        Warm start: rebuild the books from the journal's checkpoint and the records journaled after it. A book whose
+        journal shows a gap is left to the usual REST load. Returns the number of books restored.
+        """
+        snapshots, records = self.journal.restore()
+        for snapshot in snapshots.values():
+            self._restore_book(snapshot)
+        frames = 0
+        for kind, payload in records:
+            if kind == BOOK:
+                self._restore_book(payload)
+                continue
+            update = parse_l2update(payload)
+            instrument = self.instruments.get(update.symbol) if update is not None else None
+            if instrument is None or instrument.book is None:
+                continue
+            frames += 1
+            try:
+                result = self._apply_update(instrument, update)
+            except ValueError as error:                 # a value finer than the instrument's current increments
+                logger.warning("Level2 journal frame for %s not applicable: %s", instrument.symbol, error)
+                instrument.reload_spec = True
+                result = APPLY_FAILED
+            if result != OK:
+                logger.warning("Level2 journal for %s breaks off at sequence %d: loading it from REST",
+                               instrument.symbol, instrument.book.sequence)
+                instrument.reset()
+        restored = sum(instrument.book is not None for instrument in self.instruments.values())
+        logger.info("Restored %d of %d level2 books from the journal (%d checkpointed, %d frames replayed)",
+                    restored, len(self.instruments), len(snapshots), frames)
+        return restored
+
+    def _restore_book(self, snapshot):
+        instrument = self.instruments.get(snapshot.symbol)
+        if instrument is None:
+            return
+        try:
+            book = snapshot.book(instrument.spec, self.depth, self.retain)
+        except ValueError as error:                     # the instrument's increments changed since
+            logger.warning("Level2 journal book for %s not restored: %s", snapshot.symbol, error)
+            instrument.reset()
+            return
+        if self.analytics:
+            book.track(*self.analytics)
+        instrument.book = book
+
+    def persist(self):
+        for instrument in self.instruments.values():
+            if instrument.book is not None:
+                self.writer.submit(BookSnapshot.of(instrument.book))
+
+    def books(self):
+        """Return {symbol: OrderBook} for every instrument whose books are loaded."""
+        return {symbol: instrument.book for symbol, instrument in self.instruments.items() if instrument.book is not None}
+
+    def specs(self):
+        """Return {symbol: InstrumentSpec} for every instrument."""
+        return {symbol: instrument.spec for symbol, instrument in self.instruments.items()}
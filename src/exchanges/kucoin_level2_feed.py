@@ -0,0 +1,141 @@
+# kucoin_level2_feed.py
+# Receive queue and book-apply worker for the level2 websocket program. The event loop only enqueues raw websocket
+# messages and the REST books it fetched; a BookWorker thread drains them in batches and applies them to the books.
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class FeedQueue:
+    """
+    Bounded FIFO of raw websocket messages. deque.append and deque.popleft are atomic in CPython, so the single
+    producer (websocket thread) and single consumer (BookWorker) never take a lock on the hot path.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.received = 0
+        self.dropped = 0
+        self.high_water = 0
+        self._messages = deque()
+        self._wakeup = threading.Event()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def put(self, msg):
+        """Enqueue a message. Returns False and counts a drop when the queue is full."""
+        messages = self._messages
+        depth = len(messages)
+        if depth >= self.capacity:
+            self.dropped += 1
+            return False
+        messages.append(msg)
+        self.received += 1
+        if depth >= self.high_water:
+            self.high_water = depth + 1
+        if not depth:
+            self._wakeup.set()
+        return True
+
+    def drain(self, max_messages):
+        """Pop up to max_messages from the head of the queue."""
+        messages = self._messages
+        popleft = messages.popleft
+        batch = []
+        for _ in range(min(max_messages, len(messages))):
+            batch.append(popleft())
+        return batch
+
+    def wait(self, timeout):
+        """Block the consumer until the producer enqueues into an empty queue, or timeout seconds pass."""
+        self._wakeup.clear()
+        if not self._messages:
+            self._wakeup.wait(timeout)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def clear(self):
+        self._messages.clear()
+
+
+class BookWorker(threading.Thread):
+    """
+    Drains a FeedQueue in batches and hands each item to apply(item), which returns 0 on success. Any other
+    result stops the worker and is passed to on_error(result); so is an exception apply() raises, after it is logged.
+
+    The worker never does I/O: REST snapshots are fetched on the event loop and arrive as queue items of their own
+    (the Level2Client's SnapshotLoad), so each is applied in order with the websocket messages around it.
+    before_batch(), when given, runs ahead of every batch on the worker thread, e.g. to sample the queue depth;
+    returning False leaves the queue untouched until the next wakeup.
+    """
+
+    def __init__(self, queue, apply, before_batch=None, on_error=None, batch_size=500, idle_wait=0.05, name="BookWorker"):
+        super().__init__(name=name, daemon=True)
+        self.queue = queue
+        self.apply = apply
+        self.before_batch = before_batch
+        self.on_error = on_error
+        self.batch_size = batch_size
+        self.idle_wait = idle_wait
+        self.applied = 0
+        self.batches = 0
+        self.result = 0
+        self._stopping = threading.Event()
+        self._rate_mark = (time.monotonic(), 0)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.queue.wake()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join(timeout)
+
+    def stopped(self):
+        return self._stopping.is_set()
+
+    def run(self):
+        queue = self.queue
+        apply = self.apply
+        while not self._stopping.is_set():
+            if self.before_batch is not None and not self.before_batch():
+                queue.wait(self.idle_wait)
+                continue
+            batch = queue.drain(self.batch_size)
+            if not batch:
+                queue.wait(self.idle_wait)
+                continue
+            self.batches += 1
+            for msg in batch:
+                try:
+                    result = apply(msg)
+                except Exception as error:
+                    logger.exception("%s: applying a message failed", self.name)
+                    result = error
+                if result:
+                    self.result = result
+                    self._stopping.set()
+                    if self.on_error is not None:
+                        self.on_error(result)
+                    return
+                self.applied += 1
+
+    def stats(self):
+        """Queue depth, drain rate (messages applied per second since the previous call) and drop/overflow counters."""
+        now = time.monotonic()
+        mark_time, mark_applied = self._rate_mark
+        self._rate_mark = (now, self.applied)
+        elapsed = now - mark_time
+        return {
+            'depth': len(self.queue),
+            'high_water': self.queue.high_water,
+            'received': self.queue.received,
+            'applied': self.applied,
+            'batches': self.batches,
+            'drain_rate': (self.applied - mark_applied) / elapsed if elapsed > 0 else 0.0,
+            'dropped': self.queue.dropped,
+        }
@@ -0,0 +1,183 @@
+# kucoin_level2_journal.py
+# Crash-safe journal of the level2 book engine for warm restarts: an append-only log of what the book worker applied
+# plus periodic checkpoints of every book, so a restarted process rebuilds its books from disk instead of REST.
+#
+# Files, per journal name (one journal per shard), in the journal directory:
+#
+#   <name>.checkpoint           header: magic b'KL2J', version, book count, first journal segment after it,
+#                               followed by one BookSnapshot (kucoin_level2_snapshot.py layout) per book
+#   <name>.<segment>.journal    records: kind (1 byte), payload length (uint32), payload
+#                                 kind b'F': an l2update frame the worker applied, exactly as received
+#                                 kind b'B': one book as a BookSnapshot, after a REST snapshot (re)loaded it
+#
+# Records and checkpoints go through one queue to the BookJournal thread in the order the worker produced them, so
+# a checkpoint holds exactly the books after the last record of the previous segment. The checkpoint is fsynced and
+# renamed into place before the segments it covers are deleted: a crash at any point leaves a checkpoint plus every
+# record since it. A torn record at the end of the last segment is ignored on restore.
+
+import glob
+import logging
+import os
+import struct
+import threading
+from collections import deque
+
+from exchanges.kucoin_level2_snapshot import BookSnapshot
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'KL2J'
+VERSION = 1
+CHECKPOINT = struct.Struct('<4sHHq')
+RECORD = struct.Struct('<cI')
+
+FRAME = b'F'
+BOOK = b'B'
+
+
+class BookJournal(threading.Thread):
+    """
+    Journal writer thread. append() and book() are called by the book worker for every applied frame and every
+    book loaded from REST; checkpoint() with copies of all the books (BookSnapshot.of) every so often. All three
+    only queue the item. restore() reads everything back and is called before the thread is started.
+    """
+
+    def __init__(self, directory, name, flush_interval=0.5):
+        super().__init__(name="BookJournal", daemon=True)
+        self.directory = directory
+        self.name = name
+        self.flush_interval = flush_interval
+        self.records = 0
+        self.checkpoints = 0
+        self.segment = None
+        self._items = deque()
+        self._stopping = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+    def checkpoint_path(self):
+        return os.path.join(self.directory, self.name + ".checkpoint")
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, "%s.%d.journal" % (self.name, segment))
+
+    def segments(self):
+        """Existing journal segment numbers, oldest first."""
+        segments = []
+        for path in glob.glob(os.path.join(glob.escape(self.directory), glob.escape(self.name) + ".*.journal")):
+            number = path[:-len(".journal")].rsplit(".", 1)[1]
+            if number.isdigit():
+                segments.append(int(number))
+        return sorted(segments)
+
+    # ---- book worker side ---------------------------------------------------------------------------------------
+
+    def append(self, frame):
+        self._items.append((FRAME, frame if type(frame) is bytes else frame.encode()))
+
+    def book(self, snapshot):
+        self._items.append((BOOK, snapshot))
+
+    def checkpoint(self, snapshots):
+        self._items.append((None, list(snapshots)))
+
+    # ---- restore ------------------------------------------------------------------------------------------------
+
+    def restore(self):
+        """
+        Return (snapshots, records): {symbol: BookSnapshot} from the checkpoint (empty without one) and an iterator
+        over the (kind, payload) records journaled since, BOOK payloads decoded to BookSnapshots.
+        """
+        snapshots = {}
+        first_segment = 0
+        try:
+            with open(self.checkpoint_path(), 'rb') as f:
+                data = f.read()
+            magic, version, count, first_segment = CHECKPOINT.unpack_from(data, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("%s is not a version %d level2 checkpoint" % (self.checkpoint_path(), VERSION))
+            offset = CHECKPOINT.size
+            for _ in range(count):
+                snapshot = BookSnapshot.from_bytes(data, offset)
+                offset += snapshot.size()
+                snapshots[snapshot.symbol] = snapshot
+        except FileNotFoundError:
+            pass
+        except (ValueError, struct.error) as error:
+            logger.error("Level2 journal checkpoint unusable, restoring from the journal alone: %s", error)
+            snapshots = {}
+            first_segment = 0
+        segments = [segment for segment in self.segments() if segment >= first_segment]
+        self.segment = (segments[-1] if segments else first_segment) + 1
+        return snapshots, self._read(segments)
+
+    def _read(self, segments):
+        for segment in segments:
+            with open(self.segment_path(segment), 'rb') as f:
+                data = f.read()
+            offset = 0
+            while offset + RECORD.size <= len(data):
+                kind, length = RECORD.unpack_from(data, offset)
+                offset += RECORD.size
+                if offset + length > len(data):
+                    break                               # torn tail of a crashed run
+                payload = data[offset:offset + length]
+                offset += length
+                yield kind, (BookSnapshot.from_bytes(payload) if kind == BOOK else payload)
+
+    # ---- writer thread ------------------------------------------------------------------------------------------
+
+    def run(self):
+        if self.segment is None:
+            segments = self.segments()
+            self.segment = segments[-1] + 1 if segments else 0
+        f = open(self.segment_path(self.segment), 'ab')
+        items = self._items
+        try:
+            while True:
+                stopping = self._stopping.wait(self.flush_interval)
+                chunks = []
+                for _ in range(len(items)):
+                    kind, payload = items.popleft()
+                    if kind is None:
+                        f = self._checkpoint(f, chunks, payload)
+                        chunks = []
+                        continue
+                    if kind == BOOK:
+                        payload = payload.to_bytes()
+                    chunks.append(RECORD.pack(kind, len(payload)))
+                    chunks.append(payload)
+                    self.records += 1
+                if chunks:
+                    f.write(b''.join(chunks))
+                    f.flush()
+                if stopping:
+                    return
+        finally:
+            f.close()
+
+    def _checkpoint(self, f, chunks, snapshots):
+        # finish the current segment, write the checkpoint that replaces it and everything before it, start the next
+        f.write(b''.join(chunks))
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        self.segment += 1
+        path = self.checkpoint_path()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as checkpoint:
+            checkpoint.write(CHECKPOINT.pack(MAGIC, VERSION, len(snapshots), self.segment))
+            for snapshot in snapshots:
+                checkpoint.write(snapshot.to_bytes())
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace(tmp_path, path)
+        for segment in self.segments():
+            if segment < self.segment:
+                os.remove(self.segment_path(segment))
+        self.checkpoints += 1
+        return open(self.segment_path(self.segment), 'ab')
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,162 @@
+# kucoin_level2_metrics.py
+# Always-on instrumentation for the level2 pipeline: HDR-style histograms per instrument plus feed queue depth.
+#
+# Recording is a bit_length(), a shift and a list increment, so the worker can record every message. Readers never
+# reset anything: an interval summary is the difference between two copies, so the worker thread and the reporting
+# coroutine share the histograms without a lock.
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUB_BUCKET_BITS = 5                         # 32 linear sub-buckets per power of two: values within ~3%
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKETS = SUB_BUCKETS >> 1
+MAX_VALUE_BITS = 48                         # 2^48 ns is over three days; larger values land in the last bucket
+
+
+def bucket_index(value):
+    if value < SUB_BUCKETS:
+        return value if value > 0 else 0
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + (value >> shift) - HALF_SUB_BUCKETS
+
+
+def bucket_value(index):
+    """Highest value that maps to bucket index."""
+    if index < SUB_BUCKETS:
+        return index
+    shift = (index - SUB_BUCKETS) // HALF_SUB_BUCKETS + 1
+    top = (index - SUB_BUCKETS) % HALF_SUB_BUCKETS + HALF_SUB_BUCKETS
+    return ((top + 1) << shift) - 1
+
+
+BUCKETS = bucket_index((1 << MAX_VALUE_BITS) - 1) + 1
+
+
+class Histogram:
+    """Log-linear histogram of non-negative integers (nanoseconds, counts) with bounded relative error."""
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def record(self, value):
+        if value < SUB_BUCKETS:
+            index = value if value > 0 else 0
+        else:
+            shift = value.bit_length() - SUB_BUCKET_BITS
+            index = SUB_BUCKETS + (shift - 1) * HALF_SUB_BUCKETS + (value >> shift) - HALF_SUB_BUCKETS
+            if index >= BUCKETS:
+                index = BUCKETS - 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def copy(self):
+        other = Histogram()
+        other.counts = self.counts[:]
+        other.count = self.count
+        other.total = self.total
+        other.min = self.min
+        other.max = self.max
+        return other
+
+    def since(self, earlier):
+        """The values recorded after earlier, a copy() of this histogram. min and max are those of the whole run."""
+        interval = self.copy()
+        interval.counts = [now - then for now, then in zip(self.counts, earlier.counts)]
+        interval.count = self.count - earlier.count
+        interval.total = self.total - earlier.total
+        return interval
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0
+        target = max(1, int(self.count * percent / 100 + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(bucket_value(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {'count': self.count, 'mean': self.mean(), 'min': self.min or 0, 'p50': self.percentile(50),
+                'p90': self.percentile(90), 'p99': self.percentile(99), 'p999': self.percentile(99.9), 'max': self.max}
+
+
+class InstrumentMetrics:
+    """
+    latency:  receive to applied, ns          snapshot: REST snapshot load, ns
+    apply:    book apply time per message, ns  verify:   REST verify load, ns
+    changes:  changes per message
+    """
+
+    NAMES = ('latency', 'apply', 'changes', 'snapshot', 'verify')
+
+    __slots__ = NAMES
+
+    def __init__(self):
+        for name in self.NAMES:
+            setattr(self, name, Histogram())
+
+    def histograms(self):
+        return {name: getattr(self, name) for name in self.NAMES}
+
+
+class Level2Metrics:
+    """In-process metrics for a Level2Client: one InstrumentMetrics per instrument plus the feed queue depth."""
+
+    def __init__(self, symbols):
+        self.instruments = {symbol: InstrumentMetrics() for symbol in symbols}
+        self.queue_depth = Histogram()
+        self._marks = None
+
+    def histograms(self):
+        """Return {name: Histogram}, names being "queue_depth" and "<symbol>.<histogram>"."""
+        histograms = {'queue_depth': self.queue_depth}
+        for symbol, metrics in self.instruments.items():
+            for name, histogram in metrics.histograms().items():
+                histograms[symbol + '.' + name] = histogram
+        return histograms
+
+    def snapshot(self):
+        """Return {name: summary dict} for everything recorded since start."""
+        return {name: histogram.summary() for name, histogram in self.histograms().items()}
+
+    def interval(self):
+        """Return {name: summary dict} for what was recorded since the previous interval() call."""
+        histograms = self.histograms()
+        marks = self._marks or {}
+        self._marks = {name: histogram.copy() for name, histogram in histograms.items()}
+        return {name: (self._marks[name].since(marks[name]) if name in marks else self._marks[name]).summary()
+                for name in histograms}
+
+    def log_summary(self, level=logging.INFO):
+        """Log one line per instrument with traffic since the previous summary, plus the queue depth line."""
+        interval = self.interval()
+        depth = interval['queue_depth']
+        logger.log(level, "level2 queue depth: p50 %d  p99 %d  max %d over %d batches",
+                   depth['p50'], depth['p99'], depth['max'], depth['count'])
+        for symbol in self.instruments:
+            latency = interval[symbol + '.latency']
+            if not latency['count']:
+                continue
+            apply = interval[symbol + '.apply']
+            changes = interval[symbol + '.changes']
+            logger.log(level, "%s: %d msgs  latency p50 %.0fus p99 %.0fus max %.0fus  apply p50 %.1fus p99 %.1fus  "
+                       "changes p50 %d p99 %d", symbol, latency['count'], latency['p50'] / 1e3, latency['p99'] / 1e3,
+                       latency['max'] / 1e3, apply['p50'] / 1e3, apply['p99'] / 1e3, changes['p50'], changes['p99'])
@@ -0,0 +1,83 @@
+# kucoin_level2_parser.py
+# Single-pass decoder for Kucoin trade.l2update websocket messages.
+#
+# Sample message:
+#   {"type":"message","tunnelId":"DOT-BTC_books","topic":"/market/level2:DOT-BTC","subject":"trade.l2update","data":{"changes":{"asks":[["0.00037526","50","11501462"],
+#    ["0.00037563","150","11501461"]],"bids":[["0.00037339","150","11501460"]]},"sequenceEnd":11501462,"sequenceStart":11501460,"symbol":"DOT-BTC","time":1659738043576}}
+
+from exchanges.kucoin_level2_book import BID, ASK
+
+# Use the fastest JSON decoder installed; all of them return the same dict/list/str structure as json.loads
+try:
+    import orjson
+    loads = orjson.loads
+    JSON_BACKEND = 'orjson'
+except ImportError:
+    try:
+        import ujson
+        loads = ujson.loads
+        JSON_BACKEND = 'ujson'
+    except ImportError:
+        import json
+        loads = json.loads
+        JSON_BACKEND = 'json'
+
+L2UPDATE_SUBJECT = 'trade.l2update'
+
+
+class L2Update:
+    """
+    One decoded l2update message. The changes are held as parallel sides/prices/sizes/seqs sequences ordered by
+    sequence number, which is the order they must be applied in. Prices and sizes stay as the exchange strings.
+    """
+
+    __slots__ = ('symbol', 'seq_start', 'seq_end', 'time', 'sides', 'prices', 'sizes', 'seqs')
+
+    def __init__(self, symbol, seq_start, seq_end, time, sides, prices, sizes, seqs):
+        self.symbol = symbol
+        self.seq_start = seq_start
+        self.seq_end = seq_end
+        self.time = time
+        self.sides = sides
+        self.prices = prices
+        self.sizes = sizes
+        self.seqs = seqs
+
+    def __len__(self):
+        return len(self.seqs)
+
+    def __iter__(self):
+        """Yield (side, price, size, seq) change records in sequence order."""
+        return zip(self.sides, self.prices, self.sizes, self.seqs)
+
+    def __repr__(self):
+        return 'L2Update(%s, %d-%d, %d changes)' % (self.symbol, self.seq_start, self.seq_end, len(self.seqs))
+
+
+def parse_l2update(msg):
+    """
+    Decode a raw websocket message (str or bytes) once into an L2Update. Returns None for anything that is not a
+    trade.l2update message, e.g. welcome, ack and pong messages.
+    """
+    doc = loads(msg)
+    if doc.get('subject') != L2UPDATE_SUBJECT:
+        return None
+    data = doc['data']
+    changes = data['changes']
+    asks = changes.get('asks') or []
+    bids = changes.get('bids') or []
+
+    if len(asks) + len(bids) == 1:
+        side, (price, size, seq) = (ASK, asks[0]) if asks else (BID, bids[0])
+        sides, prices, sizes, seqs = [side], [price], [size], [int(seq)]
+    else:
+        records = [(int(rec[2]), ASK, rec[0], rec[1]) for rec in asks]
+        records += [(int(rec[2]), BID, rec[0], rec[1]) for rec in bids]
+        records.sort()
+        seqs = [rec[0] for rec in records]
+        sides = [rec[1] for rec in records]
+        prices = [rec[2] for rec in records]
+        sizes = [rec[3] for rec in records]
+
+    return L2Update(data['symbol'], int(data['sequenceStart']), int(data['sequenceEnd']), data.get('time'),
+                    sides, prices, sizes, seqs)
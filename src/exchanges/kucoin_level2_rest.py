@@ -0,0 +1,104 @@
+# kucoin_level2_rest.py
+# Concurrent level2 REST snapshot loading for the Level2Client: requests share the KucoinRestClient's keep-alive
+# aiohttp session and are paced by a token bucket sized to the exchange's request weight limits instead of a fixed
+# sleep per call, with at most max_concurrent of them in flight so a burst does not open a connection per symbol.
+
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from exchanges.kucoin_rest import KucoinApiError, KucoinRateLimitError
+
+logger = logging.getLogger(__name__)
+
+LEVEL2_PATH = "/api/v3/market/orderbook/level2"
+LEVEL2_WEIGHT = 3                   # request weight of the full depth endpoint in the spot pool
+
+
+class TokenBucket:
+    """
+    asyncio token bucket: rate tokens per second up to capacity. acquire() waits until weight tokens are available;
+    waiters are served in arrival order. pause() empties the bucket for a number of seconds, e.g. after a 429.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, weight=1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                await asyncio.sleep((weight - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self.tokens = 0
+        self._updated = self._paused_until
+
+
+class Level2SnapshotLoader:
+    """
+    Fetch full depth level2 snapshots concurrently through client, a KucoinRestClient. snapshot(symbol) is a
+    coroutine returning the same response dict as GET /api/v3/market/orderbook/level2, so it can be handed to a
+    Level2Client as its get_snapshot. At most max_concurrent requests are in flight at once. Point the client's
+    base_url at a local stub server for testing.
+    """
+
+    def __init__(self, client, weight_per_second=4000 / 30, weight_burst=200, weight=LEVEL2_WEIGHT, retry_delay=1,
+                 max_retry_delay=20, max_concurrent=16):
+        self.client = client
+        self.weight = weight
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.bucket = TokenBucket(weight_per_second, weight_burst)
+        self._requests = asyncio.Semaphore(max_concurrent)
+        self.loaded = 0
+        self.failed = 0
+        self.throttled = 0
+
+    async def snapshot(self, symbol):
+        """Fetch one snapshot, retrying with backoff until the exchange returns code 200000."""
+        delay = self.retry_delay
+        while True:
+            try:
+                async with self._requests:
+                    await self.bucket.acquire(self.weight)
+                    response = await self.client.request_async("GET", LEVEL2_PATH, {"symbol": symbol})
+                self.loaded += 1
+                return response
+            except KucoinRateLimitError as error:
+                self.throttled += 1
+                logger.warning("Level2 snapshot for %s rate limited: pausing %.1f seconds", symbol, error.reset)
+                self.bucket.pause(error.reset)
+                continue
+            except (KucoinApiError, aiohttp.ClientError, asyncio.TimeoutError) as error:
+                self.failed += 1
+                logger.warning("Level2 snapshot for %s failed (%s): retrying in %.1f seconds", symbol, error, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    async def snapshots(self, symbols):
+        """Fetch every symbol concurrently, yielding (symbol, response) as each one arrives."""
+        async def fetch(symbol):
+            return symbol, await self.snapshot(symbol)
+        for next_done in asyncio.as_completed([fetch(symbol) for symbol in symbols]):
+            yield await next_done
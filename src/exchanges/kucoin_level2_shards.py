@@ -0,0 +1,118 @@
+# kucoin_level2_shards.py
+# Spread level2 instruments over several worker processes, each with its own websocket connection and books.
+#
+# A shard is one process running target(instruments, *args), normally a Level2Client over its share of the
+# instruments. The Level2Supervisor watches the shard processes and restarts any that exit, one at a time and with
+# backoff, so a failure in one shard never resets the books held by the others.
+
+import logging
+import multiprocessing
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def shard_instruments(instruments, shards):
+    """
+    Split instruments into at most shards lists, dealing them out round robin so that a list ordered by activity
+    spreads the busiest instruments across different shards.
+    """
+    instruments = list(instruments)
+    shards = max(1, min(shards, len(instruments)))
+    return [instruments[i::shards] for i in range(shards)]
+
+
+class Level2Shard:
+    """One shard: its instruments, the current process and its restart bookkeeping."""
+
+    def __init__(self, shard_id, instruments):
+        self.shard_id = shard_id
+        self.instruments = instruments
+        self.process = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_delay = 0.0
+        self.restart_at = None
+
+    @property
+    def name(self):
+        return "Level2Shard-%d" % self.shard_id
+
+
+class Level2Supervisor:
+    """
+    Start one process per shard and keep them running.
+
+    A shard that exits is restarted after restart_delay seconds; the delay doubles, up to max_restart_delay, each
+    time the shard dies again within stable_after seconds of being started, and resets once it has stayed up.
+    """
+
+    def __init__(self, instruments, shards, target, args=(), restart_delay=5, max_restart_delay=300,
+                 stable_after=60, check_interval=1):
+        self.shards = [Level2Shard(i, chunk) for i, chunk in enumerate(shard_instruments(instruments, shards))]
+        self.target = target
+        self.args = tuple(args)
+        self.min_restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stable_after = stable_after
+        self.check_interval = check_interval
+        self._running = False
+
+    def _start_shard(self, shard):
+        process = multiprocessing.Process(target=self.target, args=(shard.instruments,) + self.args,
+                                          name=shard.name, daemon=True)
+        process.start()
+        shard.process = process
+        shard.started_at = time.monotonic()
+        shard.restart_at = None
+        logger.info("Started %s (pid %d) for %s", shard.name, process.pid, ", ".join(shard.instruments))
+
+    def start(self):
+        self._running = True
+        for shard in self.shards:
+            self._start_shard(shard)
+
+    def check(self):
+        """Restart any shard whose process has exited and whose restart delay has passed."""
+        now = time.monotonic()
+        for shard in self.shards:
+            if shard.restart_at is not None:
+                if now >= shard.restart_at:
+                    shard.restarts += 1
+                    self._start_shard(shard)
+                continue
+            if shard.process.is_alive():
+                continue
+            shard.process.join()
+            if now - shard.started_at >= self.stable_after:
+                shard.restart_delay = self.min_restart_delay
+            else:
+                shard.restart_delay = min(max(shard.restart_delay * 2, self.min_restart_delay), self.max_restart_delay)
+            shard.restart_at = now + shard.restart_delay
+            logger.error("%s exited with code %s: restarting in %.1f seconds", shard.name, shard.process.exitcode,
+                         shard.restart_delay)
+
+    def run(self):
+        """Start every shard and supervise them until stop() is called or the supervisor is interrupted."""
+        self.start()
+        try:
+            while self._running:
+                time.sleep(self.check_interval)
+                self.check()
+        finally:
+            self.stop()
+
+    def stop(self, timeout=5):
+        self._running = False
+        for shard in self.shards:
+            if shard.process is not None and shard.process.is_alive():
+                shard.process.terminate()
+        for shard in self.shards:
+            if shard.process is not None:
+                shard.process.join(timeout)
+
+    def status(self):
+        """Return one {shard, pid, alive, restarts, instruments} dict per shard."""
+        return [{"shard": shard.shard_id, "pid": shard.process.pid if shard.process else None,
+                 "alive": bool(shard.process and shard.process.is_alive()), "restarts": shard.restarts,
+                 "instruments": shard.instruments} for shard in self.shards]
@@ -0,0 +1,211 @@
+# kucoin_level2_shm.py
+# Top-of-book publication from the level2 book engine to strategy processes through one shared-memory segment.
+#
+# Segment layout (little endian):
+#
+#   header   16 bytes   magic b'KL2T', version, reserved, depth, slot count
+#   slot     one per instrument, 136 + 32 * depth bytes each:
+#              symbol      16s       written once when the segment is created
+#              counter     uint64    seqlock: odd while the slot is being written, bumped by 2 per publish
+#              sequence    int64     book sequence number
+#              timestamp   int64     publish time (ms)
+#              bid count   uint32
+#              ask count   uint32
+#              flags       uint32    ANALYTICS_VALID: the analytics block holds the book's analytics
+#              reserved    uint32
+#              float64     [10]      book analytics, in ANALYTICS order (nan when the engine does not track them;
+#                                    single values can be nan too, e.g. the mid while one side is empty)
+#              float64     [depth]   bid prices, best first, then bid sizes, ask prices and ask sizes
+#
+# A reader copies the slot and retries if the counter was odd or changed while it copied, so it always returns a
+# book published at one sequence number without any lock or IPC round trip. Each slot has exactly one writer, the
+# shard process that owns the instrument.
+
+import math
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+MAGIC = b'KL2T'
+VERSION = 3
+HEADER = struct.Struct('<4sHHII')
+SYMBOL = struct.Struct('<16s')
+COUNTER = struct.Struct('<Q')
+ANALYTICS = ('spread', 'mid', 'microprice', 'weighted_mid', 'imbalance', 'band_imbalance', 'bid_depth', 'ask_depth',
+             'bid_band_depth', 'ask_band_depth')         # a subset of OrderBook.analytics()
+NO_ANALYTICS = [math.nan] * len(ANALYTICS)
+ANALYTICS_VALID = 1
+SLOT_HEADER_SIZE = SYMBOL.size + COUNTER.size + 32 + 8 * len(ANALYTICS)
+
+
+def payload_struct(depth):
+    return struct.Struct('<qqIIII%dd' % (len(ANALYTICS) + 4 * depth))
+
+
+class TopOfBookSegment:
+    """A top-of-book shared-memory segment: create() it once in the supervisor, attach() to it everywhere else."""
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        magic, version, _, self.depth, slots = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d level2 top-of-book segment" % (shm.name, VERSION))
+        self.slot_size = SLOT_HEADER_SIZE + 32 * self.depth
+        self.offsets = {}
+        for slot in range(slots):
+            offset = HEADER.size + slot * self.slot_size
+            symbol = SYMBOL.unpack_from(shm.buf, offset)[0].rstrip(b'\0').decode('ascii')
+            self.offsets[symbol] = offset
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def create(cls, name, symbols, depth=10):
+        """Allocate the segment with one slot per symbol, replacing any segment left behind under the same name."""
+        slot_size = SLOT_HEADER_SIZE + 32 * depth
+        size = HEADER.size + len(symbols) * slot_size
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        HEADER.pack_into(shm.buf, 0, MAGIC, VERSION, 0, depth, len(symbols))
+        for slot, symbol in enumerate(symbols):
+            SYMBOL.pack_into(shm.buf, HEADER.size + slot * slot_size, symbol.encode('ascii')[:16])
+        return cls(shm, True)
+
+    @classmethod
+    def attach(cls, name, track=True):
+        """
+        Attach to an existing segment. Python < 3.13 registers every attached segment with the process's resource
+        tracker, which unlinks it when the process exits: pass track=False from independent processes (strategies),
+        keep the default in the creator and in processes forked from it, which share the creator's tracker.
+        """
+        shm = shared_memory.SharedMemory(name)
+        if not track:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, False)
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        if self.owner:
+            self.shm.unlink()
+
+
+class TopOfBookPublisher:
+    """
+    Writes the top depth levels of OrderBooks into their slots. Used by the book engine, one per shard process;
+    segment is a TopOfBookSegment or the name of one.
+    """
+
+    def __init__(self, segment):
+        if isinstance(segment, str):
+            segment = TopOfBookSegment.attach(segment)
+        self.segment = segment
+        self.depth = segment.depth
+        self.published = 0
+        self._payload = payload_struct(self.depth)
+        self._counters = {}
+
+    def publish(self, book):
+        """Publish book's top of book. Returns False when the segment has no slot for the instrument."""
+        offset = self.segment.offsets.get(book.symbol)
+        if offset is None:
+            return False
+        depth = self.depth
+        price_scale = book.spec.price_scale
+        size_scale = book.spec.size_scale
+        bids = book.bids.top(depth)
+        asks = book.asks.top(depth)
+        analytics = book.analytics()
+        values = NO_ANALYTICS if analytics is None else [analytics[name] for name in ANALYTICS]
+        padding = [0.0] * (depth - len(bids))
+        values = values + [level[0] / price_scale for level in bids] + padding + [level[1] / size_scale for level in bids] + padding
+        padding = [0.0] * (depth - len(asks))
+        values += [level[0] / price_scale for level in asks] + padding + [level[1] / size_scale for level in asks] + padding
+
+        buf = self.segment.shm.buf
+        counter_offset = offset + SYMBOL.size
+        counter = self._counters.get(offset)
+        if counter is None:
+            counter = COUNTER.unpack_from(buf, counter_offset)[0] & ~1     # pick up after a restarted shard
+        COUNTER.pack_into(buf, counter_offset, counter + 1)
+        self._payload.pack_into(buf, counter_offset + COUNTER.size, book.sequence, int(time.time() * 1000),
+                                len(bids), len(asks), 0 if analytics is None else ANALYTICS_VALID, 0, *values)
+        COUNTER.pack_into(buf, counter_offset, counter + 2)
+        self._counters[offset] = counter + 2
+        self.published += 1
+        return True
+
+    def close(self):
+        self.segment.close()
+
+
+class TopOfBookReader:
+    """
+    Consistent, lock-free reads of the published top of book, for strategy processes; segment is a TopOfBookSegment
+    or the name of one.
+    """
+
+    def __init__(self, segment):
+        if isinstance(segment, str):
+            segment = TopOfBookSegment.attach(segment, track=False)
+        self.segment = segment
+        self.depth = segment.depth
+        self.retries = 0
+        self._payload = payload_struct(self.depth)
+
+    def symbols(self):
+        return list(self.segment.offsets)
+
+    def read(self, symbol, max_spins=10000):
+        """
+        Return {symbol, sequence, timestamp, bids, asks, analytics} with [price, size] levels best first and the
+        ANALYTICS values as a dict (None when the engine does not track them), or None when nothing has been
+        published for symbol yet (or a writer held the slot for max_spins attempts).
+        """
+        buf = self.segment.shm.buf
+        counter_offset = self.segment.offsets[symbol] + SYMBOL.size
+        for _ in range(max_spins):
+            counter = COUNTER.unpack_from(buf, counter_offset)[0]
+            if counter & 1:
+                self.retries += 1
+                continue
+            payload = self._payload.unpack_from(buf, counter_offset + COUNTER.size)
+            if COUNTER.unpack_from(buf, counter_offset)[0] == counter:
+                break
+            self.retries += 1
+        else:
+            return None
+        if counter == 0:
+            return None
+
+        sequence, timestamp, n_bids, n_asks, flags = payload[0:5]
+        depth = self.depth
+        analytics = payload[6:6 + len(ANALYTICS)]
+        bid_prices = 6 + len(ANALYTICS)
+        bid_sizes = bid_prices + depth
+        ask_prices = bid_sizes + depth
+        ask_sizes = ask_prices + depth
+        return {
+            'symbol': symbol,
+            'sequence': sequence,
+            'timestamp': timestamp,
+            'bids': [[payload[bid_prices + i], payload[bid_sizes + i]] for i in range(n_bids)],
+            'asks': [[payload[ask_prices + i], payload[ask_sizes + i]] for i in range(n_asks)],
+            'analytics': dict(zip(ANALYTICS, analytics)) if flags & ANALYTICS_VALID else None,
+        }
+
+    def read_all(self):
+        return {symbol: self.read(symbol) for symbol in self.segment.offsets}
+
+    def close(self):
+        self.segment.close()
@@ -0,0 +1,206 @@
+# kucoin_level2_snapshot.py
+# Compact binary book snapshots for the level2 websocket program, written off the book-apply thread.
+#
+# File layout (little endian), one file per instrument, replaced atomically on every write:
+#
+#   header   48 bytes   magic b'KL2B', version, price decimals, size decimals, sequence, timestamp (ms),
+#                       bid count, ask count, symbol
+#   int64    [bids]     bid prices, best first
+#   int64    [bids]     bid sizes
+#   int64    [asks]     ask prices, best first
+#   int64    [asks]     ask sizes
+#
+# Prices and sizes are the book's fixed-point units: divide by 10 ** decimals for the value. Every column starts on
+# an 8-byte boundary, so a reader can mmap the file and view each column as int64s without parsing anything:
+# MappedSnapshot below, or numpy.frombuffer( mm, '<i8', count, offset ).
+
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+from exchanges.kucoin_level2_book import InstrumentSpec, OrderBook, format_units
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'KL2B'
+VERSION = 2
+HEADER = struct.Struct('<4sHBBqqII16s')
+
+
+class BookSnapshot:
+    """
+    Immutable view of an OrderBook at one sequence number. Taking it only copies the book's key and size columns
+    (four memcpys); putting them in best first order happens later on the writer thread.
+    """
+
+    __slots__ = ('symbol', 'sequence', 'timestamp', 'price_decimals', 'size_decimals', '_bids', '_asks')
+
+    def __init__(self, symbol, sequence, timestamp, price_decimals, size_decimals, bids, asks):
+        self.symbol = symbol
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.price_decimals = price_decimals
+        self.size_decimals = size_decimals
+        self._bids = bids
+        self._asks = asks
+
+    @classmethod
+    def of(cls, book):
+        return cls(book.symbol, book.sequence, int(time.time() * 1000), book.spec.price_decimals,
+                   book.spec.size_decimals, book.bids.copy_levels(), book.asks.copy_levels())
+
+    def columns(self):
+        """Return (bid_prices, bid_sizes, ask_prices, ask_sizes) as array('q') columns, best price first."""
+        bid_keys, bid_sizes = self._bids
+        ask_keys, ask_sizes = self._asks
+        # BookSide keeps both columns ascending with the best level last; ask keys are negated prices
+        return (array('q', reversed(bid_keys)), array('q', reversed(bid_sizes)),
+                array('q', [-key for key in reversed(ask_keys)]), array('q', reversed(ask_sizes)))
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
+        """Inverse of to_bytes(): the snapshot stored at offset in data (bytes, or a buffer such as an mmap)."""
+        (magic, version, price_decimals, size_decimals, sequence, timestamp, n_bids, n_asks,
+         symbol) = HEADER.unpack_from(data, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a version %d level2 snapshot" % VERSION)
+        columns = array('q')
+        start = offset + HEADER.size
+        columns.frombytes(data[start:start + 16 * (n_bids + n_asks)])
+        bid_prices = columns[0:n_bids]
+        bid_sizes = columns[n_bids:2 * n_bids]
+        ask_prices = columns[2 * n_bids:2 * n_bids + n_asks]
+        ask_sizes = columns[2 * n_bids + n_asks:]
+        # back to BookSide column order: ascending keys, best level last, ask keys negated
+        return cls(symbol.rstrip(b'\0').decode('ascii'), sequence, timestamp, price_decimals, size_decimals,
+                   (array('q', reversed(bid_prices)), array('q', reversed(bid_sizes))),
+                   (array('q', [-price for price in reversed(ask_prices)]), array('q', reversed(ask_sizes))))
+
+    def size(self):
+        """Length of to_bytes()."""
+        return HEADER.size + 16 * (len(self._bids[0]) + len(self._asks[0]))
+
+    def book(self, spec=None, depth=0, retain=None):
+        """
+        Rebuild the OrderBook. spec, when given, must have the snapshot's price and size decimals; by default the
+        increments are the smallest the decimals allow.
+        """
+        if spec is None:
+            spec = InstrumentSpec(self.symbol, format_units(1, self.price_decimals), format_units(1, self.size_decimals))
+        elif (spec.price_decimals, spec.size_decimals) != (self.price_decimals, self.size_decimals):
+            raise ValueError("%s snapshot has %d / %d decimals, the instrument %d / %d" % (
+                self.symbol, self.price_decimals, self.size_decimals, spec.price_decimals, spec.size_decimals))
+        bid_prices, bid_sizes, ask_prices, ask_sizes = self.columns()
+        book = OrderBook(self.symbol, self.sequence, zip(bid_prices, bid_sizes), zip(ask_prices, ask_sizes), spec, depth,
+                         retain)
+        if depth:                                       # nothing is known beyond the levels in the snapshot
+            book.bids.seal()
+            book.asks.seal()
+        return book
+
+    def to_bytes(self):
+        bid_prices, bid_sizes, ask_prices, ask_sizes = self.columns()
+        header = HEADER.pack(MAGIC, VERSION, self.price_decimals, self.size_decimals, self.sequence, self.timestamp,
+                             len(bid_prices), len(ask_prices), self.symbol.encode('ascii')[:16])
+        return b''.join((header, bid_prices.tobytes(), bid_sizes.tobytes(), ask_prices.tobytes(), ask_sizes.tobytes()))
+
+
+def write_snapshot(path, snapshot):
+    """Write to a temporary file and rename it over path, so readers only ever see a complete snapshot."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(snapshot.to_bytes())
+    os.replace(tmp_path, path)
+
+
+class MappedSnapshot:
+    """
+    Read-only, memory-mapped snapshot file. The price/size columns are memoryviews of int64 units into the map;
+    bids() and asks() convert them to floats with price_scale and size_scale.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.price_decimals, self.size_decimals, self.sequence, self.timestamp, n_bids, n_asks,
+         symbol) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mmap.close()
+            raise ValueError("%s is not a version %d level2 snapshot file" % (path, VERSION))
+        self.symbol = symbol.rstrip(b'\0').decode('ascii')
+        self.price_scale = 10 ** self.price_decimals
+        self.size_scale = 10 ** self.size_decimals
+        view = memoryview(self._mmap)[HEADER.size:].cast('q')
+        self.bid_prices = view[0:n_bids]
+        self.bid_sizes = view[n_bids:2 * n_bids]
+        self.ask_prices = view[2 * n_bids:2 * n_bids + n_asks]
+        self.ask_sizes = view[2 * n_bids + n_asks:2 * (n_bids + n_asks)]
+        self._view = view
+
+    def _levels(self, prices, sizes):
+        price_scale = self.price_scale
+        size_scale = self.size_scale
+        return [(price / price_scale, size / size_scale) for price, size in zip(prices, sizes)]
+
+    def bids(self):
+        return self._levels(self.bid_prices, self.bid_sizes)
+
+    def asks(self):
+        return self._levels(self.ask_prices, self.ask_sizes)
+
+    def close(self):
+        for column in (self.bid_prices, self.bid_sizes, self.ask_prices, self.ask_sizes, self._view):
+            column.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BookSnapshotWriter(threading.Thread):
+    """
+    Background writer. submit() just records the latest snapshot per (symbol, extension) and returns; the thread
+    writes whatever is pending, so a slow disk coalesces snapshots instead of blocking the books.
+    """
+
+    def __init__(self, directory="books"):
+        super().__init__(name="BookSnapshotWriter", daemon=True)
+        self.directory = directory
+        self.written = 0
+        self.failed = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def path(self, symbol, ext=".BOOKS"):
+        return os.path.join(self.directory, symbol + ext)
+
+    def submit(self, snapshot, ext=".BOOKS"):
+        with self._lock:
+            self._pending[(snapshot.symbol, ext)] = snapshot
+        self._wakeup.set()
+
+    def run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            with self._lock:
+                pending = self._pending
+                self._pending = {}
+            for (symbol, ext), snapshot in pending.items():
+                try:
+                    write_snapshot(self.path(symbol, ext), snapshot)
+                    self.written += 1
+                except OSError as error:
+                    self.failed += 1
+                    logger.warning("BookSnapshotWriter: failed writing %s (%s)", self.path(symbol, ext), error)
+                except Exception:
+                    self.failed += 1
+                    logger.exception("BookSnapshotWriter: failed writing %s", self.path(symbol, ext))
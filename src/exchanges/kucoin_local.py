@@ -2,7 +2,7 @@
 
 import asyncio
 import logging
-import pandas as pd
+import time
 
 from kucoin.ws_token.token import GetToken
 from kucoin.ws_client import KucoinWsClient
@@ -12,9 +12,15 @@ from strategies.breakout import Breakout
 from strategies.mean_reversion import MeanReversion
 from strategies.order_flow import OrderFlow
 from strategies.sma_crossover import SmaCrossover
-from exchanges.kucoin_helpers import KucoinTradingBot
+from exchanges.kucoin_helpers import KucoinTradingBot, get_level2Data, get_order_gateway, parse_level2
+from features.aggregator import BarAggregator
+
+SYMBOLS = 'BTC-USDT,ETH-BTC,SOL-BTC'
 
 class KucoinTrading:
+    # Bars of this timeframe drive the features and strategies
+    timeframe = '5m'
+
     def __init__(self):
         self.trading_bot = KucoinTradingBot()
         self.strategies = {
@@ -23,13 +29,35 @@ class KucoinTrading:
             'trending_down': [Breakout(), SmaCrossover()],
             'range_bound': MeanReversion(),
         }
+        # Latest level2Depth5 book per symbol, as float arrays
+        self.books = {}
+        # 1m/5m/15m/1h bars built from the trade stream; the pipeline timeframe's bars go to the bot's bar history
+        self.aggregator = BarAggregator(on_bar=self.on_bar, stores={self.timeframe: self.trading_bot.bars})
 
     async def deal_msg(self, msg):
         try:
-            df = pd.DataFrame(msg["data"])
-            features = self.trading_bot.get_features(df)
-            level2Data = self.trading_bot.get_level2Data(df)
-            symbol = msg['subject'].split(':')[1]
+            symbol = msg['topic'].split(':')[1]
+            if msg['topic'].startswith('/spotMarket/level2Depth5'):
+                # Parse each book message once; bar closes aggregate the arrays
+                self.books[symbol] = parse_level2(msg['data'])
+            elif msg['topic'].startswith('/market/match'):
+                self.aggregator.on_match(symbol, msg['data'])
+            else:
+                # Last prices for order sizing come from the ticker stream instead of REST
+                self.trading_bot.account.on_ticker(symbol, msg['data'])
+                self.aggregator.on_ticker(symbol, msg['data'])
+        except Exception as e:
+            logging.error('An error occurred while dealing with the message: %s', e)
+
+    def on_bar(self, symbol, timeframe, bar):
+        # Features and strategies run once per closed bar of the pipeline timeframe, not on every message
+        if timeframe != self.timeframe:
+            return
+        try:
+            # the aggregator has appended the bar to the bot's bar history, which the features are read from
+            features = self.trading_bot.update_features(symbol)
+            book = self.books.get(symbol)
+            level2Data = get_level2Data(book) if book is not None else None
 
             market_condition = features['market_condition']
             strategies = self.strategies.get(market_condition)
@@ -45,7 +73,16 @@ class KucoinTrading:
 
             OrderFlow().run(symbol, features, level2Data)
         except Exception as e:
-            logging.error('An error occurred while dealing with the message: %s', e)
+            logging.error('An error occurred while dealing with the %s bar of %s: %s', timeframe, symbol, e)
+
+    async def deal_private_msg(self, msg):
+        try:
+            if msg['topic'] == '/account/balance':
+                self.trading_bot.account.on_balance(msg['data'])
+            elif msg['topic'] == '/spotMarket/tradeOrders':
+                get_order_gateway().on_order_event(msg['data'])
+        except Exception as e:
+            logging.error('An error occurred while dealing with the private message: %s', e)
 
 async def main():
     trading = KucoinTrading()
@@ -54,11 +91,23 @@ async def main():
     token_client = GetToken()   
     ws_client = await KucoinWsClient.create(None, token_client, trading.deal_msg, private=False)
 
-    await ws_client.subscribe('/market/ticker:BTC-USDT,ETH-BTC,SOL-BTC')
-    await ws_client.subscribe('/spotMarket/level2Depth5:BTC-USDT,ETH-BTC,SOL-BTC')
+    # Balance changes keep the account state used for order sizing current, order events the gateway's order table
+    bot = trading.trading_bot
+    private_token_client = GetToken(key=bot.api_key, secret=bot.api_secret, passphrase=bot.api_passphrase)
+    private_ws_client = await KucoinWsClient.create(None, private_token_client, trading.deal_private_msg, private=True)
+    await private_ws_client.subscribe('/account/balance')
+    await private_ws_client.subscribe('/spotMarket/tradeOrders')
+    # From here on every balance change is pushed, so the cached balances no longer expire
+    bot.account.on_balance_stream(True)
+
+    await ws_client.subscribe('/market/ticker:' + SYMBOLS)
+    await ws_client.subscribe('/market/match:' + SYMBOLS)
+    await ws_client.subscribe('/spotMarket/level2Depth5:' + SYMBOLS)
 
     while True:
-        await asyncio.sleep(60)  # Use only the `sleep` function, no need to specify the loop parameter
+        await asyncio.sleep(1)  # Use only the `sleep` function, no need to specify the loop parameter
+        # Close the bars of symbols that have gone quiet
+        trading.aggregator.advance(time.time())
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
@@ -0,0 +1,258 @@
+# kucoin_orders.py
+# Async order gateway: places, cancels and looks up spot orders without blocking the event loop that runs the
+# websocket handlers, and keeps an in-memory table of every order it has sent.
+#
+# Requests go through KucoinRestClient.request_async, so concurrent orders share its pooled keep-alive connections,
+# and every request first takes its endpoint's weight from a token bucket sized to the exchange's spot resource pool
+# (the TokenBucket of kucoin_level2_rest.py). A 429 pauses the bucket for the reset time the exchange returns and the
+# request is retried; it was not processed. Order status is read in bulk where the exchange allows it: the paged list
+# of active orders and the list of recently done orders, with single order lookups only for ids neither list holds.
+#
+# The order table is keyed by clientOid, which is assigned before the request is sent, so /spotMarket/tradeOrders
+# events that beat the REST response still find their order. An order whose request failed ambiguously (timeout or
+# connection error) is looked up by clientOid before it is declared failed; any other failure fails it at once. For
+# testing, point the client's base_url at tests/kucoin_fake_exchange.py.
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
+import aiohttp
+
+from exchanges.kucoin_level2_rest import TokenBucket
+from exchanges.kucoin_rest import KucoinApiError, KucoinRateLimitError
+
+logger = logging.getLogger(__name__)
+
+# Request weights in the spot resource pool (4000 per 30 seconds at VIP 0)
+WEIGHTS = {
+    "POST /api/v1/orders": 2,
+    "DELETE /api/v1/orders/{orderId}": 3,
+    "GET /api/v1/orders": 2,
+    "GET /api/v1/orders/{orderId}": 2,
+    "GET /api/v1/order/client-order/{clientOid}": 2,
+    "GET /api/v1/limit/orders": 3,
+}
+ACTIVE_PAGE_SIZE = 500
+
+PENDING = 'pending'                 # sent, not acknowledged yet
+OPEN = 'open'                       # on the book or being matched
+DONE = 'done'                       # filled or cancelled
+FAILED = 'failed'                   # rejected, or never reached the exchange
+
+
+class Order:
+    """One order the gateway sent, as last reported by the REST response, a status lookup or a private event."""
+
+    __slots__ = ('client_oid', 'order_id', 'symbol', 'side', 'type', 'price', 'size', 'funds', 'filled_size',
+                 'status', 'cancelled', 'error', 'created', 'updated')
+
+    def __init__(self, client_oid, symbol, side, order_type, price=None, size=None, funds=None):
+        self.client_oid = client_oid
+        self.order_id = None
+        self.symbol = symbol
+        self.side = side
+        self.type = order_type
+        self.price = price
+        self.size = size
+        self.funds = funds
+        self.filled_size = 0.0
+        self.status = PENDING
+        self.cancelled = False
+        self.error = None
+        self.created = self.updated = time.time()
+
+    def __repr__(self):
+        return "Order(%s %s %s %s@%s %s filled %s)" % (self.order_id or self.client_oid, self.symbol, self.side,
+                                                       self.size, self.price, self.status, self.filled_size)
+
+
+class OrderGateway:
+    """
+    Async order placement and tracking through client, a KucoinRestClient. place() and cancel() may be called
+    concurrently from any number of tasks; on_order_event() takes the data of /spotMarket/tradeOrders messages.
+    orders holds the orders still pending or open by clientOid; finished ones move to done (the last done_history).
+    """
+
+    def __init__(self, client, weight_per_second=4000 / 30, weight_burst=200, done_history=1000):
+        self.client = client
+        self.bucket = TokenBucket(weight_per_second, weight_burst)
+        self.done_history = done_history
+        self.orders = {}                        # clientOid -> Order, pending or open
+        self.done = OrderedDict()               # clientOid -> Order, finished, oldest first
+        self._by_id = {}                        # orderId -> Order
+        self.sent = 0
+        self.throttled = 0
+
+    # ---- requests -------------------------------------------------------------------------------------------------
+
+    async def _request(self, method, path, endpoint, params=None, body=None):
+        while True:
+            await self.bucket.acquire(WEIGHTS[endpoint])
+            try:
+                self.sent += 1
+                return (await self.client.request_async(method, path, params, body, endpoint=endpoint))["data"]
+            except KucoinRateLimitError as error:
+                self.throttled += 1
+                logger.warning("%s rate limited: pausing %.1f seconds", endpoint, error.reset)
+                self.bucket.pause(error.reset)
+
+    async def place(self, symbol, side, order_type, size=None, price=None, funds=None):
+        """Send an order and return its Order once acknowledged; raises KucoinApiError if it was rejected."""
+        order = Order(uuid.uuid4().hex, symbol, side, order_type, price, size, funds)
+        self.orders[order.client_oid] = order
+        body = {"clientOid": order.client_oid, "side": side, "symbol": symbol, "type": order_type}
+        for key, value in (("size", size), ("price", price), ("funds", funds)):
+            if value is not None:
+                body[key] = str(value)
+        try:
+            data = await self._request("POST", "/api/v1/orders", "POST /api/v1/orders", body=body)
+        except KucoinApiError as error:
+            self._fail(order, error)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            # the order may or may not have reached the exchange
+            found = await self._find(order.client_oid)
+            if found is None:
+                self._fail(order, error)
+                raise
+            self._update(order, found)
+            return order
+        except (Exception, asyncio.CancelledError) as error:
+            # not sent, or its fate is unknown: either way the gateway stops tracking it
+            self._fail(order, error)
+            raise
+        self._acknowledge(order, data["orderId"])
+        return order
+
+    async def place_many(self, orders):
+        """Place [(symbol, side, order_type, size, price)] concurrently. Returns Orders or exceptions, in order."""
+        return await asyncio.gather(*(self.place(symbol, side, order_type, size, price)
+                                      for symbol, side, order_type, size, price in orders), return_exceptions=True)
+
+    async def cancel(self, order_id):
+        await self._request("DELETE", "/api/v1/orders/" + order_id, "DELETE /api/v1/orders/{orderId}")
+
+    async def get_order(self, order_id):
+        data = await self._request("GET", "/api/v1/orders/" + order_id, "GET /api/v1/orders/{orderId}")
+        self._apply(data)
+        return data
+
+    async def _find(self, client_oid):
+        try:
+            return await self._request("GET", "/api/v1/order/client-order/" + client_oid,
+                                       "GET /api/v1/order/client-order/{clientOid}")
+        except (KucoinApiError, aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def get_orders(self, order_ids):
+        """
+        {orderId: order} for order_ids as the REST order endpoints report them: active orders from the paged active
+        order list, recently done ones from the recent order list, and only the rest one by one, concurrently.
+        """
+        wanted = set(order_ids)
+        found = {}
+        page = 1
+        while wanted:
+            data = await self._request("GET", "/api/v1/orders", "GET /api/v1/orders",
+                                       {"status": "active", "pageSize": ACTIVE_PAGE_SIZE, "currentPage": page})
+            self._collect(data["items"], wanted, found)
+            if page >= data["totalPage"]:
+                break
+            page += 1
+        if wanted:
+            self._collect(await self._request("GET", "/api/v1/limit/orders", "GET /api/v1/limit/orders"), wanted,
+                          found)
+        for data in await asyncio.gather(*(self.get_order(order_id) for order_id in wanted)):
+            found[data["id"]] = data
+        return found
+
+    def _collect(self, items, wanted, found):
+        for data in items:
+            if data["id"] in wanted:
+                wanted.discard(data["id"])
+                found[data["id"]] = data
+                self._apply(data)
+
+    # ---- order table ----------------------------------------------------------------------------------------------
+
+    def _acknowledge(self, order, order_id):
+        order.order_id = order_id
+        self._by_id[order_id] = order
+        if order.status == PENDING:
+            order.status = OPEN
+            order.updated = time.time()
+
+    def _fail(self, order, error):
+        order.status = FAILED
+        order.error = error
+        self._finish(order)
+
+    def _finish(self, order):
+        order.updated = time.time()
+        self.orders.pop(order.client_oid, None)
+        self.done[order.client_oid] = order
+        while len(self.done) > self.done_history:
+            _, old = self.done.popitem(last=False)
+            self._by_id.pop(old.order_id, None)
+
+    def _lookup(self, order_id, client_oid):
+        order = self._by_id.get(order_id)
+        if order is None and client_oid:
+            order = self.orders.get(client_oid) or self.done.get(client_oid)
+            if order is not None and order_id:
+                self._acknowledge(order, order_id)
+        return order
+
+    def _update(self, order, data):
+        # a REST order (GET /api/v1/orders/{orderId} and the order lists)
+        if order.order_id is None:
+            self._acknowledge(order, data["id"])
+        if data.get("isActive") and order.status in (DONE, FAILED):
+            return                              # a stale list: the order has already finished
+        order.filled_size = float(data.get("dealSize") or 0)
+        order.cancelled = bool(data.get("cancelExist"))
+        if data.get("isActive"):
+            order.status = OPEN
+            order.updated = time.time()
+        elif order.status != DONE:
+            order.status = DONE
+            self._finish(order)
+
+    def _apply(self, data):
+        order = self._lookup(data.get("id"), data.get("clientOid"))
+        if order is not None:
+            self._update(order, data)
+
+    def on_order_event(self, data):
+        """A /spotMarket/tradeOrders event's data: order received, opened, matched, updated, filled or cancelled."""
+        order = self._lookup(data.get("orderId"), data.get("clientOid"))
+        if order is None:
+            return                              # not sent by this gateway
+        if data.get("status") != "done" and order.status in (DONE, FAILED):
+            return                              # arrived after the order was reported finished
+        if data.get("filledSize") is not None:
+            order.filled_size = float(data["filledSize"])
+        if data.get("type") == "canceled":
+            order.cancelled = True
+        if data.get("status") == "done":
+            if order.status != DONE:
+                order.status = DONE
+                self._finish(order)
+        else:
+            order.status = OPEN
+            order.updated = time.time()
+
+    def open_orders(self, symbol=None):
+        """Orders acknowledged and not finished, optionally only symbol's."""
+        return [order for order in self.orders.values()
+                if order.status == OPEN and (symbol is None or order.symbol == symbol)]
+
+    def in_flight(self):
+        """Orders sent and not acknowledged yet."""
+        return [order for order in self.orders.values() if order.status == PENDING]
+
+    def order(self, order_id):
+        return self._by_id.get(order_id)
@@ -0,0 +1,262 @@
+# kucoin_rest.py
+# Signed Kucoin REST client shared by the level2 program and KucoinTradingBot.
+#
+# Credentials are loaded and decoded once and the signed passphrase is computed up front, so signing a request is a
+# single HMAC. Sync calls go through one pooled requests.Session and async calls through one aiohttp session, so
+# connections (and their TLS sessions) are reused instead of being set up on every call. Every call's latency is
+# recorded per endpoint.
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+KUCOIN_API_URL = "https://api.kucoin.com"
+SUCCESS = "200000"
+
+
+class KucoinApiError(Exception):
+    """A request the exchange answered with an HTTP error or a code other than 200000."""
+
+    def __init__(self, endpoint, status, code=None, msg=None):
+        super().__init__("%s failed: HTTP %s, code %s (%s)" % (endpoint, status, code, msg))
+        self.endpoint = endpoint
+        self.status = status
+        self.code = code
+        self.msg = msg
+
+
+class KucoinRateLimitError(KucoinApiError):
+    """HTTP 429. reset is the number of seconds until the exchange's rate limit window resets."""
+
+    def __init__(self, endpoint, reset):
+        super().__init__(endpoint, 429, msg="rate limited for %.3f seconds" % reset)
+        self.reset = reset
+
+
+class KucoinCredentials:
+    """API key, secret and passphrase, with the secret encoded and the passphrase signed once."""
+
+    def __init__(self, api_key, api_secret, api_passphrase):
+        self.api_key = api_key
+        self.secret = api_secret.encode('utf-8')
+        self.passphrase = base64.b64encode(
+            hmac.new(self.secret, api_passphrase.encode('utf-8'), hashlib.sha256).digest()).decode('utf-8')
+
+    @classmethod
+    def from_files(cls, key_path, secret_path, passphrase_path):
+        """The level2 program's key files: the key in plain text, the secret and passphrase as b'<base64>' strings."""
+        def decode(path):
+            return str(base64.b64decode(bytes(open(path).read().strip()[2:-1], 'utf-8')), 'utf-8')
+        return cls(open(key_path).read().strip(), decode(secret_path), decode(passphrase_path))
+
+    @classmethod
+    def from_env(cls):
+        return cls(os.getenv("KUCOIN_API_KEY"), os.getenv("KUCOIN_API_SECRET"), os.getenv("KUCOIN_API_PASSPHRASE"))
+
+    def headers(self, method, path, body=""):
+        """KC-API headers for a request; path includes the query string and body is the exact JSON sent."""
+        nonce = str(int(time.time() * 1000))
+        signature = hmac.new(self.secret, (nonce + method + path + body).encode('utf-8'), hashlib.sha256).digest()
+        return {
+            "KC-API-SIGN": base64.b64encode(signature).decode('utf-8'),
+            "KC-API-TIMESTAMP": nonce,
+            "KC-API-KEY": self.api_key,
+            "KC-API-PASSPHRASE": self.passphrase,
+            "KC-API-KEY-VERSION": "2",
+        }
+
+
+class EndpointLatency:
+    """Call count, error count and min / mean / max / last latency in seconds for one endpoint."""
+
+    __slots__ = ('count', 'errors', 'total', 'min', 'max', 'last')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds, error=False):
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+        self.min = seconds if self.min is None else min(self.min, seconds)
+
+    def as_dict(self):
+        return {'count': self.count, 'errors': self.errors, 'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+                'min_ms': (self.min or 0.0) * 1000, 'max_ms': self.max * 1000, 'last_ms': self.last * 1000}
+
+
+class KucoinRestClient:
+    """
+    Kucoin REST client. request() is blocking and thread safe; request_async() is its asyncio counterpart. Both
+    return the decoded response envelope ({"code": "200000", "data": ...}) and raise KucoinApiError otherwise.
+    credentials may be None for public endpoints only.
+    """
+
+    def __init__(self, credentials=None, base_url=KUCOIN_API_URL, timeout=10, pool_size=8):
+        self.credentials = credentials
+        self.base_url = base_url
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.latency = {}
+        self._latency_lock = threading.Lock()
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._async_session = None
+
+    @staticmethod
+    def _path(path, params):
+        if params:
+            path += "?" + "&".join("%s=%s" % item for item in params.items())
+        return path
+
+    def _prepare(self, method, path, params, body, signed):
+        path = self._path(path, params)
+        data = json.dumps(body) if body is not None else ""
+        headers = {"Content-Type": "application/json"} if data else {}
+        if signed:
+            headers.update(self.credentials.headers(method, path, data))
+        return path, data, headers
+
+    def _record(self, endpoint, start, error):
+        elapsed = time.perf_counter() - start
+        with self._latency_lock:
+            stats = self.latency.get(endpoint)
+            if stats is None:
+                stats = self.latency[endpoint] = EndpointLatency()
+            stats.record(elapsed, error)
+
+    @staticmethod
+    def _check(endpoint, status, headers, response):
+        if status == 429:
+            raise KucoinRateLimitError(endpoint, float(headers.get("gw-ratelimit-reset", 1000)) / 1000)
+        if not isinstance(response, dict) or response.get("code") != SUCCESS:
+            code, msg = (response.get("code"), response.get("msg")) if isinstance(response, dict) else (None, response)
+            raise KucoinApiError(endpoint, status, code, msg)
+        return response
+
+    def request(self, method, path, params=None, body=None, signed=True, endpoint=None):
+        """
+        Send a request and return the response envelope. endpoint names the latency bucket and defaults to
+        "METHOD path"; pass a template such as "GET /api/v1/orders/{orderId}" for paths that embed ids.
+        """
+        endpoint = endpoint or method + " " + path
+        path, data, headers = self._prepare(method, path, params, body, signed)
+        start = time.perf_counter()
+        error = True
+        try:
+            response = self._session.request(method, self.base_url + path, data=data or None, headers=headers,
+                                             timeout=self.timeout)
+            try:
+                decoded = response.json()
+            except ValueError:
+                decoded = response.text
+            result = self._check(endpoint, response.status_code, response.headers, decoded)
+            error = False
+            return result
+        finally:
+            self._record(endpoint, start, error)
+
+    async def _open_async(self):
+        if self._async_session is None or self._async_session.closed:
+            self._async_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size),
+                                                        timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._async_session
+
+    async def request_async(self, method, path, params=None, body=None, signed=True, endpoint=None):
+        """asyncio version of request(); the aiohttp session is opened on first use in the running event loop."""
+        endpoint = endpoint or method + " " + path
+        path, data, headers = self._prepare(method, path, params, body, signed)
+        session = await self._open_async()
+        start = time.perf_counter()
+        error = True
+        try:
+            async with session.request(method, self.base_url + path, data=data or None, headers=headers) as response:
+                text = await response.text()
+                try:
+                    decoded = json.loads(text)
+                except ValueError:
+                    decoded = text
+                result = self._check(endpoint, response.status, response.headers, decoded)
+            error = False
+            return result
+        finally:
+            self._record(endpoint, start, error)
+
+    async def close_async(self):
+        if self._async_session is not None:
+            await self._async_session.close()
+            self._async_session = None
+
+    def close(self):
+        self._session.close()
+
+    def latency_stats(self):
+        """Return {endpoint: {count, errors, mean_ms, min_ms, max_ms, last_ms}}."""
+        with self._latency_lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self.latency.items()}
+
+    # ---- endpoints ----------------------------------------------------------------------------------------------
+    # These return the "data" member of the response, like the kucoin SDK clients they replace.
+
+    def get_public_token(self):
+        return self.request("POST", "/api/v1/bullet-public", signed=False)["data"]
+
+    def get_symbols(self, market=None):
+        return self.request("GET", "/api/v2/symbols", {"market": market} if market else None, signed=False)["data"]
+
+    def get_symbol(self, symbol):
+        return self.request("GET", "/api/v2/symbols/" + symbol, signed=False,
+                            endpoint="GET /api/v2/symbols/{symbol}")["data"]
+
+    def get_full_order_book(self, symbol):
+        return self.request("GET", "/api/v3/market/orderbook/level2", {"symbol": symbol})["data"]
+
+    def get_ticker(self, symbol):
+        return self.request("GET", "/api/v1/market/orderbook/level1", {"symbol": symbol}, signed=False)["data"]
+
+    def get_accounts(self, currency=None, account_type=None):
+        params = {key: value for key, value in (("currency", currency), ("type", account_type)) if value}
+        return self.request("GET", "/api/v1/accounts", params)["data"]
+
+    async def get_ticker_async(self, symbol):
+        return (await self.request_async("GET", "/api/v1/market/orderbook/level1", {"symbol": symbol},
+                                         signed=False))["data"]
+
+    async def get_accounts_async(self, currency=None, account_type=None):
+        params = {key: value for key, value in (("currency", currency), ("type", account_type)) if value}
+        return (await self.request_async("GET", "/api/v1/accounts", params))["data"]
+
+    def create_order(self, symbol, side, order_type, size=None, price=None, funds=None, client_oid=None):
+        body = {"clientOid": client_oid or uuid.uuid4().hex,
+                "side": side, "symbol": symbol, "type": order_type}
+        for key, value in (("size", size), ("price", price), ("funds", funds)):
+            if value is not None:
+                body[key] = str(value)
+        return self.request("POST", "/api/v1/orders", body=body)["data"]
+
+    def create_market_order(self, symbol, side, size=None, funds=None):
+        return self.create_order(symbol, side, "market", size=size, funds=funds)
+
+    def create_limit_order(self, symbol, side, price, size):
+        return self.create_order(symbol, side, "limit", size=size, price=price)
+
+    def get_order(self, order_id):
+        return self.request("GET", "/api/v1/orders/" + order_id, endpoint="GET /api/v1/orders/{orderId}")["data"]
@@ -0,0 +1,97 @@
+# aggregator.py
+# Builds OHLCV time bars of several timeframes at once from the trades of every subscribed symbol, for the live path
+# that only receives the /market/match and /market/ticker streams. Each trade updates the open bar of every timeframe
+# in place; a bar closes when a trade of its symbol falls in a later interval, or when advance() is called with a time
+# past its end (the timer for quiet symbols). A closed bar is appended to the timeframe's BarStore (bars.py) and passed
+# to on_bar, so consumers run once per bar instead of once per message.
+#
+# Bars start on interval boundaries of the exchange's trade timestamps (UTC). An interval without trades has no bar:
+# nothing is filled in for it. A trade in an interval whose bar has already closed arrived too late and is left out
+# of that bar (counted in late). The ticker stream carries the symbol's last trade once per push, at most every 100ms,
+# so it only feeds bars of symbols with no match stream; with one, the ticker is ignored so no trade counts twice.
+
+import math
+
+from features.bars import BarStore
+
+TIMEFRAMES = {'1m': 60, '5m': 300, '15m': 900, '1h': 3600}
+
+
+class BarAggregator:
+    """
+    Open bars of timeframes (names from TIMEFRAMES) per symbol. on_bar(symbol, timeframe, bar) is called for each
+    closed bar, bar being (time, open, high, low, close, volume) with time its start in seconds. stores maps
+    timeframes to the BarStore their closed bars go to, created with capacity bars per symbol unless given. advance()
+    leaves grace seconds after a bar's end for its last trades to arrive.
+    """
+
+    def __init__(self, timeframes=tuple(TIMEFRAMES), on_bar=None, capacity=1024, stores=None, grace=2.0):
+        self.timeframes = tuple(timeframes)
+        self.seconds = tuple(TIMEFRAMES[timeframe] for timeframe in self.timeframes)
+        self.on_bar = on_bar
+        self.grace = grace
+        self.stores = {timeframe: BarStore(capacity) for timeframe in self.timeframes}
+        self.stores.update(stores or {})
+        self.late = 0
+        self._open = {}                     # symbol -> (open bars, start of the last closed bar), per timeframe
+        self._matched = set()               # symbols fed by the match stream
+
+    def on_trade(self, symbol, time, price, size):
+        """One trade of symbol at time (seconds since the epoch)."""
+        state = self._open.get(symbol)
+        if state is None:
+            state = self._open[symbol] = ([None] * len(self.timeframes), [-math.inf] * len(self.timeframes))
+        bars, closed = state
+        late = False
+        for i, seconds in enumerate(self.seconds):
+            start = math.floor(time / seconds) * seconds
+            bar = bars[i]
+            if bar is not None and start == bar[0]:
+                if price > bar[2]:
+                    bar[2] = price
+                elif price < bar[3]:
+                    bar[3] = price
+                bar[4] = price
+                bar[5] += size
+            elif start <= closed[i] or (bar is not None and start < bar[0]):
+                late = True
+            else:
+                if bar is not None:
+                    self._close(symbol, state, i)
+                bars[i] = [start, price, price, price, price, size]
+        if late:
+            self.late += 1
+
+    def on_match(self, symbol, data):
+        """A /market/match message's data."""
+        self._matched.add(symbol)
+        self.on_trade(symbol, int(data['time']) / 1e9, float(data['price']), float(data['size']))
+
+    def on_ticker(self, symbol, data):
+        """A /market/ticker message's data: the last trade, used for symbols without a match stream."""
+        if symbol not in self._matched:
+            self.on_trade(symbol, data['time'] / 1e3, float(data['price']), float(data['size']))
+
+    def advance(self, now):
+        """Close every open bar that ended more than grace seconds before now (seconds since the epoch)."""
+        for symbol, state in self._open.items():
+            bars = state[0]
+            for i, seconds in enumerate(self.seconds):
+                if bars[i] is not None and bars[i][0] + seconds + self.grace <= now:
+                    self._close(symbol, state, i)
+
+    def _close(self, symbol, state, i):
+        bars, closed = state
+        bar = tuple(bars[i])
+        bars[i] = None
+        closed[i] = bar[0]
+        timeframe = self.timeframes[i]
+        self.stores[timeframe].append(symbol, *bar)
+        if self.on_bar is not None:
+            self.on_bar(symbol, timeframe, bar)
+
+    def open_bar(self, symbol, timeframe):
+        """The symbol's bar in progress as (time, open, high, low, close, volume), or None."""
+        state = self._open.get(symbol)
+        bar = state[0][self.timeframes.index(timeframe)] if state is not None else None
+        return tuple(bar) if bar is not None else None
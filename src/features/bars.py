@@ -0,0 +1,86 @@
+# bars.py
+# Fixed-capacity bar history per symbol for the live path, in place of building a DataFrame from every websocket
+# message. A BarBuffer keeps the last capacity bars of one symbol in preallocated float64 arrays, so appending a bar is
+# a constant-time write and memory per symbol stays the same however long the bot runs.
+#
+# The arrays are twice the capacity and every bar is written twice, capacity apart, so the latest n bars are always
+# one contiguous slice: window() and the column accessors return views of the buffer, not copies. A view stays valid
+# until capacity more bars have been appended; copy it to keep it longer.
+
+import numpy as np
+
+COLUMNS = ('time', 'open', 'high', 'low', 'close', 'volume')
+TIME, OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(COLUMNS))
+
+
+class BarBuffer:
+    """The last capacity OHLCV bars of one symbol, oldest first. len() is the number of bars held."""
+
+    __slots__ = ('symbol', 'capacity', 'appended', '_data', '_pos')
+
+    def __init__(self, symbol=None, capacity=1024):
+        self.symbol = symbol
+        self.capacity = capacity
+        self.appended = 0                   # bars appended in total, also the index of the next bar
+        self._data = np.full((len(COLUMNS), 2 * capacity), np.nan)
+        self._pos = 0
+
+    def __len__(self):
+        return min(self.appended, self.capacity)
+
+    def append(self, time, open, high, low, close, volume):
+        bar = (time, open, high, low, close, volume)
+        self._data[:, self._pos] = bar
+        self._data[:, self._pos + self.capacity] = bar
+        self._pos = (self._pos + 1) % self.capacity
+        self.appended += 1
+
+    def window(self, n=None):
+        """The latest n bars (all held by default) as a (columns, n) view, rows in COLUMNS order."""
+        n = len(self) if n is None else min(n, len(self))
+        end = self._pos + self.capacity
+        return self._data[:, end - n:end]
+
+    def column(self, name, n=None):
+        return self.window(n)[COLUMNS.index(name)]
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def last(self):
+        """The latest bar as a dict, or None before the first."""
+        if not self.appended:
+            return None
+        return dict(zip(COLUMNS, self._data[:, self._pos + self.capacity - 1].tolist()))
+
+    def clear(self):
+        self._data.fill(np.nan)
+        self._pos = 0
+        self.appended = 0
+
+
+class BarStore:
+    """One BarBuffer per symbol, created on its first bar."""
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._buffers = {}
+
+    def buffer(self, symbol):
+        buffer = self._buffers.get(symbol)
+        if buffer is None:
+            buffer = self._buffers[symbol] = BarBuffer(symbol, self.capacity)
+        return buffer
+
+    __getitem__ = buffer
+
+    def __contains__(self, symbol):
+        return symbol in self._buffers
+
+    def symbols(self):
+        return list(self._buffers)
+
+    def append(self, symbol, time, open, high, low, close, volume):
+        buffer = self.buffer(symbol)
+        buffer.append(time, open, high, low, close, volume)
+        return buffer
@@ -0,0 +1,61 @@
+# cache.py
+# Memoized indicator values shared by everything that evaluates one bar: the feature builder, the market condition
+# classifier and any strategy that asks for an indicator. Values are keyed by symbol, bar index, indicator name and
+# parameters, so within one evaluation each indicator is computed once whoever asks first.
+#
+# Only the latest bar of each symbol is kept: when a symbol moves to a new bar its entries for the previous one are
+# dropped, which bounds the cache to (symbols x indicators) entries. The FeatureEngine of a symbol publishes every
+# value it computes for a bar, so a later lookup of the same indicator on that bar is a hit without any computation.
+#
+# Names and parameters (the value for the bar):
+#   ('ema', (period,)), ('sma', (period,)), ('rsi', (period,)), ('atr', (period,)), ('momentum', (period,)),
+#   ('volatility', (window,)), ('vwap', ())                                                       a float
+#   ('bbands', (period, nbdevup, nbdevdn))      (upper, middle, lower)
+#   ('macd', (fast, slow, signal))              (macd, signal, histogram)
+#   ('aroon', (period,))                        (up, down, oscillator)
+
+
+class IndicatorCache:
+    """Latest-bar indicator values per symbol, with hit and miss counters."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._bars = {}                     # symbol -> (bar index, {(name, params): value})
+
+    def _values(self, symbol, bar):
+        entry = self._bars.get(symbol)
+        if entry is None or entry[0] != bar:
+            if entry is not None and entry[0] > bar:
+                return None                 # an older bar than the cached one: computed but never cached
+            entry = self._bars[symbol] = (bar, {})
+        return entry[1]
+
+    def get(self, symbol, bar, name, params, compute):
+        """The value of indicator name(*params) for symbol's bar, calling compute() to produce it on a miss."""
+        values = self._values(symbol, bar)
+        key = (name, params)
+        if values is not None and key in values:
+            self.hits += 1
+            return values[key]
+        self.misses += 1
+        value = compute()
+        if values is not None:
+            values[key] = value
+        return value
+
+    def publish(self, symbol, bar, values):
+        """Replace symbol's cached values with values ({(name, params): value}) computed for bar."""
+        self._bars[symbol] = (bar, values)
+
+    def clear(self, symbol=None):
+        if symbol is None:
+            self._bars.clear()
+        else:
+            self._bars.pop(symbol, None)
+
+    def stats(self):
+        """Return {hits, misses, hit_rate, symbols, entries}."""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'symbols': len(self._bars), 'entries': sum(len(values) for _, values in self._bars.values())}
@@ -0,0 +1,194 @@
+# engine.py
+# Per-symbol streaming feature engine for the live path. A FeatureEngine owns one instance of every indicator in
+# indicators.py and turns each new bar into the feature dict KucoinTradingBot.get_features() used to rebuild from the
+# whole history with TA-Lib on every message; update() only touches the new bar, so its cost no longer grows with
+# the history. FeatureEngines keeps one engine per symbol.
+#
+# With an IndicatorCache (cache.py) each engine publishes its indicator values for the bar it just processed, so the
+# market condition classifier and strategies asking for one of them on the same bar get it without recomputing.
+
+import math
+
+from config import trading_variables as tv
+from features.indicators import (ATR, EMA, MACD, RSI, SMA, VWAP, Aroon, BollingerBands, Momentum, Range, Volatility,
+                                 nan)
+
+EMA_PERIODS = (10, 30, 50, 100, 200)
+MARKET_CONDITIONS = ('bullish', 'bearish', 'trending_up', 'trending_down', 'range_bound', 'high_volatility',
+                     'low_volatility', 'low_volume', 'sideways')
+
+
+def classify_market(close, rsi, ema50, ema100, upper_band, lower_band, atr, volume):
+    """The market condition the strategies are chosen by, from the latest bar's indicator values."""
+    if rsi > 70:
+        return 'bullish'
+    if rsi < 30:
+        return 'bearish'
+    if ema50 > ema100:
+        return 'trending_up'
+    if ema50 < ema100:
+        return 'trending_down'
+    if close > upper_band or close < lower_band:
+        return 'range_bound'
+    if atr > close * 0.01:
+        return 'high_volatility'
+    if atr < close * 0.005:
+        return 'low_volatility'
+    if volume < 10000:
+        return 'low_volume'
+    return 'sideways'
+
+
+class FeatureEngine:
+    """
+    Streaming features of one symbol. update() takes the next bar and returns the features after it; features holds
+    the latest ones. Indicator values are nan until they have enough bars, like the TA-Lib output they replace.
+    """
+
+    def __init__(self, symbol, variables=None, cache=None):
+        variables = tv if variables is None else variables
+        self.symbol = symbol
+        self.cache = cache
+        self.bars = 0
+        self.features = None
+        self.emas = {period: EMA(period) for period in EMA_PERIODS}
+        self.short_sma = SMA(variables['short_sma'])
+        self.long_sma = SMA(variables['long_sma'])
+        self.last4prices = SMA(4)
+        self.vwap = VWAP()
+        self.momentum = Momentum(10)
+        self.volatility = Volatility(10)
+        self.bands = BollingerBands(variables['bbands_Period'], 2, 2)
+        self.rsi = RSI(variables['rsi_Period'])
+        self.atr = ATR(variables['atr_Period'])
+        self.macd = MACD(variables['macd_Fast'], variables['macd_Slow'], variables['macd_Signal'])
+        self.aroon = Aroon(variables['aroon_Period'])
+        self.range = Range(variables['support_resistance_Period'])
+        self._volume = nan
+        self._max_macd = -math.inf
+        self._max_rsi = -math.inf
+
+    def update(self, high, low, close, volume):
+        previous_rsi = self.rsi.value
+        previous_macd = self.macd.macd
+        for ema in self.emas.values():
+            ema.update(close)
+        rsi = self.rsi.update(close)
+        atr = self.atr.update(high, low, close)
+        macd, macd_signal, macd_hist = self.macd.update(close)
+        upper_band, middle_band, lower_band = self.bands.update(close)
+        aroon_up, aroon_down, aroon_osc = self.aroon.update(high, low)
+        ema50 = self.emas[50].value
+        ema100 = self.emas[100].value
+
+        long_position = ema50 > ema100
+        short_position = ema50 < ema100
+        if long_position:
+            stop_loss = close - 2 * atr
+        elif short_position:
+            stop_loss = close + 2 * atr
+        else:
+            stop_loss = None
+
+        # support and resistance are the extremes of the bars before this one, so this bar can break through them
+        support, resistance = self.range.value
+        self.range.update(high, low)
+        if macd > self._max_macd:
+            self._max_macd = macd
+        if rsi > self._max_rsi:
+            self._max_rsi = rsi
+        # relative to the highest MACD and RSI so far; undefined while either has not been above zero
+        if self._max_macd > 0 and self._max_rsi > 0:
+            signal_strength = (macd / self._max_macd) * 0.5 + (rsi / self._max_rsi) * 0.5
+        else:
+            signal_strength = nan
+        order_flow = volume - self._volume
+        self._volume = volume
+        self.bars += 1
+
+        self.features = {
+            'symbol': self.symbol,
+            'price': close,
+            'last4prices': self.last4prices.update(close),
+            'ema10': self.emas[10].value,
+            'ema30': self.emas[30].value,
+            'ema50': ema50,
+            'ema100': ema100,
+            'ema200': self.emas[200].value,
+            'vwap': self.vwap.update(high, low, close, volume),
+            'momentum': self.momentum.update(close),
+            'historical_volatility': self.volatility.update(close),
+            'rsi': rsi,
+            'atr': atr,
+            'macd': macd,
+            'macd_signal': macd_signal,
+            'macd_hist': macd_hist,
+            'long_position': long_position,
+            'shortPos': short_position,
+            'bullish_divergence': rsi > 50 and macd > previous_macd and rsi < previous_rsi,
+            'bearish_divergence': rsi < 50 and macd < previous_macd and rsi > previous_rsi,
+            'upper_band': upper_band,
+            'middle_band': middle_band,
+            'lower_band': lower_band,
+            'out_of_band': close > upper_band or close < lower_band,
+            'aroon_up': aroon_up,
+            'aroon_down': aroon_down,
+            'aroonosc': aroon_osc,
+            'support': support,
+            'resistance': resistance,
+            'above_resistance': close > resistance,
+            'below_resistance': close < resistance,
+            'below_support': close < support,
+            'signal_strength': signal_strength,
+            'stop_loss': stop_loss,
+            'market_condition': classify_market(close, rsi, ema50, ema100, upper_band, lower_band, atr, volume),
+            'order_flow': order_flow,
+            'short_sma': self.short_sma.update(close),
+            'long_sma': self.long_sma.update(close),
+        }
+        if self.cache is not None:
+            self.cache.publish(self.symbol, self.bars - 1, self.indicators())
+        return self.features
+
+    def indicators(self):
+        """The current indicator values keyed as in IndicatorCache: {(name, params): value}."""
+        values = {('ema', (period,)): ema.value for period, ema in self.emas.items()}
+        for sma in (self.short_sma, self.long_sma, self.last4prices):
+            values['sma', (sma.period,)] = sma.value
+        values['rsi', (self.rsi.period,)] = self.rsi.value
+        values['atr', (self.atr.period,)] = self.atr.value
+        values['momentum', (self.momentum.period,)] = self.momentum.value
+        values['volatility', (self.volatility.window,)] = self.volatility.value
+        values['vwap', ()] = self.vwap.value
+        values['bbands', (self.bands.period, self.bands.nbdevup, self.bands.nbdevdn)] = self.bands.value
+        values['macd', (self.macd.fast, self.macd.slow, self.macd.signal_period)] = self.macd.value
+        values['aroon', (self.aroon.period,)] = self.aroon.value
+        return values
+
+
+class FeatureEngines:
+    """One FeatureEngine per symbol, created on the symbol's first bar, all publishing to cache if given."""
+
+    def __init__(self, variables=None, cache=None):
+        self.variables = variables
+        self.cache = cache
+        self.engines = {}
+
+    def engine(self, symbol):
+        engine = self.engines.get(symbol)
+        if engine is None:
+            engine = self.engines[symbol] = FeatureEngine(symbol, self.variables, self.cache)
+        return engine
+
+    def reset(self, symbol):
+        self.engines.pop(symbol, None)
+        if self.cache is not None:
+            self.cache.clear(symbol)
+
+    def update(self, symbol, high, low, close, volume):
+        return self.engine(symbol).update(high, low, close, volume)
+
+    def features(self, symbol):
+        """The latest features of symbol, or None before its first bar."""
+        engine = self.engines.get(symbol)
+        return engine.features if engine is not None else None
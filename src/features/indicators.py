@@ -0,0 +1,382 @@
+# indicators.py
+# Streaming technical indicators for the live feature path. Each indicator keeps only the state its next value needs,
+# so update() with the next bar (or tick) costs O(1) however long the history is.
+#
+# Values follow TA-Lib's default (non-Metastock) definitions step for step -- SMA seeded EMAs, Wilder smoothed RSI
+# and ATR, population standard deviation Bollinger Bands, newest-wins ties in Aroon -- so fed the same history they
+# reproduce the TA-Lib function of the same name, including nan for the bars TA-Lib leaves unset. Volatility has no
+# TA-Lib counterpart and matches the pandas expression get_features() used.
+
+import math
+from collections import deque
+
+nan = math.nan
+
+
+class SMA:
+    """Simple moving average (TA-Lib SMA)."""
+
+    __slots__ = ('period', 'value', '_window', '_sum')
+
+    def __init__(self, period):
+        self.period = period
+        self.value = nan
+        self._window = deque()
+        self._sum = 0.0
+
+    def update(self, x):
+        self._window.append(x)
+        self._sum += x
+        if len(self._window) == self.period:
+            self.value = self._sum / self.period
+            self._sum -= self._window.popleft()         # TA-Lib's order: add, average, then drop the trailing value
+        return self.value
+
+
+class EMA:
+    """Exponential moving average seeded with the SMA of its first period values (TA-Lib EMA)."""
+
+    __slots__ = ('period', 'k', 'value', '_count', '_sum')
+
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.value = nan
+        self._count = 0
+        self._sum = 0.0
+
+    def seed(self, value):
+        """Start from value instead of the SMA seed (how MACD aligns its fast EMA with the slow one)."""
+        self.value = value
+        self._count = self.period
+
+    def update(self, x):
+        if self._count < self.period:
+            self._count += 1
+            self._sum += x
+            if self._count == self.period:
+                self.value = self._sum / self.period
+            return self.value
+        self.value = (x - self.value) * self.k + self.value
+        return self.value
+
+
+class RSI:
+    """Relative strength index with Wilder's smoothing (TA-Lib RSI)."""
+
+    __slots__ = ('period', 'value', '_count', '_previous', '_gain', '_loss')
+
+    def __init__(self, period=14):
+        self.period = period
+        self.value = nan
+        self._count = 0
+        self._previous = None
+        self._gain = 0.0
+        self._loss = 0.0
+
+    def update(self, x):
+        previous = self._previous
+        self._previous = x
+        if previous is None:
+            return self.value
+        change = x - previous
+        period = self.period
+        if self._count < period:
+            self._count += 1
+            if change < 0:
+                self._loss -= change
+            else:
+                self._gain += change
+            if self._count < period:
+                return self.value
+            self._gain /= period
+            self._loss /= period
+        else:
+            self._gain *= period - 1
+            self._loss *= period - 1
+            if change < 0:
+                self._loss -= change
+            else:
+                self._gain += change
+            self._gain /= period
+            self._loss /= period
+        total = self._gain + self._loss
+        self.value = 100 * (self._gain / total) if total != 0 else 0.0
+        return self.value
+
+
+class ATR:
+    """Average true range with Wilder's smoothing, seeded with the SMA of the first period true ranges (TA-Lib ATR)."""
+
+    __slots__ = ('period', 'value', '_count', '_close', '_sum')
+
+    def __init__(self, period=14):
+        self.period = period
+        self.value = nan
+        self._count = 0
+        self._close = None
+        self._sum = 0.0
+
+    def update(self, high, low, close):
+        previous = self._close
+        self._close = close
+        if previous is None:
+            return self.value
+        true_range = max(high - low, abs(previous - high), abs(previous - low))
+        if self._count < self.period:
+            self._count += 1
+            self._sum += true_range
+            if self._count == self.period:
+                self.value = self._sum / self.period
+            return self.value
+        self.value = (self.value * (self.period - 1) + true_range) / self.period
+        return self.value
+
+
+class MACD:
+    """
+    MACD line, signal line and histogram (TA-Lib MACD). As in TA-Lib the fast EMA is seeded with the SMA of the fast
+    period values that end where the slow EMA's seed ends, and all three are nan until the signal line exists.
+    """
+
+    __slots__ = ('fast', 'slow', 'signal_period', 'macd', 'signal', 'histogram', '_count', '_recent', '_fast', '_slow',
+                 '_signal')
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        if slow < fast:
+            fast, slow = slow, fast
+        self.fast = fast
+        self.slow = slow
+        self.signal_period = signal
+        self.macd = self.signal = self.histogram = nan
+        self._count = 0
+        self._recent = deque(maxlen=fast)
+        self._fast = EMA(fast)
+        self._slow = EMA(slow)
+        self._signal = EMA(signal)
+
+    @property
+    def value(self):
+        return self.macd, self.signal, self.histogram
+
+    def update(self, x):
+        if self._count < self.slow:
+            self._count += 1
+            self._recent.append(x)
+            self._slow.update(x)
+            if self._count < self.slow:
+                return self.value
+            seed = 0.0
+            for value in self._recent:
+                seed += value
+            self._fast.seed(seed / self.fast)
+            self._recent = None
+        else:
+            self._fast.update(x)
+            self._slow.update(x)
+        macd = self._fast.value - self._slow.value
+        signal = self._signal.update(macd)
+        if signal == signal:                            # not nan: the signal line has its seed
+            self.macd = macd
+            self.signal = signal
+            self.histogram = macd - signal
+        return self.value
+
+
+class BollingerBands:
+    """Upper, middle and lower band: SMA +/- nbdev population standard deviations (TA-Lib BBANDS, matype 0)."""
+
+    __slots__ = ('period', 'nbdevup', 'nbdevdn', 'upper', 'middle', 'lower', '_window', '_sum', '_sum2')
+
+    def __init__(self, period=20, nbdevup=2.0, nbdevdn=2.0):
+        self.period = period
+        self.nbdevup = nbdevup
+        self.nbdevdn = nbdevdn
+        self.upper = self.middle = self.lower = nan
+        self._window = deque()
+        self._sum = 0.0
+        self._sum2 = 0.0
+
+    @property
+    def value(self):
+        return self.upper, self.middle, self.lower
+
+    def update(self, x):
+        self._window.append(x)
+        self._sum += x
+        self._sum2 += x * x
+        if len(self._window) == self.period:
+            middle = self._sum / self.period
+            variance = self._sum2 / self.period - middle * middle
+            deviation = math.sqrt(variance) if variance > 0 else 0.0         # rounding can leave it just below 0
+            self.middle = middle
+            self.upper = middle + self.nbdevup * deviation
+            self.lower = middle - self.nbdevdn * deviation
+            trailing = self._window.popleft()
+            self._sum -= trailing
+            self._sum2 -= trailing * trailing
+        return self.value
+
+
+class Aroon:
+    """
+    Aroon up, down and oscillator over the last period + 1 bars (TA-Lib AROON and AROONOSC). The highest high and
+    lowest low are tracked with monotonic deques; on ties the newest bar wins, as in TA-Lib.
+    """
+
+    __slots__ = ('period', 'up', 'down', 'oscillator', '_factor', '_index', '_highs', '_lows')
+
+    def __init__(self, period=14):
+        self.period = period
+        self.up = self.down = self.oscillator = nan
+        self._factor = 100.0 / period
+        self._index = -1
+        self._highs = deque()               # (index, high), highs strictly decreasing from the front
+        self._lows = deque()                # (index, low), lows strictly increasing from the front
+
+    @property
+    def value(self):
+        return self.up, self.down, self.oscillator
+
+    def update(self, high, low):
+        self._index += 1
+        index = self._index
+        highs = self._highs
+        lows = self._lows
+        while highs and highs[-1][1] <= high:
+            highs.pop()
+        highs.append((index, high))
+        while lows and lows[-1][1] >= low:
+            lows.pop()
+        lows.append((index, low))
+        oldest = index - self.period
+        if highs[0][0] < oldest:
+            highs.popleft()
+        if lows[0][0] < oldest:
+            lows.popleft()
+        if oldest >= 0:
+            highest = highs[0][0]
+            lowest = lows[0][0]
+            self.up = self._factor * (self.period - (index - highest))
+            self.down = self._factor * (self.period - (index - lowest))
+            self.oscillator = self._factor * (highest - lowest)
+        return self.value
+
+
+class Range:
+    """Lowest low and highest high of the last period bars (TA-Lib MIN and MAX), tracked with monotonic deques."""
+
+    __slots__ = ('period', 'low', 'high', '_index', '_highs', '_lows')
+
+    def __init__(self, period):
+        self.period = period
+        self.low = self.high = nan
+        self._index = -1
+        self._highs = deque()               # (index, high), highs strictly decreasing from the front
+        self._lows = deque()                # (index, low), lows strictly increasing from the front
+
+    @property
+    def value(self):
+        return self.low, self.high
+
+    def update(self, high, low):
+        self._index += 1
+        index = self._index
+        highs = self._highs
+        lows = self._lows
+        while highs and highs[-1][1] <= high:
+            highs.pop()
+        highs.append((index, high))
+        while lows and lows[-1][1] >= low:
+            lows.pop()
+        lows.append((index, low))
+        oldest = index - self.period + 1
+        if highs[0][0] < oldest:
+            highs.popleft()
+        if lows[0][0] < oldest:
+            lows.popleft()
+        if oldest >= 0:
+            self.low = lows[0][1]
+            self.high = highs[0][1]
+        return self.value
+
+
+class Momentum:
+    """Difference from the value period bars ago (TA-Lib MOM)."""
+
+    __slots__ = ('period', 'value', '_window')
+
+    def __init__(self, period=10):
+        self.period = period
+        self.value = nan
+        self._window = deque(maxlen=period + 1)
+
+    def update(self, x):
+        self._window.append(x)
+        if len(self._window) > self.period:
+            self.value = x - self._window[0]
+        return self.value
+
+
+class Volatility:
+    """
+    Rolling sample standard deviation of the bar to bar returns over window bars, times sqrt(annualize): the same as
+    close.pct_change().rolling(window).std() * np.sqrt(annualize).
+    """
+
+    __slots__ = ('window', 'scale', 'value', '_close', '_returns', '_sum', '_sum2')
+
+    def __init__(self, window=10, annualize=252):
+        self.window = window
+        self.scale = math.sqrt(annualize)
+        self.value = nan
+        self._close = None
+        self._returns = deque()
+        self._sum = 0.0
+        self._sum2 = 0.0
+
+    def update(self, x):
+        previous = self._close
+        self._close = x
+        if previous is None:
+            return self.value
+        change = x / previous - 1
+        self._returns.append(change)
+        self._sum += change
+        self._sum2 += change * change
+        if len(self._returns) > self.window:
+            trailing = self._returns.popleft()
+            self._sum -= trailing
+            self._sum2 -= trailing * trailing
+        n = len(self._returns)
+        if n == self.window and n > 1:
+            variance = (self._sum2 - self._sum * self._sum / n) / (n - 1)
+            self.value = math.sqrt(variance) * self.scale if variance > 0 else 0.0
+        return self.value
+
+
+class VWAP:
+    """Volume weighted average typical price ((high + low + close) / 3), cumulative or over the last window bars."""
+
+    __slots__ = ('window', 'value', '_bars', '_notional', '_volume')
+
+    def __init__(self, window=None):
+        self.window = window
+        self.value = nan
+        self._bars = deque() if window else None
+        self._notional = 0.0
+        self._volume = 0.0
+
+    def update(self, high, low, close, volume):
+        notional = (high + low + close) / 3 * volume
+        self._notional += notional
+        self._volume += volume
+        if self._bars is not None:
+            self._bars.append((notional, volume))
+            if len(self._bars) > self.window:
+                trailing_notional, trailing_volume = self._bars.popleft()
+                self._notional -= trailing_notional
+                self._volume -= trailing_volume
+        if self._volume > 0:
+            self.value = self._notional / self._volume
+        return self.value
@@ -0,0 +1,266 @@
+# panel.py
+# Batch feature computation over a panel of OHLCV bars (symbols x time) for backtests and ML dataset building.
+#
+# load_panel() reads the bar CSVs (config.csv_data by default) into one Panel: 2-D float arrays indexed by symbol and
+# by the union of all the symbols' bar times, nan where a symbol has no bar. panel_features() computes every feature
+# of FeatureEngine for every symbol and bar in one pass and returns a (symbols x time) structured array of
+# FEATURE_DTYPE instead of one 33 column DataFrame per symbol.
+#
+# Each symbol's features are those of its own bar sequence, exactly what a FeatureEngine fed the symbol's bars in
+# order reports after each of them: missing bars are skipped rather than filled. To keep the work vectorized across
+# symbols, each symbol's bars are packed to the front of its row, the indicators run on the packed rows, and the
+# results are scattered back to the bars' times. Window indicators use sliding windows over the whole panel; the
+# recursive ones (EMA, Wilder smoothing) step through time once with all symbols and periods updated together.
+#
+# For an ML design matrix, numpy.lib.recfunctions.structured_to_unstructured(features[fields][panel.valid]) gives
+# one row per bar with the chosen fields as columns.
+
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from config import csv_base_path, csv_data, trading_variables as tv
+from features.engine import EMA_PERIODS, MARKET_CONDITIONS
+
+FLOAT_FEATURES = ('price', 'last4prices') + tuple('ema%d' % period for period in EMA_PERIODS) + (
+    'vwap', 'momentum', 'historical_volatility', 'rsi', 'atr', 'macd', 'macd_signal', 'macd_hist', 'upper_band',
+    'middle_band', 'lower_band', 'aroon_up', 'aroon_down', 'aroonosc', 'support', 'resistance', 'signal_strength',
+    'stop_loss', 'order_flow', 'short_sma', 'long_sma')
+BOOL_FEATURES = ('long_position', 'shortPos', 'bullish_divergence', 'bearish_divergence', 'out_of_band',
+                 'above_resistance', 'below_resistance', 'below_support')
+FEATURE_DTYPE = np.dtype([(name, 'f8') for name in FLOAT_FEATURES] + [(name, '?') for name in BOOL_FEATURES]
+                         + [('market_condition', 'i1')])
+
+
+class Panel:
+    """
+    OHLCV bars of several symbols on a shared time axis: times is a datetime64 array of every bar time, open, high,
+    low, close and volume are (len(symbols), len(times)) float arrays, nan where a symbol has no bar at that time.
+    """
+
+    __slots__ = ('symbols', 'times', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, symbols, times, open, high, low, close, volume):
+        self.symbols = list(symbols)
+        self.times = times
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @property
+    def valid(self):
+        """Boolean (symbols x time) mask of the bars that exist."""
+        return ~np.isnan(self.close)
+
+    def row(self, symbol):
+        return self.symbols.index(symbol)
+
+
+def load_panel(paths=None):
+    """
+    Panel of the bar CSVs at paths (symbol, openTime, openPrice, closePrice, highPrice, lowPrice, volume), by default
+    config.csv_data under config.csv_base_path. Repeated rows for one bar time keep the last.
+    """
+    if paths is None:
+        paths = [os.path.join(csv_base_path, filename) for filename in csv_data]
+    frames = []
+    for path in paths:
+        frame = pd.read_csv(path, parse_dates=['openTime'])
+        frames.append(frame.drop_duplicates('openTime', keep='last').sort_values('openTime'))
+    times = np.unique(np.concatenate([frame['openTime'].values for frame in frames]))
+    columns = {name: np.full((len(frames), len(times)), np.nan)
+               for name in ('openPrice', 'highPrice', 'lowPrice', 'closePrice', 'volume')}
+    for row, frame in enumerate(frames):
+        positions = np.searchsorted(times, frame['openTime'].values)
+        for name, values in columns.items():
+            values[row, positions] = frame[name].values.astype(float)
+    symbols = [frame['symbol'].iloc[0] if len(frame) else os.path.splitext(os.path.basename(path))[0]
+               for frame, path in zip(frames, paths)]
+    return Panel(symbols, times, columns['openPrice'], columns['highPrice'], columns['lowPrice'],
+                 columns['closePrice'], columns['volume'])
+
+
+# ---- vectorized indicators over packed (symbols x bars) rows --------------------------------------------------------
+# Rows hold each symbol's bars from column 0 on, nan after its last bar. Outputs are nan where TA-Lib's would be.
+
+def _shift(x, n):
+    shifted = np.full_like(x, np.nan)
+    shifted[:, n:] = x[:, :-n]
+    return shifted
+
+
+def _window(x, n):
+    """(symbols x bars x n) view of the n bars ending at each bar; bars before the first full window are dropped."""
+    return sliding_window_view(x, n, axis=1)
+
+
+def _rolling(x, n, reduce):
+    out = np.full_like(x, np.nan)
+    if x.shape[1] >= n:
+        out[:, n - 1:] = reduce(_window(x, n), axis=-1)
+    return out
+
+
+def _emas(x, specs):
+    """
+    EMAs of x for specs [(period, start)]: seeded at bar start with the mean of the period bars ending there, as in
+    TA-Lib, then x[t] - ema fed back with k = 2 / (period + 1). Returns (len(specs), symbols, bars).
+    """
+    out = np.full((len(specs),) + x.shape, np.nan)
+    first = min(start for _, start in specs)
+    if first >= x.shape[1]:
+        return out
+    k = np.array([2.0 / (period + 1) for period, _ in specs])[:, None]
+    starts = {}
+    for row, (period, start) in enumerate(specs):
+        if start < x.shape[1]:
+            starts.setdefault(start, []).append((row, x[:, start - period + 1:start + 1].mean(axis=1)))
+    state = np.full((len(specs), x.shape[0]), np.nan)
+    for t in range(first, x.shape[1]):
+        state = (x[:, t] - state) * k + state
+        for row, seed in starts.get(t, ()):
+            state[row] = seed
+        out[:, :, t] = state
+    return out
+
+
+def _wilder(inputs, periods):
+    """
+    Wilder smoothing of inputs (rows x symbols x bars, defined from bar 1 on) with periods per row: the mean of bars
+    1 to period at bar period, then (value * (period - 1) + x) / period. Returns the same shape.
+    """
+    out = np.full_like(inputs, np.nan)
+    periods = np.asarray(periods)
+    first = periods.min()
+    if first >= inputs.shape[2]:
+        return out
+    n = periods[:, None].astype(float)
+    state = np.full(inputs.shape[:2], np.nan)
+    for t in range(first, inputs.shape[2]):
+        state = (state * (n - 1) + inputs[:, :, t]) / n
+        for row in np.flatnonzero(periods == t):
+            state[row] = inputs[row, :, 1:t + 1].mean(axis=1)
+        out[:, :, t] = state
+    return out
+
+
+def _aroon(high, low, period):
+    up, down, oscillator = (np.full_like(high, np.nan) for _ in range(3))
+    if high.shape[1] > period:
+        # age of the highest high / lowest low in the last period + 1 bars, the newest one on ties
+        high_age = np.argmax(_window(high, period + 1)[:, :, ::-1], axis=-1)
+        low_age = np.argmin(_window(low, period + 1)[:, :, ::-1], axis=-1)
+        factor = 100.0 / period
+        up[:, period:] = factor * (period - high_age)
+        down[:, period:] = factor * (period - low_age)
+        oscillator[:, period:] = factor * (low_age - high_age).astype(float)
+    return up, down, oscillator
+
+
+def _classify(close, rsi, ema50, ema100, upper_band, lower_band, atr, volume):
+    """classify_market() on arrays: the MARKET_CONDITIONS index of each bar's condition."""
+    conditions = [rsi > 70, rsi < 30, ema50 > ema100, ema50 < ema100, (close > upper_band) | (close < lower_band),
+                  atr > close * 0.01, atr < close * 0.005, volume < 10000]
+    codes = [MARKET_CONDITIONS.index(name) for name in ('bullish', 'bearish', 'trending_up', 'trending_down',
+                                                         'range_bound', 'high_volatility', 'low_volatility',
+                                                         'low_volume')]
+    return np.select(conditions, codes, MARKET_CONDITIONS.index('sideways')).astype(np.int8)
+
+
+def _compute(high, low, close, volume, variables):
+    out = {'price': close}
+    macd_fast, macd_slow = sorted((variables['macd_Fast'], variables['macd_Slow']))
+    specs = [(period, period - 1) for period in EMA_PERIODS] + [(macd_fast, macd_slow - 1), (macd_slow, macd_slow - 1)]
+    emas = _emas(close, specs)
+    for row, period in enumerate(EMA_PERIODS):
+        out['ema%d' % period] = emas[row]
+    macd = emas[-2] - emas[-1]
+    signal_period = variables['macd_Signal']
+    signal = _emas(macd, [(signal_period, macd_slow + signal_period - 2)])[0]
+    macd[:, :macd_slow + signal_period - 2] = np.nan
+    out['macd'], out['macd_signal'], out['macd_hist'] = macd, signal, macd - signal
+
+    previous_close = _shift(close, 1)
+    change = close - previous_close
+    true_range = np.fmax(high - low, np.fmax(np.abs(previous_close - high), np.abs(previous_close - low)))
+    true_range[:, 0] = np.nan
+    gain_loss_range = _wilder(np.stack([np.where(change > 0, change, 0.0), np.where(change < 0, -change, 0.0),
+                                        true_range]),
+                              [variables['rsi_Period'], variables['rsi_Period'], variables['atr_Period']])
+    gain, loss, atr = gain_loss_range
+    total = gain + loss
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['rsi'] = np.where(total == 0, 0.0, 100 * (gain / total))
+    out['rsi'][np.isnan(total)] = np.nan
+    out['atr'] = atr
+
+    period = variables['bbands_Period']
+    middle = _rolling(close, period, np.mean)
+    deviation = _rolling(close, period, np.std)
+    out['upper_band'], out['middle_band'], out['lower_band'] = middle + 2 * deviation, middle, middle - 2 * deviation
+    out['aroon_up'], out['aroon_down'], out['aroonosc'] = _aroon(high, low, variables['aroon_Period'])
+
+    out['last4prices'] = _rolling(close, 4, np.sum) / 4
+    out['short_sma'] = _rolling(close, variables['short_sma'], np.sum) / variables['short_sma']
+    out['long_sma'] = _rolling(close, variables['long_sma'], np.sum) / variables['long_sma']
+    out['momentum'] = close - _shift(close, 10)
+    returns = close / previous_close - 1
+    out['historical_volatility'] = _rolling(returns, 10, partial(np.std, ddof=1)) * np.sqrt(252)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['vwap'] = np.cumsum((high + low + close) / 3 * volume, axis=1) / np.cumsum(volume, axis=1)
+    out['order_flow'] = volume - _shift(volume, 1)
+    # extremes of the support_resistance_Period bars before each bar
+    period = variables['support_resistance_Period']
+    out['support'] = _shift(_rolling(low, period, np.min), 1)
+    out['resistance'] = _shift(_rolling(high, period, np.max), 1)
+
+    ema50, ema100, rsi = out['ema50'], out['ema100'], out['rsi']
+    out['long_position'] = ema50 > ema100
+    out['shortPos'] = ema50 < ema100
+    out['stop_loss'] = np.where(out['long_position'], close - 2 * atr,
+                                np.where(out['shortPos'], close + 2 * atr, np.nan))
+    previous_rsi, previous_macd = _shift(rsi, 1), _shift(macd, 1)
+    out['bullish_divergence'] = (rsi > 50) & (macd > previous_macd) & (rsi < previous_rsi)
+    out['bearish_divergence'] = (rsi < 50) & (macd < previous_macd) & (rsi > previous_rsi)
+    out['out_of_band'] = (close > out['upper_band']) | (close < out['lower_band'])
+    out['above_resistance'] = close > out['resistance']
+    out['below_resistance'] = close < out['resistance']
+    out['below_support'] = close < out['support']
+    max_macd, max_rsi = np.fmax.accumulate(macd, axis=1), np.fmax.accumulate(rsi, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out['signal_strength'] = np.where((max_macd > 0) & (max_rsi > 0),
+                                          (macd / max_macd) * 0.5 + (rsi / max_rsi) * 0.5, np.nan)
+    out['market_condition'] = _classify(close, rsi, ema50, ema100, out['upper_band'], out['lower_band'], atr, volume)
+    return out
+
+
+def panel_features(panel, variables=None):
+    """
+    Features of every bar of every symbol of panel as a (symbols x time) FEATURE_DTYPE structured array, indicator
+    periods from variables (config.trading_variables by default). Rows of missing bars are nan / False / 'sideways';
+    select the real ones with panel.valid.
+    """
+    variables = tv if variables is None else variables
+    valid = panel.valid
+    # pack each symbol's bars to the front of its row, keeping their order
+    order = np.argsort(~valid, axis=1, kind='stable')
+    packed = [np.take_along_axis(values, order, axis=1) for values in (panel.high, panel.low, panel.close,
+                                                                     panel.volume)]
+    computed = _compute(*packed, variables)
+    packed_valid = np.take_along_axis(valid, order, axis=1)
+    features = np.zeros(valid.shape, FEATURE_DTYPE)
+    for name in FEATURE_DTYPE.names:
+        values = computed[name]
+        if name in FLOAT_FEATURES:
+            values = np.where(packed_valid, values, np.nan)
+        elif name in BOOL_FEATURES:
+            values = values & packed_valid
+        else:
+            values = np.where(packed_valid, values, MARKET_CONDITIONS.index('sideways'))
+        np.put_along_axis(features[name], order, values, axis=1)
+    return features
@@ -0,0 +1,124 @@
+# bench_level2_parser.py
+# Microbenchmark: parse_l2update() against the string-scanning extraction SyncToFeed() used before it.
+#
+# Run from the src directory:
+#   python -m helpers.bench_level2_parser                     (synthetic messages shaped like the live feed)
+#   python -m helpers.bench_level2_parser recorded.txt        (one raw websocket message per line)
+
+import argparse
+import json
+import random
+import time
+
+from exchanges.kucoin_level2_book import BID, ASK
+from exchanges.kucoin_level2_parser import parse_l2update, JSON_BACKEND
+
+
+def legacy_scan(msg):
+    """The pre-parser SyncToFeed() extraction: msg.find() chains plus a substring search per sequence number."""
+    ndx0 = msg.find("sequenceStart") + 15
+    ndx1 = msg[ndx0:].find(",")
+    ndx2 = msg.find("sequenceEnd") + 13
+    ndx3 = msg[ndx2:].find(",")
+    if ndx3 == -1:
+        ndx3 = msg[ndx2:].find("}")
+    seqStartInt = int(msg[ndx0:ndx0 + ndx1])
+    seqEndInt = int(msg[ndx2:ndx2 + ndx3])
+
+    ndx4 = msg.find('"asks":[]')
+    if ndx4 == -1:
+        ndx4 = msg.find('"asks":[[')
+        ndx5 = msg[ndx4:].find("]]")
+        asksStr = msg[ndx4:ndx4 + ndx5 + 2]
+    else:
+        asksStr = '"asks":[]'
+
+    ndx6 = msg.find('"bids":[]')
+    if ndx6 == -1:
+        ndx6 = msg.find('"bids":[[')
+        ndx7 = msg[ndx6:].find("]]")
+        bidsStr = msg[ndx6:ndx6 + ndx7 + 2]
+    else:
+        bidsStr = '"bids":[]'
+
+    changes = []
+    for seqInt in range(seqStartInt, seqEndInt + 1):
+        seq = str(seqInt)
+        if seq in asksStr:
+            ndx8 = asksStr.find(seq)
+            ndx9 = asksStr.rfind("[", 0, ndx8)
+            updateRec = json.loads(asksStr[ndx9:ndx9 + asksStr[ndx9:].find("]") + 1])
+            changes = changes + [[ASK, updateRec]]
+        else:
+            ndx8 = bidsStr.find(seq)
+            ndx9 = bidsStr.rfind("[", 0, ndx8)
+            updateRec = json.loads(bidsStr[ndx9:ndx9 + bidsStr[ndx9:].find("]") + 1])
+            changes = changes + [[BID, updateRec]]
+    return changes
+
+
+def parsed_changes(msg):
+    update = parse_l2update(msg)
+    return [[side, [price, size, str(seq)]] for side, price, size, seq in update]
+
+
+def synthetic_messages(count, max_changes, seed=7):
+    """Messages laid out like the DOT-BTC sample in SyncToFeed(), with 1..max_changes changes each."""
+    rng = random.Random(seed)
+    seq = 11501460
+    messages = []
+    for _ in range(count):
+        n = rng.randint(1, max_changes)
+        seqs = list(range(seq, seq + n))
+        rng.shuffle(seqs)
+        asks, bids = [], []
+        for s in seqs:
+            rec = ["%.8f" % rng.uniform(0.00037, 0.00038), str(rng.choice([0, 50, 150, 1000])), str(s)]
+            (asks if rng.random() < 0.5 else bids).append(rec)
+        data = {"changes": {"asks": asks, "bids": bids}, "sequenceEnd": seq + n - 1, "sequenceStart": seq,
+                "symbol": "DOT-BTC", "time": 1659738043576}
+        messages.append(json.dumps({"type": "message", "tunnelId": "DOT-BTC_books", "topic": "/market/level2:DOT-BTC",
+                                    "subject": "trade.l2update", "data": data}, separators=(',', ':')))
+        seq += n
+    return messages
+
+
+def recorded_messages(path):
+    with open(path) as f:
+        return [line.strip() for line in f if '"trade.l2update"' in line]
+
+
+def time_it(func, messages, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for msg in messages:
+            func(msg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse_l2update() against the legacy SyncToFeed() string scan")
+    parser.add_argument("path", nargs="?", help="file of recorded websocket messages, one per line")
+    parser.add_argument("-n", "--count", type=int, default=20000, help="number of synthetic messages")
+    parser.add_argument("-c", "--max_changes", type=int, default=8, help="max changes per synthetic message")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="timing runs; the best is reported")
+    args = parser.parse_args()
+
+    messages = recorded_messages(args.path) if args.path else synthetic_messages(args.count, args.max_changes)
+    changes = sum(len(parse_l2update(msg)) for msg in messages)
+    mismatches = sum(1 for msg in messages if legacy_scan(msg) != parsed_changes(msg))
+
+    legacy = time_it(legacy_scan, messages, args.repeat)
+    parsed = time_it(parse_l2update, messages, args.repeat)
+
+    print("messages: %d   changes: %d   json backend: %s" % (len(messages), changes, JSON_BACKEND))
+    print("legacy string scan: %8.2f us/msg" % (legacy / len(messages) * 1e6))
+    print("parse_l2update:     %8.2f us/msg   (%.1fx)" % (parsed / len(messages) * 1e6, legacy / parsed))
+    print("messages where the two disagree: %d" % mismatches)
+
+
+if __name__ == "__main__":
+    main()
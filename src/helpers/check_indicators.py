@@ -0,0 +1,152 @@
+# check_indicators.py
+# Parity check for the feature code: the streaming indicators of features/indicators.py against the TA-Lib functions
+# they replace, and the vectorized panel_features() of features/panel.py against FeatureEngine bar for bar.
+#
+# Run from the src directory:
+#   python -m helpers.check_indicators                        (the config.csv_data bar files in src/data)
+#   python -m helpers.check_indicators data/BTC-USDT.csv      (any bar CSVs)
+# The TA-Lib comparison is skipped when talib is not installed. Exits with status 1 on any mismatch.
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import csv_data, trading_variables as tv
+from features.engine import FeatureEngine, MARKET_CONDITIONS
+from features.indicators import (ATR, EMA, MACD, RSI, SMA, VWAP, Aroon, BollingerBands, Momentum, Range,
+                                 Volatility)
+from features.panel import BOOL_FEATURES, FLOAT_FEATURES, load_panel, panel_features
+
+try:
+    import talib
+except ImportError:
+    talib = None
+
+
+def relative_error(values, expected):
+    """Largest relative difference over the bars both have a value for, or inf if they disagree on which bars."""
+    values = np.asarray(values, dtype=float)
+    expected = np.asarray(expected, dtype=float)
+    if not np.array_equal(np.isnan(values), np.isnan(expected)):
+        return math.inf
+    present = ~np.isnan(expected)
+    if not present.any():
+        return 0.0
+    return float(np.max(np.abs(values[present] - expected[present]) / np.maximum(np.abs(expected[present]), 1e-12)))
+
+
+def streamed(indicator, *columns):
+    return np.array([indicator.update(*bar) for bar in zip(*columns)], dtype=float)
+
+
+def indicator_errors(high, low, close, volume):
+    """{name: relative error} of each streaming indicator against its TA-Lib (or pandas) counterpart."""
+    errors = {}
+    for period in sorted({10, 30, 50, 100, 200, tv['short_sma'], tv['long_sma']}):
+        errors['EMA(%d)' % period] = relative_error(streamed(EMA(period), close), talib.EMA(close, period))
+        errors['SMA(%d)' % period] = relative_error(streamed(SMA(period), close), talib.SMA(close, period))
+    period = tv['rsi_Period']
+    errors['RSI(%d)' % period] = relative_error(streamed(RSI(period), close), talib.RSI(close, period))
+    period = tv['atr_Period']
+    errors['ATR(%d)' % period] = relative_error(streamed(ATR(period), high, low, close),
+                                                talib.ATR(high, low, close, period))
+    errors['MOM(10)'] = relative_error(streamed(Momentum(10), close), talib.MOM(close, 10))
+
+    fast, slow, signal = tv['macd_Fast'], tv['macd_Slow'], tv['macd_Signal']
+    ours = streamed(MACD(fast, slow, signal), close)
+    for i, (name, expected) in enumerate(zip(('macd', 'signal', 'hist'), talib.MACD(close, fast, slow, signal))):
+        errors['MACD %s' % name] = relative_error(ours[:, i], expected)
+    period = tv['bbands_Period']
+    ours = streamed(BollingerBands(period, 2, 2), close)
+    for i, (name, expected) in enumerate(zip(('upper', 'middle', 'lower'), talib.BBANDS(close, period, 2, 2, 0))):
+        errors['BBANDS %s' % name] = relative_error(ours[:, i], expected)
+    period = tv['aroon_Period']
+    ours = streamed(Aroon(period), high, low)
+    down, up = talib.AROON(high, low, period)
+    errors['AROON up'] = relative_error(ours[:, 0], up)
+    errors['AROON down'] = relative_error(ours[:, 1], down)
+    errors['AROONOSC'] = relative_error(ours[:, 2], talib.AROONOSC(high, low, period))
+    period = tv['support_resistance_Period']
+    ours = streamed(Range(period), high, low)
+    errors['MIN(%d)' % period] = relative_error(ours[:, 0], talib.MIN(low, period))
+    errors['MAX(%d)' % period] = relative_error(ours[:, 1], talib.MAX(high, period))
+
+    # no TA-Lib counterparts: the pandas expressions get_features() used
+    errors['volatility(10)'] = relative_error(streamed(Volatility(10), close),
+                                              pd.Series(close).pct_change().rolling(10).std().values * np.sqrt(252))
+    typical = (high + low + close) / 3
+    errors['VWAP'] = relative_error(streamed(VWAP(), high, low, close, volume),
+                                    np.cumsum(typical * volume) / np.cumsum(volume))
+    return errors
+
+
+def panel_mismatches(panel, features):
+    """{feature: (symbol, bar time, panel value, engine value)} for the first bar each feature differs on."""
+    mismatches = {}
+    for row, symbol in enumerate(panel.symbols):
+        engine = FeatureEngine(symbol)
+        for column in np.flatnonzero(panel.valid[row]):
+            expected = engine.update(panel.high[row, column], panel.low[row, column], panel.close[row, column],
+                                     panel.volume[row, column])
+            values = features[row, column]
+            for name in FLOAT_FEATURES:
+                value = float(values[name])
+                engine_value = math.nan if expected[name] is None else float(expected[name])
+                if name not in mismatches and relative_error([value], [engine_value]) > 1e-7:
+                    mismatches[name] = (symbol, panel.times[column], value, engine_value)
+            for name in BOOL_FEATURES:
+                if name not in mismatches and bool(values[name]) != bool(expected[name]):
+                    mismatches[name] = (symbol, panel.times[column], bool(values[name]), expected[name])
+            condition = MARKET_CONDITIONS[values['market_condition']]
+            if 'market_condition' not in mismatches and condition != expected['market_condition']:
+                mismatches['market_condition'] = (symbol, panel.times[column], condition, expected['market_condition'])
+    return mismatches
+
+
+def default_paths():
+    data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    return [os.path.join(data, filename) for filename in csv_data]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the streaming indicators against TA-Lib and the panel "
+                                                 "features against FeatureEngine")
+    parser.add_argument("paths", nargs="*", help="bar CSV files (default: config.csv_data in src/data)")
+    parser.add_argument("-t", "--tolerance", type=float, default=1e-9, help="largest relative error accepted")
+    args = parser.parse_args()
+
+    panel = load_panel(args.paths or default_paths())
+    failed = False
+
+    if talib is None:
+        print("talib is not installed: skipping the TA-Lib comparison")
+    else:
+        for row, symbol in enumerate(panel.symbols):
+            valid = panel.valid[row]
+            errors = indicator_errors(panel.high[row, valid], panel.low[row, valid], panel.close[row, valid],
+                                      panel.volume[row, valid])
+            worst = max(errors, key=errors.get)
+            bad = [name for name, error in errors.items() if error > args.tolerance]
+            failed |= bool(bad)
+            print("%-10s %6d bars  %d indicators  worst %s %.3g%s" % (
+                symbol, valid.sum(), len(errors), worst, errors[worst], "  MISMATCH: " + ", ".join(bad) if bad else ""))
+
+    start = time.perf_counter()
+    features = panel_features(panel)
+    elapsed = time.perf_counter() - start
+    mismatches = panel_mismatches(panel, features)
+    failed |= bool(mismatches)
+    print("panel_features: %d symbols x %d bars in %.2fs, %s" % (
+        len(panel.symbols), len(panel.times), elapsed, "matches FeatureEngine" if not mismatches else "MISMATCH"))
+    for name, (symbol, when, value, expected) in mismatches.items():
+        print("  %-20s %s %s: panel %r, engine %r" % (name, symbol, when, value, expected))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,8 @@
+# conftest.py
+# The tests import the bot's packages (exchanges, features, ...) the way its programs do: with src as the import root.
+# Run from the src directory: python -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,164 @@
+# kucoin_fake_exchange.py
+# Local stand-in for the Kucoin spot order endpoints, to exercise OrderGateway (or anything else built on
+# KucoinRestClient) without the exchange: start() it and point the client's base_url at the URL it returns.
+#
+# Orders live in memory. Market orders fill at once; limit orders rest until fill() or a cancel. Every state change
+# is passed to on_event as the data of a /spotMarket/tradeOrders event, the way the private channel would push it.
+# The spot pool's weight limit is enforced per fixed window with the endpoint weights of kucoin_orders.py, answering
+# 429 with a gw-ratelimit-reset header like the exchange. Request signatures are not checked.
+
+import asyncio
+import itertools
+import time
+
+from aiohttp import web
+
+from exchanges.kucoin_orders import WEIGHTS
+
+
+class FakeExchange:
+    """
+    In-memory spot order endpoints on an aiohttp server. weight_limit per window seconds is the rate limit; latency
+    seconds are added to every response. requests counts the requests served per endpoint (429s included).
+    """
+
+    def __init__(self, weight_limit=4000, window=30.0, latency=0.0, on_event=None):
+        self.weight_limit = weight_limit
+        self.window = window
+        self.latency = latency
+        self.on_event = on_event
+        self.orders = {}                        # orderId -> order as GET /api/v1/orders/{orderId} returns it
+        self.requests = {}
+        self.throttled = 0
+        self._ids = itertools.count(1)
+        self._window_start = time.monotonic()
+        self._window_weight = 0
+        self._runner = None
+
+    # ---- server ---------------------------------------------------------------------------------------------------
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start serving; returns the base URL."""
+        app = web.Application()
+        app.router.add_post("/api/v1/orders", self._create)
+        app.router.add_get("/api/v1/orders", self._list)
+        app.router.add_get("/api/v1/orders/{orderId}", self._get)
+        app.router.add_delete("/api/v1/orders/{orderId}", self._cancel)
+        app.router.add_get("/api/v1/order/client-order/{clientOid}", self._get_by_client_oid)
+        app.router.add_get("/api/v1/limit/orders", self._recent)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return "http://%s:%d" % (host, port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _respond(self, endpoint, handler):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        if now - self._window_start >= self.window:
+            self._window_start = now
+            self._window_weight = 0
+        weight = WEIGHTS[endpoint]
+        if self._window_weight + weight > self.weight_limit:
+            self.throttled += 1
+            reset = int((self._window_start + self.window - now) * 1000)
+            return web.json_response({"code": "429000", "msg": "Too Many Requests"}, status=429,
+                                     headers={"gw-ratelimit-reset": str(reset)})
+        self._window_weight += weight
+        code, data = handler()
+        if code != "200000":
+            return web.json_response({"code": code, "msg": data}, status=400)
+        return web.json_response({"code": code, "data": data})
+
+    # ---- order book side ------------------------------------------------------------------------------------------
+
+    def _event(self, order, kind, status):
+        if self.on_event is not None:
+            self.on_event({"symbol": order["symbol"], "orderType": order["type"], "side": order["side"],
+                           "orderId": order["id"], "clientOid": order["clientOid"], "type": kind, "status": status,
+                           "price": order["price"], "size": order["size"], "filledSize": order["dealSize"],
+                           "remainSize": str(float(order["size"] or 0) - float(order["dealSize"])),
+                           "ts": time.time_ns()})
+
+    def fill(self, order_id, size=None):
+        """Match size (all that remains by default) of a resting order."""
+        order = self.orders[order_id]
+        remaining = float(order["size"]) - float(order["dealSize"])
+        size = remaining if size is None else min(size, remaining)
+        order["dealSize"] = str(float(order["dealSize"]) + size)
+        done = float(order["dealSize"]) >= float(order["size"])
+        order["isActive"] = not done
+        self._event(order, "filled" if done else "match", "done" if done else "match")
+
+    # ---- endpoints ------------------------------------------------------------------------------------------------
+
+    async def _create(self, request):
+        body = await request.json()
+
+        def handler():
+            if body.get("side") not in ("buy", "sell") or body.get("type") not in ("limit", "market"):
+                return "400100", "invalid side or type"
+            if body["type"] == "limit" and not (body.get("price") and body.get("size")):
+                return "400100", "limit orders need price and size"
+            order_id = "%024x" % next(self._ids)
+            order = self.orders[order_id] = {
+                "id": order_id, "clientOid": body.get("clientOid"), "symbol": body.get("symbol"),
+                "side": body["side"], "type": body["type"], "price": body.get("price", "0"),
+                "size": body.get("size"), "funds": body.get("funds"), "dealSize": "0", "isActive": True,
+                "cancelExist": False, "createdAt": int(time.time() * 1000)}
+            self._event(order, "received", "new")
+            if body["type"] == "market":
+                order["size"] = order["size"] or "1"
+                self.fill(order_id)
+            else:
+                self._event(order, "open", "open")
+            return "200000", {"orderId": order_id}
+        return await self._respond("POST /api/v1/orders", handler)
+
+    async def _cancel(self, request):
+        order_id = request.match_info["orderId"]
+
+        def handler():
+            order = self.orders.get(order_id)
+            if order is None or not order["isActive"]:
+                return "400100", "order not found or not active"
+            order["isActive"] = False
+            order["cancelExist"] = True
+            self._event(order, "canceled", "done")
+            return "200000", {"cancelledOrderIds": [order_id]}
+        return await self._respond("DELETE /api/v1/orders/{orderId}", handler)
+
+    async def _get(self, request):
+        order = self.orders.get(request.match_info["orderId"])
+        return await self._respond("GET /api/v1/orders/{orderId}",
+                                   lambda: ("200000", order) if order else ("400100", "order not exist"))
+
+    async def _get_by_client_oid(self, request):
+        client_oid = request.match_info["clientOid"]
+        order = next((order for order in self.orders.values() if order["clientOid"] == client_oid), None)
+        return await self._respond("GET /api/v1/order/client-order/{clientOid}",
+                                   lambda: ("200000", order) if order else ("400100", "order not exist"))
+
+    async def _list(self, request):
+        active = request.query.get("status", "active") == "active"
+        page = int(request.query.get("currentPage", 1))
+        page_size = int(request.query.get("pageSize", 50))
+
+        def handler():
+            items = [order for order in self.orders.values() if order["isActive"] == active]
+            pages = max(1, -(-len(items) // page_size))
+            return "200000", {"currentPage": page, "pageSize": page_size, "totalNum": len(items),
+                              "totalPage": pages, "items": items[(page - 1) * page_size:page * page_size]}
+        return await self._respond("GET /api/v1/orders", handler)
+
+    async def _recent(self, request):
+        return await self._respond("GET /api/v1/limit/orders", lambda: (
+            "200000", [order for order in self.orders.values() if not order["isActive"]][-1000:]))
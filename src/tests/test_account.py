@@ -0,0 +1,111 @@
+import asyncio
+
+from exchanges.kucoin_account import AccountState
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RestClient:
+    """get_accounts / get_ticker answering from balances and prices; on_request runs while a request is out."""
+
+    def __init__(self, balances, prices=None, on_request=None):
+        self.balances = balances
+        self.prices = prices or {}
+        self.on_request = on_request
+        self.calls = []
+
+    def get_accounts(self, currency=None, account_type=None):
+        self.calls.append(('accounts', currency))
+        if self.on_request is not None:
+            self.on_request()
+        return [{'available': str(self.balances[currency])}]
+
+    async def get_accounts_async(self, currency=None, account_type=None):
+        await asyncio.sleep(0)
+        return self.get_accounts(currency, account_type)
+
+    def get_ticker(self, symbol):
+        self.calls.append(('ticker', symbol))
+        return {'price': str(self.prices[symbol])}
+
+    async def get_ticker_async(self, symbol):
+        await asyncio.sleep(0)
+        return self.get_ticker(symbol)
+
+
+def balance(currency, available, time=None, order_id=None):
+    data = {'currency': currency, 'available': str(available), 'accountType': 'trade'}
+    if time is not None:
+        data['time'] = str(time)
+    if order_id is not None:
+        data['relationContext'] = {'orderId': order_id}
+    return data
+
+
+def test_streamed_balances_expire_only_without_the_stream():
+    clock = Clock()
+    rest = RestClient({'USDT': 50})
+    account = AccountState(rest, balance_ttl=30, clock=clock)
+    account.on_balance(balance('USDT', 100))
+    clock.now = 60
+    assert account.balance('USDT') == 50 and len(rest.calls) == 1
+
+    account.on_balance_stream(True)
+    assert account.balance('USDT') == 50 and len(rest.calls) == 2     # cached before the stream: fetched again
+    account.on_balance(balance('USDT', 100))
+    clock.now = 1000
+    assert account.balance('USDT') == 100 and len(rest.calls) == 2
+
+    account.on_balance_stream(False)
+    assert account.balance('USDT') == 50 and len(rest.calls) == 3
+
+
+def test_rest_response_does_not_overwrite_a_newer_streamed_balance():
+    clock = Clock()
+    account = None
+
+    def streamed_meanwhile():
+        clock.now += 1
+        account.on_balance(balance('USDT', 70))
+
+    account = AccountState(RestClient({'USDT': 50}, on_request=streamed_meanwhile), clock=clock)
+    assert account.balance('USDT') == 70
+    assert account.balances['USDT'][0] == 70
+
+
+def test_out_of_order_balances_are_ignored():
+    account = AccountState(RestClient({}))
+    account.on_balance(balance('USDT', 70, time=2000))
+    account.on_balance(balance('USDT', 90, time=1000))
+    assert account.balance('USDT') == 70
+
+
+def test_stale_values_are_refreshed_in_the_background_on_an_event_loop():
+    clock = Clock()
+    rest = RestClient({'USDT': 50}, {'BTC-USDT': 20000})
+    account = AccountState(rest, clock=clock)
+    account.on_balance(balance('USDT', 100))
+    account.on_ticker('BTC-USDT', {'price': '19000'})
+    clock.now = 60
+
+    async def main():
+        assert account.balance('USDT') == 100 and account.price('BTC-USDT') == 19000
+        assert account.balance('USDT') == 100 and rest.calls == []      # one refresh each, already under way
+        await asyncio.gather(*account._refreshing.values())
+        assert account.balance('USDT') == 50 and account.price('BTC-USDT') == 20000
+        assert await account.available_async('USDT') == 50
+
+    asyncio.run(main())
+    assert sorted(rest.calls) == [('accounts', 'USDT'), ('ticker', 'BTC-USDT')]
+
+
+def test_allocate_async_fetches_a_missing_balance():
+    account = AccountState(RestClient({'USDT': 80}))
+    reservation = asyncio.run(account.allocate_async('USDT', 0.25))
+    assert reservation.amount == 20 and account.available('USDT') == 60
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from features.bars import CLOSE, BarBuffer, BarStore
+from features.engine import FeatureEngine
+
+
+def bars(n, start=0):
+    close = 100 + np.sin(np.arange(start, start + n) / 5.0) * 10
+    return pd.DataFrame({'time': np.arange(start, start + n) * 300.0, 'open': close, 'high': close + 1,
+                         'low': close - 1, 'close': close, 'volume': np.full(n, 5.0), 'symbol': 'BTC-USDT'})
+
+
+def fill(buffer, frame):
+    for row in frame[['time', 'open', 'high', 'low', 'close', 'volume']].values:
+        buffer.append(*row)
+
+
+def expected(frame):
+    engine = FeatureEngine('BTC-USDT')
+    for high, low, close, volume in frame[['high', 'low', 'close', 'volume']].values:
+        engine.update(high, low, close, volume)
+    return engine.features
+
+
+def same(features, others):
+    assert features.keys() == others.keys()
+    for name, value in features.items():
+        assert value == others[name] or (value != value and others[name] != others[name]), name
+    return True
+
+
+def test_window_is_a_view_of_the_latest_bars():
+    buffer = BarBuffer('BTC-USDT', capacity=4)
+    fill(buffer, bars(10))
+    window = buffer.window()
+    assert len(buffer) == 4 and buffer.appended == 10
+    assert np.array_equal(window[CLOSE], bars(10)['close'].values[-4:])
+    assert np.shares_memory(window, buffer._data)
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    pytest.importorskip('pyodbc')
+    from exchanges import kucoin_helpers
+    for name in ('KUCOIN_API_KEY', 'KUCOIN_API_SECRET', 'KUCOIN_API_PASSPHRASE'):
+        monkeypatch.setenv(name, 'test')
+    monkeypatch.setattr(kucoin_helpers, '_rest_client', None)
+    monkeypatch.setattr(kucoin_helpers, '_account_state', None)
+    return kucoin_helpers.KucoinTradingBot()
+
+
+def test_buffer_features_follow_a_window_shorter_than_the_history(bot):
+    history = bars(300)
+    bot.bars = BarStore(capacity=64)
+    buffer = bot.bars['BTC-USDT']
+    for end in (50, 51, 110, 170, 230):
+        fill(buffer, history.iloc[buffer.appended:end])
+        assert same(bot.update_features('BTC-USDT'), expected(history.iloc[:end]))
+    fill(buffer, history.iloc[230:300])                 # more bars than the buffer holds: starts over on them
+    assert same(bot.update_features('BTC-USDT'), expected(history.iloc[300 - 64:300]))
+
+
+def test_sliding_dataframe_window_is_refused(bot):
+    history = bars(150)
+    bot.get_features(history.iloc[:100])
+    assert same(bot.get_features(history.iloc[:120]), expected(history.iloc[:120]))
+    with pytest.raises(ValueError):
+        bot.get_features(history.iloc[30:150])
@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+import pytest
+
+from config import trading_variables as tv
+from features.engine import FeatureEngine
+from features.indicators import Range
+from features.panel import FLOAT_FEATURES, Panel, panel_features
+
+
+def panel_of(high, low, close, volume):
+    bars = len(close)
+    rows = [np.asarray(values, dtype=float)[None, :] for values in (close, high, low, close, volume)]
+    return Panel(['TEST'], np.arange(bars), *rows)
+
+
+def test_flat_prices_give_features_with_undefined_signal_strength():
+    engine = FeatureEngine('FLAT')
+    for _ in range(300):
+        features = engine.update(1.0, 1.0, 1.0, 100.0)
+    assert engine.bars == 300
+    assert features['macd'] == 0.0
+    assert math.isnan(features['signal_strength'])
+
+    panel = panel_features(panel_of([1.0] * 300, [1.0] * 300, [1.0] * 300, [100.0] * 300))
+    assert np.isnan(panel['signal_strength']).all()
+
+
+def test_signal_strength_once_macd_and_rsi_have_been_positive():
+    engine = FeatureEngine('UP')
+    for i in range(100):
+        price = 1.0 + i * 0.01
+        features = engine.update(price, price, price, 100.0)
+    assert 0 < features['signal_strength'] <= 1
+
+
+def test_range_matches_min_and_max_of_the_window():
+    rng = np.random.default_rng(3)
+    high = rng.random(200) + 1
+    low = high - rng.random(200)
+    window = Range(7)
+    for i in range(200):
+        window.update(high[i], low[i])
+        if i < 6:
+            assert math.isnan(window.low) and math.isnan(window.high)
+        else:
+            assert window.value == (low[i - 6:i + 1].min(), high[i - 6:i + 1].max())
+
+
+def test_support_and_resistance_exclude_the_current_bar():
+    period = tv['support_resistance_Period']
+    engine = FeatureEngine('BREAKOUT')
+    for _ in range(period):
+        features = engine.update(2.0, 1.0, 1.5, 100.0)
+    features = engine.update(3.0, 1.0, 2.5, 100.0)
+    assert (features['support'], features['resistance']) == (1.0, 2.0)
+    assert features['above_resistance']
+    features = engine.update(1.0, 0.5, 0.6, 100.0)
+    assert features['resistance'] == 3.0
+    assert features['below_support']
+
+
+def test_panel_matches_engine():
+    rng = np.random.default_rng(11)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 600)))
+    high = close * (1 + rng.random(600) * 0.005)
+    low = close * (1 - rng.random(600) * 0.005)
+    volume = rng.random(600) * 20000
+    panel = panel_features(panel_of(high, low, close, volume))[0]
+    engine = FeatureEngine('TEST')
+    for i in range(600):
+        features = engine.update(high[i], low[i], close[i], volume[i])
+        for name in FLOAT_FEATURES:
+            expected = math.nan if features[name] is None else features[name]
+            assert panel[name][i] == pytest.approx(expected, rel=1e-7, nan_ok=True), (name, i)
+        assert bool(panel['above_resistance'][i]) == features['above_resistance']
+        assert bool(panel['below_support'][i]) == features['below_support']
+
+
+def test_indicators_match_talib():
+    pytest.importorskip('talib')
+    from helpers.check_indicators import indicator_errors
+    rng = np.random.default_rng(5)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 1000)))
+    high = close * (1 + rng.random(1000) * 0.005)
+    low = close * (1 - rng.random(1000) * 0.005)
+    errors = indicator_errors(high, low, close, rng.random(1000) * 20000)
+    assert max(errors.values()) < 1e-9, errors
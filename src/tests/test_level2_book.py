@@ -0,0 +1,9 @@
+import pytest
+
+from exchanges.kucoin_level2_book import BID, BookSide, SideAnalytics
+
+
+def test_analytics_need_at_least_one_level():
+    with pytest.raises(ValueError):
+        SideAnalytics(BookSide(BID), levels=0)
+    assert SideAnalytics(BookSide(BID), levels=1).top_volume == 0
@@ -0,0 +1,25 @@
+from exchanges.kucoin_level2_book import InstrumentSpec
+from exchanges.kucoin_level2_capture import CaptureRecorder, CaptureReplayer
+from exchanges.kucoin_level2_client import SNAPSHOT
+
+
+def snapshot(sequence, bids, asks):
+    return {'code': '200000', 'data': {'sequence': str(sequence), 'bids': bids, 'asks': asks}}
+
+
+def test_reloaded_specs_are_replayed_with_their_snapshot(tmp_path):
+    path = str(tmp_path / 'capture.l2cap.gz')
+    recorder = CaptureRecorder(path, ['BTC-USDT'], flush_interval=0.01)
+    recorder.start()
+    recorder.reset({'BTC-USDT': InstrumentSpec('BTC-USDT', '0.01', '0.0001')})
+    recorder.snapshot(SNAPSHOT, 'BTC-USDT', snapshot(9, [['100.05', '1']], [['100.15', '0.5']]),
+                      InstrumentSpec('BTC-USDT', '0.05', '0.1'))
+    recorder.stop(5)
+
+    replayer = CaptureReplayer(path)
+    report = replayer.run()
+    assert report['snapshots'] == 1 and report['spec_reloads'] == 1 and not report['failure']
+    instrument = replayer.client.instruments['BTC-USDT']
+    assert (instrument.spec.price_increment, instrument.spec.size_increment) == ('0.05', '0.1')
+    assert report['books']['BTC-USDT']['sequence'] == 9
+    assert instrument.book.best_ask() == (10015, 5)                     # 2 price and 1 size decimals
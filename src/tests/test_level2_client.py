@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from exchanges import kucoin_level2_client
+from exchanges.kucoin_level2_client import SNAPSHOT, SNAPSHOT_FAILED, Level2Client, SnapshotLoad
+
+
+def test_failed_snapshot_drops_the_buffer_and_is_retried(monkeypatch):
+    monkeypatch.setattr(kucoin_level2_client, 'SNAPSHOT_RETRY_DELAY', 0.01)
+    calls = []
+
+    async def get_snapshot(symbol):
+        calls.append(symbol)
+        if len(calls) < 3:
+            raise ConnectionError("down")
+        return {"data": {"sequence": "1", "bids": [], "asks": []}}
+
+    async def main():
+        client = Level2Client(['BTC-USDT'], None, get_snapshot)
+        client._loop = asyncio.get_running_loop()
+        client._failed = asyncio.Event()
+        client.start_worker()
+        client.worker.stop(None)                        # items stay in the queue for the test to look at
+        instrument = client.instruments['BTC-USDT']
+        instrument.pending = ['update']
+        instrument.snapshot_requested = True
+        client._start_snapshot_task('BTC-USDT')
+        items = []
+        while not any(item.kind == SNAPSHOT for item in items):
+            await asyncio.sleep(0.01)
+            items += [item for item in client.queue.drain(10) if type(item) is SnapshotLoad]
+        assert [item.kind for item in items] == [SNAPSHOT_FAILED, SNAPSHOT_FAILED, SNAPSHOT]
+        assert client._snapshot_failures == {}
+        client._apply(items[0])
+        assert instrument.pending == [] and instrument.snapshot_requested
+        return client
+
+    client = asyncio.run(main())
+    assert len(calls) == 3 and not client._snapshot_tasks
+
+
+def test_start_worker_refuses_while_the_old_worker_runs():
+    client = Level2Client(['BTC-USDT'], None, None)
+    client.start_worker()
+    try:
+        with pytest.raises(RuntimeError):
+            client.start_worker()
+    finally:
+        client.worker.stop(None)
+    client.start_worker()
+    client.worker.stop(None)
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from exchanges.kucoin_level2_rest import LEVEL2_PATH, Level2SnapshotLoader
+from exchanges.kucoin_rest import KucoinCredentials, KucoinRestClient
+
+
+class SnapshotServer:
+    """
+    Stub level2 snapshot endpoint. responses maps a symbol to the statuses its successive requests get (429: rate
+    limited for reset seconds, 500: an error code), then canned snapshots; every request is delayed by latency.
+    """
+
+    def __init__(self, responses=None, latency=0.0, reset=0.2):
+        self.responses = {symbol: list(statuses) for symbol, statuses in (responses or {}).items()}
+        self.latency = latency
+        self.reset = reset
+        self.times = []                         # (symbol, time, status) of every request, in arrival order
+        self.active = 0
+        self.max_active = 0
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get(LEVEL2_PATH, self._snapshot)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', 0).start()
+        return "http://%s:%d" % self._runner.addresses[0][:2]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _snapshot(self, request):
+        symbol = request.query['symbol']
+        statuses = self.responses.get(symbol)
+        status = statuses.pop(0) if statuses else 200
+        self.times.append((symbol, time.monotonic(), status))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+        if status == 429:
+            return web.json_response({'code': '429000', 'msg': 'Too Many Requests'}, status=429,
+                                     headers={'gw-ratelimit-reset': str(int(self.reset * 1000))})
+        if status != 200:
+            return web.json_response({'code': '500000', 'msg': 'Internal Server Error'})
+        return web.json_response({'code': '200000', 'data': {'sequence': '1', 'time': 0,
+                                                             'bids': [['100', '1']], 'asks': [['101', '1']]}})
+
+
+def run(test, server, **loader):
+    async def main():
+        client = KucoinRestClient(KucoinCredentials('key', 'secret', 'passphrase'), base_url=await server.start())
+        try:
+            return await test(Level2SnapshotLoader(client, **loader))
+        finally:
+            await client.close_async()
+            await server.stop()
+    return asyncio.run(main())
+
+
+def load(symbols):
+    async def test(loader):
+        return [symbol async for symbol, response in loader.snapshots(symbols)], loader
+    return test
+
+
+def test_snapshots_are_paced_by_the_weight_limit():
+    server = SnapshotServer()
+    symbols = ['S%d' % i for i in range(8)]
+    loaded, loader = run(load(symbols), server, weight_per_second=30, weight_burst=6)      # 2 at once, then 10/s
+    assert sorted(loaded) == symbols and loader.loaded == 8
+    times = [when for _, when, _ in server.times]
+    assert times[-1] - times[0] >= 0.5
+
+
+def test_rate_limited_requests_pause_the_bucket():
+    server = SnapshotServer({'A': [429]}, reset=0.2)
+    loaded, loader = run(load(['A', 'B', 'C']), server, max_concurrent=1)
+    assert sorted(loaded) == ['A', 'B', 'C'] and loader.throttled == 1
+    statuses = [status for _, _, status in server.times]
+    throttled_at = server.times[statuses.index(429)][1]
+    after = server.times[statuses.index(429) + 1:]
+    assert len(after) >= 1 and all(when - throttled_at >= 0.18 for _, when, _ in after)
+
+
+def test_failed_requests_are_retried_with_backoff():
+    server = SnapshotServer({'A': [500, 500, 500]})
+    loaded, loader = run(load(['A']), server, retry_delay=0.05, max_retry_delay=0.1)
+    assert loaded == ['A'] and loader.failed == 3 and loader.loaded == 1
+    times = [when for _, when, _ in server.times]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert gaps[0] >= 0.045 and gaps[1] >= 0.095 and gaps[2] >= 0.095     # 0.05, then doubled up to the cap
+
+
+def test_concurrent_snapshot_requests_are_capped():
+    server = SnapshotServer(latency=0.05)
+    symbols = ['S%d' % i for i in range(10)]
+    loaded, loader = run(load(symbols), server, max_concurrent=3)
+    assert sorted(loaded) == symbols and server.max_active == 3
@@ -0,0 +1,40 @@
+import math
+import uuid
+
+import pytest
+
+from exchanges.kucoin_level2_book import OrderBook
+from exchanges.kucoin_level2_shm import TopOfBookPublisher, TopOfBookReader, TopOfBookSegment
+
+
+@pytest.fixture
+def segment():
+    segment = TopOfBookSegment.create('l2test-' + uuid.uuid4().hex[:8], ['BTC-USDT'], depth=5)
+    yield segment
+    segment.close()
+    segment.unlink()
+
+
+def book(bids, asks, tracked=True):
+    book = OrderBook.from_snapshot('BTC-USDT', {'sequence': '7', 'bids': bids, 'asks': asks})
+    return book.track(5, 25) if tracked else book
+
+
+def test_analytics_are_read_while_a_side_is_empty(segment):
+    publisher = TopOfBookPublisher(segment)
+    reader = TopOfBookReader(segment)
+    assert reader.read('BTC-USDT') is None
+
+    publisher.publish(book([['100', '2'], ['99', '1']], []))
+    top = reader.read('BTC-USDT')
+    assert top['sequence'] == 7 and top['bids'] == [[100, 2], [99, 1]] and top['asks'] == []
+    assert math.isnan(top['analytics']['mid']) and top['analytics']['bid_depth'] == 3
+
+    publisher.publish(book([['100', '2']], [['101', '1']]))
+    assert reader.read('BTC-USDT')['analytics']['mid'] == 100.5
+
+
+def test_untracked_books_publish_no_analytics(segment):
+    TopOfBookPublisher(segment).publish(book([['100', '2']], [['101', '1']], tracked=False))
+    top = TopOfBookReader(segment).read('BTC-USDT')
+    assert top['analytics'] is None and top['asks'] == [[101, 1]]
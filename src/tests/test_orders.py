@@ -0,0 +1,108 @@
+import asyncio
+import gc
+
+import pytest
+
+from exchanges.kucoin_account import AccountState
+from exchanges.kucoin_orders import DONE, FAILED, OPEN, OrderGateway
+from exchanges.kucoin_rest import KucoinApiError, KucoinCredentials, KucoinRestClient
+from kucoin_fake_exchange import FakeExchange
+
+
+def run(test, **exchange):
+    """Run test(gateway, exchange) against a FakeExchange whose order events go to the gateway."""
+    async def main():
+        gateway = None
+        fake = FakeExchange(on_event=lambda data: gateway.on_order_event(data), **exchange)
+        client = KucoinRestClient(KucoinCredentials('key', 'secret', 'passphrase'), base_url=await fake.start())
+        gateway = OrderGateway(client, weight_per_second=1000, weight_burst=1000)
+        try:
+            return await test(gateway, fake)
+        finally:
+            await client.close_async()
+            await fake.stop()
+    return asyncio.run(main())
+
+
+def test_place_acknowledges_and_events_finish_the_order():
+    async def test(gateway, fake):
+        order = await gateway.place('BTC-USDT', 'buy', 'limit', size=0.01, price=100)
+        assert order.status == OPEN and order.order_id in fake.orders
+        assert gateway.open_orders('BTC-USDT') == [order]
+        fake.fill(order.order_id, 0.004)
+        assert order.status == OPEN and order.filled_size == pytest.approx(0.004)
+        fake.fill(order.order_id)
+        assert order.status == DONE and order.filled_size == pytest.approx(0.01)
+        assert gateway.open_orders() == [] and order.client_oid in gateway.done
+    run(test)
+
+
+def test_rejected_order_fails():
+    async def test(gateway, fake):
+        with pytest.raises(KucoinApiError):
+            await gateway.place('BTC-USDT', 'buy', 'limit', size=1)          # no price
+        (order,) = gateway.done.values()
+        assert order.status == FAILED and gateway.orders == {}
+    run(test)
+
+
+def test_unexpected_error_fails_the_order():
+    async def test(gateway, fake):
+        async def broken(*args, **kwargs):
+            raise RuntimeError("bug")
+        gateway.client.request_async = broken
+        with pytest.raises(RuntimeError):
+            await gateway.place('BTC-USDT', 'buy', 'market', size=1)
+        (order,) = gateway.done.values()
+        assert order.status == FAILED and gateway.in_flight() == []
+    run(test)
+
+
+def test_late_updates_leave_finished_orders_finished():
+    async def test(gateway, fake):
+        order = await gateway.place('BTC-USDT', 'buy', 'limit', size=2, price=100)
+        fake.fill(order.order_id)
+        assert order.status == DONE
+        gateway.on_order_event({'orderId': order.order_id, 'clientOid': order.client_oid, 'type': 'match',
+                                'status': 'match', 'filledSize': '1'})
+        gateway._apply(dict(fake.orders[order.order_id], isActive=True, dealSize='1'))
+        assert order.status == DONE and order.filled_size == 2
+        assert gateway.open_orders() == []
+    run(test)
+
+
+def test_rate_limited_orders_are_retried():
+    async def test(gateway, fake):
+        orders = await gateway.place_many([('BTC-USDT', 'buy', 'limit', 0.01, 100 + i) for i in range(20)])
+        assert all(order.status == OPEN for order in orders)
+        assert fake.throttled > 0 and gateway.throttled == fake.throttled
+    run(test, weight_limit=20, window=0.5)
+
+
+def test_get_orders_reads_the_order_lists_in_bulk():
+    async def test(gateway, fake):
+        orders = await gateway.place_many([('BTC-USDT', 'buy', 'limit', 1, 100 + i) for i in range(10)])
+        fake.fill(orders[0].order_id)
+        fake.requests.clear()
+        found = await gateway.get_orders([order.order_id for order in orders])
+        assert sorted(found) == sorted(order.order_id for order in orders)
+        assert fake.requests == {'GET /api/v1/orders': 1, 'GET /api/v1/limit/orders': 1}
+    run(test)
+
+
+def test_placement_tasks_are_kept_until_done(monkeypatch):
+    pytest.importorskip('pyodbc')
+    from exchanges import kucoin_helpers
+
+    async def test(gateway, fake):
+        monkeypatch.setattr(kucoin_helpers, '_order_gateway', gateway)
+        monkeypatch.setattr(kucoin_helpers, '_account_state', AccountState(gateway.client))
+        monkeypatch.setattr(kucoin_helpers.db, 'save_trade', lambda *args: None, raising=False)
+        async def reserve():
+            return kucoin_helpers.get_account_state().reserve('USDT', 10), 1
+        kucoin_helpers._place_order(reserve, 'BTC-USDT', 'buy', 'market', 100)    # result dropped
+        gc.collect()
+        assert len(kucoin_helpers._order_tasks) == 1
+        await asyncio.gather(*kucoin_helpers._order_tasks)
+        assert not kucoin_helpers._order_tasks and len(fake.orders) == 1
+    run(test)